@@ -0,0 +1,54 @@
+"""
+Benchmark generazione claims - throughput per email singola (senza cache) e bulk
+
+Uso:
+    uv run python benchmarks/bench_claims_generation.py [--iterations N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from claims_generator import clear_claims_cache, generate_claims_bulk, generate_claims_from_email  # noqa: E402
+
+
+def _single(emails):
+    """Percorso per email singola, a cache vuota (ogni email è nuova come in una popolazione sintetica)"""
+    clear_claims_cache()
+    return [generate_claims_from_email(email) for email in emails]
+
+
+def _bulk(emails):
+    return list(generate_claims_bulk(emails))
+
+
+def _rate(fn, emails) -> float:
+    """Esegue fn sulle email e restituisce le email/sec"""
+    start = time.perf_counter()
+    fn(emails)
+    return len(emails) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generazione claims singola vs bulk")
+    parser.add_argument("--iterations", type=int, default=100000, help="Numero di email da generare")
+    args = parser.parse_args()
+
+    emails = [f"load.user{i}@tenant{i % 50}.example.com" for i in range(args.iterations)]
+
+    # I due percorsi devono produrre claims identici byte per byte
+    sample = emails[:1000]
+    assert [json.dumps(c) for c in _single(sample)] == [json.dumps(c) for c in _bulk(sample)]
+
+    print(f"{'Percorso':<10} {'email/s':>12}")
+    print(f"{'single':<10} {_rate(_single, emails):>12.0f}")
+    print(f"{'bulk':<10} {_rate(_bulk, emails):>12.0f}")
+    clear_claims_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark algoritmi di firma - throughput di firma e verifica per RS256, PS256, ES256 ed EdDSA
+
+Uso:
+    uv run python benchmarks/bench_signing_algorithms.py [--iterations N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from claims_generator import generate_claims_from_email  # noqa: E402
+from jwks_service import JWKSService  # noqa: E402
+from signing_algorithms import SUPPORTED_ALGORITHMS  # noqa: E402
+from token_service import TokenService  # noqa: E402
+
+
+def _rate(fn, iterations: int) -> float:
+    """Esegue fn per il numero di iterazioni e restituisce le operazioni/sec"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def _bench_algorithm(algorithm: str, user_claims: dict, iterations: int):
+    """Misura firma e verifica per un singolo algoritmo"""
+    service = TokenService()
+    service.jwks_service = JWKSService(algorithm=algorithm)
+    token = service.generate_access_token(user_claims, "openid", issuer="http://localhost:8080")
+
+    sign_rate = _rate(
+        lambda: service.generate_access_token(user_claims, "openid", issuer="http://localhost:8080"), iterations
+    )
+    verify_rate = _rate(lambda: service.decode_token(token), iterations)
+    print(f"{algorithm:<10} {sign_rate:>12.1f} {verify_rate:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark firma/verifica per algoritmo")
+    parser.add_argument("--iterations", type=int, default=2000, help="Numero di operazioni per misura")
+    args = parser.parse_args()
+
+    user_claims = generate_claims_from_email("bench.user@example.com")
+
+    print(f"{'Algoritmo':<10} {'firma/s':>12} {'verifica/s':>12}")
+    for algorithm in SUPPORTED_ALGORITHMS:
+        _bench_algorithm(algorithm, user_claims, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
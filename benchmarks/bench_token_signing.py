@@ -0,0 +1,67 @@
+"""
+Benchmark firma token - confronta il percorso PEM (legacy) con la chiave pre-caricata
+
+Uso:
+    uv run python benchmarks/bench_token_signing.py [--iterations N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from jose import jwt  # noqa: E402
+
+from claims_generator import generate_claims_from_email  # noqa: E402
+from token_service import TokenService  # noqa: E402
+
+
+def _legacy_sign(service: TokenService, claims: dict) -> str:
+    """Firma come prima dell'ottimizzazione: serializza e ri-parsa la chiave PEM ad ogni token"""
+    return jwt.encode(
+        claims,
+        service.jwks_service.get_private_key_pem(),
+        algorithm="RS256",
+        headers={"kid": service.jwks_service.get_kid()},
+    )
+
+
+def _run(label: str, fn, iterations: int) -> float:
+    """Esegue fn per il numero di iterazioni e stampa i token/sec"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    rate = iterations / elapsed
+    print(f"{label:<24} {iterations:>8} token in {elapsed:7.3f}s  ->  {rate:10.1f} token/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark firma token RS256")
+    parser.add_argument("--iterations", type=int, default=2000, help="Numero di token da firmare per percorso")
+    args = parser.parse_args()
+
+    service = TokenService()
+    user_claims = generate_claims_from_email("bench.user@example.com")
+    claims = {"sub": user_claims["sub"], "aud": "api://default", "scope": "openid"}
+
+    # Warm-up
+    _legacy_sign(service, claims)
+    service._sign(claims)
+
+    before = _run("PEM per token (legacy)", lambda: _legacy_sign(service, claims), args.iterations)
+    after = _run("Chiave pre-caricata", lambda: service._sign(claims), args.iterations)
+    _run(
+        "generate_access_token",
+        lambda: service.generate_access_token(user_claims, "openid", issuer="http://localhost:8080"),
+        args.iterations,
+    )
+
+    print(f"\nSpeedup firma: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
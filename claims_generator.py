@@ -1,23 +1,102 @@
 """
 Utilità per generare claims dinamici dall'email dell'utente
+
+I claim set generati sono memoizzati per email (LRU) e condivisi in sola lettura tra
+i login successivi dello stesso utente; la cache viene svuotata quando cambia
+DYNAMIC_CLAIMS_CONFIG.
 """
 
 import hashlib
 import uuid
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cache import LRUCache
+from config import on_config_reload, settings
+
+
+class FrozenClaims(dict):
+    """Claim set condiviso in sola lettura (resta un dict per la serializzazione JSON)"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Shared claim sets are read-only, copy them with dict(claims) before modifying")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        # Il pickle di default ricostruirebbe il dict tramite __setitem__
+        return (FrozenClaims, (dict(self),))
+
+
+# Claim set per email e tenant id per dominio
+_claims_cache = LRUCache(maxsize=settings.claims_cache_size)
+_tenant_cache = LRUCache(maxsize=settings.claims_cache_size)
+# Configurazione (ruoli, gruppi) con cui sono stati generati i claim set in cache
+_claims_config_key: Optional[Tuple] = None
+
+
+@on_config_reload
+def clear_claims_cache() -> None:
+    """Svuota le cache dei claims (es. dopo una modifica della configurazione)"""
+    _claims_cache.clear()
+    _tenant_cache.clear()
+
+
+def get_claims_cache_stats() -> dict:
+    """Restituisce le statistiche della cache dei claims"""
+    return _claims_cache.stats()
+
+
+def _tenant_id(domain: str) -> str:
+    """tid deterministico del dominio"""
+    return _uuid_from_hex(hashlib.sha256(domain.encode()).hexdigest())
+
+
+def _tenant_id_for_domain(domain: str) -> str:
+    """tid deterministico del dominio (memoizzato: gli utenti di un dominio condividono il tenant)"""
+    tid = _tenant_cache.get(domain)
+    if tid is None:
+        tid = _tenant_id(domain)
+        _tenant_cache.set(domain, tid)
+    return tid
 
 
 def generate_claims_from_email(email: str) -> dict:
     """
     Genera claims OIDC dinamicamente da una email.
 
+    Il risultato è memoizzato e condiviso tra le chiamate: è un dict in sola lettura.
+
     Args:
         email: Email dell'utente
 
     Returns:
         Dictionary con tutti i claims necessari
     """
+    global _claims_config_key
     from config import DYNAMIC_CLAIMS_CONFIG
 
+    roles = DYNAMIC_CLAIMS_CONFIG.get("default_roles", ["User"])
+    groups = DYNAMIC_CLAIMS_CONFIG.get("default_groups", ["default-group"])
+    config_key = (tuple(roles), tuple(groups))
+    if config_key != _claims_config_key:
+        _claims_cache.clear()
+        _claims_config_key = config_key
+
+    claims = _claims_cache.get(email)
+    if claims is None:
+        claims = FrozenClaims(_build_claims(email, roles, groups))
+        _claims_cache.set(email, claims)
+    return claims
+
+
+def _uuid_from_hex(hex_digest: str) -> str:
+    """Formatta i primi 32 caratteri esadecimali come UUID (equivale a str(uuid.UUID(...)) senza oggetti)"""
+    return f"{hex_digest[:8]}-{hex_digest[8:12]}-{hex_digest[12:16]}-{hex_digest[16:20]}-{hex_digest[20:32]}"
+
+
+def _parse_name(email: str) -> Tuple[str, str, str]:
+    """Ricava (given_name, family_name, name) dalla parte locale dell'email"""
     # Parsing dell'email per estrarre nome
     local_part = email.split("@")[0] if "@" in email else email
 
@@ -45,17 +124,28 @@ def generate_claims_from_email(email: str) -> dict:
     if not name or name == "User":
         name = email.split("@")[0].capitalize()
 
-    # Genera ID univoci ma deterministici dalla email (stesso email = stesso ID)
-    email_hash = hashlib.sha256(email.encode()).hexdigest()
+    return given_name, family_name, name
+
+
+def _build_claims(
+    email: str, roles: list, groups: list, tenant_id: Callable[[str], str] = _tenant_id_for_domain
+) -> dict:
+    """
+    Costruisce il claim set di un'email (senza cache)
+
+    Args:
+        tenant_id: Funzione dominio -> tid (la generazione bulk usa una tabella locale invece della cache LRU)
+    """
+    given_name, family_name, name = _parse_name(email)
 
-    # Usa i primi 32 caratteri dell'hash per creare un UUID deterministico
-    oid = str(uuid.UUID(email_hash[:32]))
+    # Genera ID univoci ma deterministici dalla email (stesso email = stesso ID)
+    # usando i primi 32 caratteri dell'hash come UUID
+    oid = _uuid_from_hex(hashlib.sha256(email.encode()).hexdigest())
     sub = oid  # sub e oid sono uguali in Azure AD
 
     # Genera anche tid deterministico dalla domain
     domain = email.split("@")[1] if "@" in email else "localhost"
-    domain_hash = hashlib.sha256(domain.encode()).hexdigest()
-    tid = str(uuid.UUID(domain_hash[:32]))
+    tid = tenant_id(domain)
 
     # Costruisci i claims
     claims = {
@@ -68,13 +158,59 @@ def generate_claims_from_email(email: str) -> dict:
         "email": email,
         "upn": email,
         "preferred_username": email,
-        "roles": DYNAMIC_CLAIMS_CONFIG.get("default_roles", ["User"]),
-        "groups": DYNAMIC_CLAIMS_CONFIG.get("default_groups", ["default-group"]),
+        "roles": roles,
+        "groups": groups,
     }
 
     return claims
 
 
+def generate_claims_bulk(emails: Iterable[str]) -> Iterator[dict]:
+    """
+    Genera i claims di molte email in sequenza (es. popolazioni sintetiche da milioni di utenti)
+
+    Produce claims identici a generate_claims_from_email ma senza passare dalla cache LRU
+    (che verrebbe solo riempita e svuotata): la configurazione viene letta una volta e i
+    tenant id sono calcolati una sola volta per dominio in una tabella locale.
+
+    Args:
+        emails: Email degli utenti (consumate in modo lazy)
+
+    Returns:
+        Iteratore di claim set, nell'ordine delle email
+    """
+    from config import DYNAMIC_CLAIMS_CONFIG
+
+    roles = DYNAMIC_CLAIMS_CONFIG.get("default_roles", ["User"])
+    groups = DYNAMIC_CLAIMS_CONFIG.get("default_groups", ["default-group"])
+    tenant_ids: Dict[str, str] = {}
+
+    def tenant_id(domain: str) -> str:
+        tid = tenant_ids.get(domain)
+        if tid is None:
+            tid = tenant_ids[domain] = _tenant_id(domain)
+        return tid
+
+    for email in emails:
+        yield _build_claims(email, roles, groups, tenant_id)
+
+
+def generate_claims_columns(emails: Iterable[str]) -> Dict[str, List]:
+    """
+    Genera i claims di molte email in formato colonnare (una lista per claim)
+
+    Returns:
+        Dict claim -> lista dei valori, allineate per indice con le email
+    """
+    columns: Dict[str, List] = {}
+    for claims in generate_claims_bulk(emails):
+        if not columns:
+            columns = {name: [] for name in claims}
+        for name, value in claims.items():
+            columns[name].append(value)
+    return columns
+
+
 def generate_deterministic_uuid(seed: str) -> str:
     """
     Genera un UUID deterministico da una stringa seed.
@@ -88,3 +224,17 @@ def generate_deterministic_uuid(seed: str) -> str:
     """
     hash_value = hashlib.sha256(seed.encode()).hexdigest()
     return str(uuid.UUID(hash_value[:32]))
+
+
+def generate_deterministic_uuids(seeds: Iterable[str]) -> List[str]:
+    """
+    Versione bulk di generate_deterministic_uuid
+
+    Args:
+        seeds: Stringhe da cui generare gli UUID
+
+    Returns:
+        Lista di UUID string, nell'ordine dei seed
+    """
+    sha256 = hashlib.sha256
+    return [_uuid_from_hex(sha256(seed.encode()).hexdigest()) for seed in seeds]
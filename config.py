@@ -1,4 +1,8 @@
-from typing import List
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Literal, Optional, Tuple
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -11,16 +15,135 @@ class Settings(BaseSettings):
         env_file=".env",
         env_file_encoding="utf-8",
         extra="ignore",  # Ignora campi extra (base_url e issuer sono calcolati dinamicamente)
+        frozen=True,  # Snapshot immutabili: un reload ne crea una nuova e la sostituisce (vedi reload_config)
     )
 
     # Server settings
     host: str = Field(default="0.0.0.0", description="Host del server")
     port: int = Field(default=8080, description="Porta del server")
+    workers: int = Field(
+        default=1, description="Numero di worker uvicorn (se > 1 richiede storage e chiave di firma condivisi)"
+    )
+
+    # Storage settings
+    storage_backend: str = Field(default="memory", description="Backend di storage: memory, sqlite o redis")
+    storage_sqlite_path: str = Field(default="mockoidc.db", description="File del database SQLite")
+    storage_redis_url: str = Field(default="redis://localhost:6379/0", description="URL del server Redis")
+    storage_key_prefix: str = Field(default="mockoidc:", description="Prefisso delle chiavi su Redis")
+    storage_timeout: float = Field(
+        default=1.0,
+        description="Secondi massimi di attesa dello storage (lock SQLite, risposta di Redis) prima di rispondere 503",
+    )
+    storage_sweep_interval: float = Field(
+        default=30.0, description="Intervallo in secondi tra due pulizie delle chiavi scadute"
+    )
 
     # Token settings
     access_token_expiry: int = Field(default=3600, description="Scadenza access token in secondi")
     id_token_expiry: int = Field(default=3600, description="Scadenza id token in secondi")
     authorization_code_expiry: int = Field(default=600, description="Scadenza authorization code in secondi")
+    refresh_token_expiry: int = Field(default=86400, description="Scadenza refresh token in secondi")
+    refresh_token_rotation: bool = Field(
+        default=False, description="Emette un nuovo refresh token ad ogni uso e rileva il riutilizzo"
+    )
+    refresh_token_max_per_user: int = Field(
+        default=0, description="Numero massimo di refresh token per utente/client (0 = illimitato)"
+    )
+
+    # Stateless mode: codes e refresh token self-contained (cifrati), nessuno storage condiviso necessario
+    stateless_tokens: bool = Field(default=False, description="Authorization code e refresh token self-contained")
+    stateless_token_key: Optional[str] = Field(
+        default=None, description="Segreto per cifrare i token stateless (default: derivato dalla chiave di firma)"
+    )
+
+    # Signing key settings
+    signing_algorithm: Literal["RS256", "PS256", "ES256", "EdDSA"] = Field(
+        default="RS256", description="Algoritmo di firma dei JWT"
+    )
+    signing_key_pem: Optional[str] = Field(
+        default=None, description="Chiave privata in formato PEM (RSA, EC P-256 o Ed25519, secondo l'algoritmo)"
+    )
+    signing_key_file: Optional[str] = Field(
+        default=None, description="File PEM della chiave privata (generato e salvato se assente)"
+    )
+
+    # Key rotation settings
+    key_rotation_interval: int = Field(
+        default=0, description="Secondi di utilizzo di una chiave prima della rotazione (0 = disabilitata)"
+    )
+    key_rotation_grace_period: int = Field(
+        default=300, description="Secondi in cui la nuova chiave è pubblicata nel JWKS prima di diventare attiva"
+    )
+    key_pool_size: int = Field(default=1, description="Numero di chiavi pre-generate per la rotazione")
+    key_pool_processes: int = Field(
+        default=1, description="Processi per la generazione delle chiavi del pool (0 = thread in background)"
+    )
+
+    # Crypto executor settings
+    crypto_executor_mode: Literal["inline", "thread", "process"] = Field(
+        default="thread", description="Dove eseguire firma e verifica dei JWT (inline, thread o process)"
+    )
+    crypto_executor_workers: int = Field(default=0, description="Worker del pool di firma (0 = numero di CPU)")
+    crypto_executor_max_pending: int = Field(
+        default=256, description="Operazioni in corso o in coda oltre le quali si risponde 503"
+    )
+
+    # Claims settings
+    claims_cache_size: int = Field(default=10000, description="Numero massimo di claim set memoizzati per email")
+
+    # Client credentials settings
+    client_credentials_cache: bool = Field(
+        default=False, description="Riusa i token client_credentials ancora validi invece di firmarne di nuovi"
+    )
+    client_credentials_cache_size: int = Field(default=1024, description="Numero massimo di token client in cache")
+    client_credentials_cache_min_ttl: int = Field(
+        default=60, description="Secondi di validità residua sotto i quali il token in cache viene riemesso"
+    )
+
+    # UserInfo settings
+    userinfo_cache: bool = Field(
+        default=True, description="Memorizza i claims dei token già verificati fino alla loro scadenza"
+    )
+    userinfo_cache_size: int = Field(default=10000, description="Numero massimo di token verificati in cache")
+
+    # Introspection settings
+    introspection_batch_max_size: int = Field(
+        default=1000, description="Numero massimo di token per richiesta di introspection batch"
+    )
+
+    # Mock users settings
+    mock_users_file: Optional[str] = Field(
+        default=None, description="File degli utenti pre-configurati (JSON, NDJSON, YAML o CSV)"
+    )
+    mock_users_json: Optional[str] = Field(default=None, description="Utenti pre-configurati come lista JSON")
+    mock_users_reload_interval: float = Field(
+        default=2.0, description="Secondi tra due controlli delle modifiche al file degli utenti"
+    )
+
+    # Password grant (solo per i test: token in una chiamata senza il redirect di /authorize)
+    password_grant_enabled: bool = Field(default=False, description="Abilita grant_type=password sul token endpoint")
+
+    # Admin API (solo per ambienti di test/load test)
+    admin_api_enabled: bool = Field(default=False, description="Abilita gli endpoint /admin (es. emissione massiva)")
+    token_batch_max_size: int = Field(default=100000, description="Numero massimo di utenti per richiesta batch")
+
+    # HTTP caching settings
+    jwks_cache_max_age: int = Field(default=300, description="Cache-Control max-age per /jwks in secondi")
+    discovery_cache_max_age: int = Field(
+        default=3600, description="Cache-Control max-age per il discovery document in secondi"
+    )
+    discovery_cache_size: int = Field(default=256, description="Numero massimo di discovery document in cache")
+    static_cache_max_age: int = Field(
+        default=86400, description="Cache-Control max-age per le risorse statiche (CSS del login) in secondi"
+    )
+
+    # Config reload settings
+    config_file: Optional[str] = Field(
+        default=None, description="File JSON/YAML con override dei settings, ricaricato quando cambia"
+    )
+    config_reload_interval: float = Field(
+        default=1.0, description="Secondi tra due controlli delle modifiche al file di configurazione"
+    )
 
     # Supported features
     supported_scopes: List[str] = Field(
@@ -31,7 +154,7 @@ class Settings(BaseSettings):
         description="Response types supportati",
     )
     supported_grant_types: List[str] = Field(
-        default=["authorization_code", "refresh_token"], description="Grant types supportati"
+        default=["authorization_code", "refresh_token", "client_credentials"], description="Grant types supportati"
     )
 
 
@@ -85,4 +208,165 @@ DYNAMIC_CLAIMS_CONFIG = {
 }
 
 
-settings = Settings()
+logger = logging.getLogger(__name__)
+
+# Valori di partenza (ripristinati quando il file di configurazione non li sovrascrive più)
+_DEFAULT_MOCK_USERS = MOCK_USERS
+_DEFAULT_DYNAMIC_CLAIMS_CONFIG = dict(DYNAMIC_CLAIMS_CONFIG)
+
+
+class SettingsProxy:
+    """
+    Accesso alla snapshot corrente dei settings
+
+    Tutti i moduli importano questa istanza e leggono gli attributi al momento dell'uso: un
+    reload sostituisce la snapshot con un'unica assegnazione, così ogni lettura vede la
+    configurazione vecchia o quella nuova, mai uno stato intermedio. Le assegnazioni (es.
+    monkeypatch nei test) creano una nuova snapshot invece di modificare quella condivisa.
+    """
+
+    __slots__ = ("_snapshot",)
+
+    def __init__(self, snapshot: Settings):
+        object.__setattr__(self, "_snapshot", snapshot)
+
+    def snapshot(self) -> Settings:
+        """Restituisce la snapshot corrente (immutabile)"""
+        return object.__getattribute__(self, "_snapshot")
+
+    def __getattribute__(self, name: str):
+        # Letto ad ogni accesso ai settings: __getattribute__ diretto evita il fallback di __getattr__
+        if name == "snapshot":
+            return object.__getattribute__(self, name)
+        return getattr(object.__getattribute__(self, "_snapshot"), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        object.__setattr__(self, "_snapshot", self.snapshot().model_copy(update={name: value}))
+
+
+def _read_config_file(path: str) -> Dict:
+    """
+    Legge il file di configurazione: chiavi dei settings, più dynamic_claims e mock_users
+
+    Raises:
+        ValueError: Se il contenuto non è valido
+        RuntimeError: Se il file è YAML e pyyaml non è installato
+    """
+    with open(path, encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError as e:
+                raise RuntimeError("Loading the config file from YAML requires the 'pyyaml' package") from e
+            data = yaml.safe_load(f) or {}
+        else:
+            data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("The config file must contain an object")
+    return data
+
+
+def _build_config(config_file: Optional[str]) -> Tuple[Settings, Dict, Optional[List[Dict]]]:
+    """Costruisce settings, DYNAMIC_CLAIMS_CONFIG e MOCK_USERS da ambiente, .env e file di configurazione"""
+    if not config_file:
+        return Settings(), dict(_DEFAULT_DYNAMIC_CLAIMS_CONFIG), _DEFAULT_MOCK_USERS
+
+    data = {name.lower(): value for name, value in _read_config_file(config_file).items()}
+    dynamic_claims = {**_DEFAULT_DYNAMIC_CLAIMS_CONFIG, **(data.pop("dynamic_claims", None) or {})}
+    mock_users = data.pop("mock_users", _DEFAULT_MOCK_USERS)
+    unknown = sorted(set(data) - set(Settings.model_fields))
+    if unknown:
+        logger.warning(f"Ignoring unknown settings in {config_file}: {', '.join(unknown)}")
+    # Il file ha la precedenza sulle variabili d'ambiente; config_file resta quello in uso
+    overrides = {name: value for name, value in data.items() if name in Settings.model_fields}
+    overrides["config_file"] = config_file
+    return Settings(**overrides), dynamic_claims, mock_users
+
+
+def file_version(path: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Data di modifica (ns) e dimensione del file, per rilevarne le modifiche"""
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size) if stat else None
+
+
+_reload_listeners: List[Callable[[], None]] = []
+_reload_lock = threading.Lock()
+_config_status = {"version": 1, "reloads": 0, "failures": 0, "file_version": None}
+
+
+def on_config_reload(callback: Callable[[], None]) -> Callable[[], None]:
+    """Registra una funzione chiamata dopo ogni cambio di configurazione (es. per svuotare una cache)"""
+    _reload_listeners.append(callback)
+    return callback
+
+
+def apply_config(snapshot: Settings, dynamic_claims: Dict, mock_users: Optional[List[Dict]]) -> None:
+    """Sostituisce atomicamente la configurazione corrente e notifica i moduli che ne dipendono"""
+    global DYNAMIC_CLAIMS_CONFIG, MOCK_USERS
+    DYNAMIC_CLAIMS_CONFIG = dynamic_claims
+    MOCK_USERS = mock_users
+    object.__setattr__(settings, "_snapshot", snapshot)
+    _config_status["version"] += 1
+
+    for callback in _reload_listeners:
+        try:
+            callback()
+        except Exception:
+            logger.exception(f"Config reload listener {callback.__name__} failed")
+
+
+def reload_config(force: bool = False) -> bool:
+    """
+    Ricarica la configurazione se il file CONFIG_FILE è cambiato (o sempre, con force)
+
+    Solo i settings letti per richiesta (scadenze, flag, claims, utenti, discovery...) cambiano
+    a caldo; quelli usati all'avvio (host/porta, chiave di firma, storage, dimensioni di pool
+    e cache) richiedono un riavvio. Un file non valido lascia in uso la configurazione corrente
+    e viene contato una sola volta tra i reload falliti.
+
+    Returns:
+        True se la configurazione è stata sostituita
+    """
+    with _reload_lock:
+        config_file = settings.config_file
+        version = file_version(config_file)
+        if not force and (not config_file or version == _config_status["file_version"]):
+            return False
+
+        try:
+            snapshot, dynamic_claims, mock_users = _build_config(config_file)
+        except Exception:
+            # Versione registrata anche per un file non valido: viene riletto solo dopo una nuova modifica
+            _config_status["file_version"] = version
+            _config_status["failures"] += 1
+            logger.exception(f"Failed to reload configuration from {config_file} - keeping the current one")
+            return False
+
+        _config_status["file_version"] = version
+        _config_status["reloads"] += 1
+        apply_config(snapshot, dynamic_claims, mock_users)
+        logger.info(f"Configuration reloaded (version {_config_status['version']})")
+        return True
+
+
+def get_config_status() -> Dict:
+    """Restituisce versione della configurazione corrente, reload riusciti e falliti"""
+    return {
+        "version": _config_status["version"],
+        "reloads": _config_status["reloads"],
+        "failures": _config_status["failures"],
+        "config_file": settings.config_file,
+    }
+
+
+def _initial_config() -> Tuple[Settings, Dict, Optional[List[Dict]]]:
+    config_file = Settings().config_file
+    _config_status["file_version"] = file_version(config_file)
+    return _build_config(config_file)
+
+
+_initial_settings, DYNAMIC_CLAIMS_CONFIG, MOCK_USERS = _initial_config()
+settings = SettingsProxy(_initial_settings)
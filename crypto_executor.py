@@ -0,0 +1,229 @@
+"""
+Crypto Executor - Firma e verifica dei JWT fuori dall'event loop asyncio
+
+Le operazioni RSA/ECDSA/EdDSA sono CPU-bound: eseguite direttamente negli endpoint async
+bloccherebbero l'event loop serializzando tutte le richieste concorrenti. Qui vengono
+eseguite in un pool di thread (cryptography rilascia il GIL durante le operazioni OpenSSL)
+o di processi, con concorrenza limitata e backpressure quando la coda è piena.
+"""
+
+import asyncio
+import bisect
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from jose import JWTError, jwk, jwt
+
+import signing_algorithms  # noqa: F401 - registra PS256 ed EdDSA anche nei processi worker
+from config import settings
+
+# Limiti superiori (ms) dei bucket degli istogrammi di latenza
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class ExecutorBusyError(Exception):
+    """Sollevata quando la coda del pool è piena e l'operazione viene rifiutata"""
+
+
+class LatencyHistogram:
+    """Istogramma cumulativo delle latenze (stile Prometheus)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        # Un contatore per bucket più l'overflow (+Inf)
+        self._counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Registra una latenza espressa in secondi"""
+        ms = seconds * 1000
+        self._counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def snapshot(self) -> Dict:
+        """Restituisce conteggi cumulativi per bucket, numero di osservazioni e somma in ms"""
+        cumulative = {}
+        total = 0
+        for bound, count in zip(self.buckets, self._counts):
+            total += count
+            cumulative[f"le_{bound}ms"] = total
+        cumulative["le_inf"] = self.count
+        return {"count": self.count, "sum_ms": round(self.sum_ms, 3), "buckets": cumulative}
+
+
+# Chiavi già costruite nel processo worker, indicizzate per (PEM, algoritmo)
+_worker_keys: Dict[Tuple[str, str], object] = {}
+
+
+def _get_worker_key(pem: str, algorithm: str):
+    key = _worker_keys.get((pem, algorithm))
+    if key is None:
+        key = jwk.construct(pem, algorithm)
+        _worker_keys[(pem, algorithm)] = key
+    return key
+
+
+def sign_claims(claims: Dict, private_key_pem: str, algorithm: str, kid: str) -> str:
+    """Firma i claims (eseguita nei processi worker, riceve il materiale della chiave esplicitamente)"""
+    return jwt.encode(claims, _get_worker_key(private_key_pem, algorithm), algorithm=algorithm, headers={"kid": kid})
+
+
+def sign_claims_batch(claims_list: List[Dict], private_key_pem: str, algorithm: str, kid: str) -> List[str]:
+    """Firma una lista di claim set in un solo job (ammortizza il costo del passaggio al worker)"""
+    key = _get_worker_key(private_key_pem, algorithm)
+    return [jwt.encode(claims, key, algorithm=algorithm, headers={"kid": kid}) for claims in claims_list]
+
+
+def verify_token(token: str, public_key_pem: str, algorithm: str, options: Dict) -> Dict:
+    """
+    Verifica un JWT (eseguita nei processi worker)
+
+    Raises:
+        ValueError: Se il token non è valido
+    """
+    try:
+        return jwt.decode(token, _get_worker_key(public_key_pem, algorithm), algorithms=[algorithm], options=options)
+    except JWTError as e:
+        raise ValueError(f"Invalid token: {str(e)}") from e
+
+
+class _Reservation:
+    """Posti della coda riservati da CryptoExecutor.reserve e non ancora usati"""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+
+
+# Prenotazione attiva nel contesto corrente (condivisa con i task figli, es. quelli di asyncio.gather)
+_reservation: ContextVar[Optional[_Reservation]] = ContextVar("crypto_reservation", default=None)
+
+
+class CryptoExecutor:
+    """Pool con concorrenza limitata per le operazioni crittografiche degli endpoint async"""
+
+    def __init__(self, mode: str = "thread", max_workers: int = 0, max_pending: int = 256):
+        """
+        Args:
+            mode: "inline" (nell'event loop), "thread" o "process"
+            max_workers: Numero di worker (0 = numero di CPU)
+            max_pending: Operazioni in corso o in coda oltre le quali le nuove vengono rifiutate
+        """
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected_count = 0
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="crypto")
+        return self._executor
+
+    def _observe(self, operation: str, seconds: float) -> None:
+        histogram = self.histograms.get(operation)
+        if histogram is None:
+            histogram = self.histograms[operation] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    async def run(self, operation: str, func: Callable, *args):
+        """
+        Esegue func(*args) nel pool e ne attende il risultato senza bloccare l'event loop
+
+        In modalità "process" func e argomenti devono essere serializzabili con pickle.
+
+        Args:
+            operation: Nome dell'operazione per l'istogramma di latenza (es. "sign", "verify")
+
+        Raises:
+            ExecutorBusyError: Se ci sono già max_pending operazioni in corso o in coda
+        """
+        start = time.perf_counter()
+        if self.mode == "inline":
+            try:
+                return func(*args)
+            finally:
+                self._observe(operation, time.perf_counter() - start)
+
+        reservation = _reservation.get()
+        if reservation is not None and reservation.slots > 0:
+            # Posto già conteggiato in pending dalla prenotazione
+            reservation.slots -= 1
+        elif self.pending >= self.max_pending:
+            self.rejected_count += 1
+            raise ExecutorBusyError(f"Crypto executor queue full ({self.max_pending} pending)")
+        else:
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+            # Latenza completa (attesa in coda inclusa), quella vista dalla richiesta
+            self._observe(operation, time.perf_counter() - start)
+
+    @contextmanager
+    def reserve(self, slots: int) -> Iterator[None]:
+        """
+        Riserva posti nella coda prima di un passaggio non ripetibile (es. consumo di un authorization code)
+
+        Le chiamate a run() nel blocco, anche da task figli, usano i posti riservati invece di poter
+        essere rifiutate: con il pool saturo la richiesta viene rifiutata prima di consumare alcunché.
+        I posti non usati vengono rilasciati all'uscita dal blocco.
+
+        Raises:
+            ExecutorBusyError: Se non ci sono abbastanza posti liberi
+        """
+        if self.mode == "inline":
+            yield
+            return
+
+        if self.pending + slots > self.max_pending:
+            self.rejected_count += 1
+            raise ExecutorBusyError(f"Crypto executor queue full ({self.max_pending} pending)")
+
+        reservation = _Reservation(slots)
+        self.pending += slots
+        token = _reservation.set(reservation)
+        try:
+            yield
+        finally:
+            _reservation.reset(token)
+            self.pending -= reservation.slots
+
+    def stats(self) -> Dict:
+        """Restituisce configurazione, operazioni in corso, rifiuti e istogrammi di latenza"""
+        latency: Dict[str, Dict] = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+        return {
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "rejected": self.rejected_count,
+            "latency": latency,
+        }
+
+    def shutdown(self) -> None:
+        """Ferma il pool (i worker vengono ricreati al prossimo utilizzo)"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+# Istanza globale del servizio
+crypto_executor = CryptoExecutor(
+    mode=settings.crypto_executor_mode,
+    max_workers=settings.crypto_executor_workers,
+    max_pending=settings.crypto_executor_max_pending,
+)
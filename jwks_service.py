@@ -1,29 +1,54 @@
 import base64
-from typing import Tuple
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk
+from jose.backends.base import Key
 
+from config import settings
+from signing_algorithms import (
+    check_private_key,
+    generate_private_key,
+    generate_private_key_der,
+    jwk_thumbprint,
+    public_jwk_params,
+)
 
-class JWKSService:
-    """Servizio per la gestione delle chiavi RSA e JWKS"""
+logger = logging.getLogger(__name__)
 
-    def __init__(self):
-        self.private_key = None
-        self.public_key = None
-        self.kid = "mock-oidc-key-1"
-        self._generate_keys()
 
-    def _generate_keys(self):
-        """Genera una coppia di chiavi RSA"""
-        # Genera chiave privata RSA
-        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+class SigningKey:
+    """Chiave di firma pubblicata nel JWKS, con il materiale derivato pre-calcolato"""
 
-        # Estrai la chiave pubblica
-        self.public_key = self.private_key.public_key()
+    def __init__(self, private_key, algorithm: str):
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.kid = jwk_thumbprint(self.public_key)
+        pem = self.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.public_key_pem = pem.decode("utf-8")
+        self.verification_key = jwk.construct(self.public_key_pem, algorithm)
 
-    def get_private_key_pem(self) -> str:
+        params = public_jwk_params(self.public_key)
+        self.jwk = {"kty": params.pop("kty"), "use": "sig", "kid": self.kid, "alg": algorithm, **params}
+
+        # Ciclo di vita: pubblicata -> attiva (firma i token) -> ritirata (solo verifica) -> rimossa
+        self.published_at = time.time()
+        self.activated_at: Optional[float] = None
+        self.retire_at: Optional[float] = None
+
+    def private_key_pem(self) -> str:
         """Restituisce la chiave privata in formato PEM"""
         pem = self.private_key.private_bytes(
             encoding=serialization.Encoding.PEM,
@@ -32,15 +57,311 @@ class JWKSService:
         )
         return pem.decode("utf-8")
 
-    def get_public_key_pem(self) -> str:
-        """Restituisce la chiave pubblica in formato PEM"""
-        pem = self.public_key.public_bytes(
-            encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+
+class KeyPool:
+    """
+    Pool di chiavi private pre-generate in background, così la generazione non avviene mai sul percorso delle richieste
+
+    Le chiavi vengono generate in un ProcessPoolExecutor (la generazione RSA è CPU-bound e
+    bloccherebbe il GIL) e deserializzate nel processo principale al completamento.
+    """
+
+    def __init__(self, algorithm: str, size: int = 0, processes: int = 1):
+        """
+        Args:
+            algorithm: Algoritmo di firma delle chiavi da generare
+            size: Numero di chiavi da tenere pronte (0 = pool disabilitato)
+            processes: Processi dedicati alla generazione (0 = un thread in background)
+        """
+        self.algorithm = algorithm
+        self.size = size
+        self.processes = processes
+        self._keys: deque = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._executor: Optional[Executor] = None
+        self._in_flight: Set[Future] = set()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes > 0:
+                # spawn: il fork di un processo con thread e event loop attivi non è sicuro
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="key-pool")
+        return self._executor
+
+    def fill(self):
+        """Avvia in background la generazione delle chiavi mancanti per riempire il pool"""
+        if self.size <= 0:
+            return
+        with self._lock:
+            missing = self.size - len(self._keys) - len(self._in_flight)
+            futures = [self._get_executor().submit(generate_private_key_der, self.algorithm) for _ in range(missing)]
+            self._in_flight.update(futures)
+        # Fuori dal lock: la callback viene eseguita subito se la generazione è già terminata
+        for future in futures:
+            future.add_done_callback(self._on_generated)
+
+    def _on_generated(self, future: Future):
+        private_key = None
+        if not future.cancelled():
+            try:
+                der = future.result()
+                private_key = serialization.load_der_private_key(der, password=None, backend=default_backend())
+            except Exception as e:
+                logger.error(f"Key pool generation failed: {str(e)}")
+        with self._ready:
+            if private_key is not None:
+                self._keys.append(private_key)
+            self._in_flight.discard(future)
+            self._ready.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Attende il completamento delle generazioni in corso; restituisce False allo scadere del timeout"""
+        with self._ready:
+            return self._ready.wait_for(lambda: not self._in_flight, timeout=timeout)
+
+    def take(self):
+        """Preleva una chiave pronta (generandola al momento solo se il pool è vuoto) e riavvia il riempimento"""
+        try:
+            private_key = self._keys.popleft()
+        except IndexError:
+            logger.warning("Key pool empty - generating signing key synchronously")
+            private_key = generate_private_key(self.algorithm)
+        self.fill()
+        return private_key
+
+    def shutdown(self):
+        """Ferma i processi di generazione senza attendere le chiavi in corso"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pending = list(self._in_flight)
+        # Fuori dal lock: la cancellazione invoca subito le callback
+        for future in pending:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class JWKSService:
+    """Servizio per la gestione delle chiavi di firma e JWKS"""
+
+    def __init__(
+        self,
+        private_key_pem: Optional[str] = None,
+        key_file: Optional[str] = None,
+        algorithm: str = "RS256",
+        key_pool_size: int = 0,
+        key_pool_processes: int = 1,
+    ):
+        """
+        Inizializza il servizio caricando o generando la chiave di firma
+
+        Args:
+            private_key_pem: Chiave privata in formato PEM (ha la precedenza su key_file)
+            key_file: Percorso di un file PEM; se non esiste viene generata una chiave e salvata nel file
+            algorithm: Algoritmo di firma (RS256, PS256, ES256 o EdDSA)
+            key_pool_size: Numero di chiavi pre-generate per la rotazione
+            key_pool_processes: Processi dedicati alla generazione delle chiavi del pool
+        """
+        self.algorithm = algorithm
+        self.private_key = None
+        self.public_key = None
+        self.kid = None
+        self.key_pool = KeyPool(algorithm, key_pool_size, key_pool_processes)
+        # Chiavi pubblicate indicizzate per kid (selezione O(1) in verifica)
+        self._keys: Dict[str, SigningKey] = {}
+        self._active: Optional[SigningKey] = None
+        self._pending: Optional[SigningKey] = None
+        # Materiale segreto della chiave iniziale, stabile tra le rotazioni
+        self._secret_material: Optional[bytes] = None
+        # Materiale derivato dalle chiavi, calcolato una sola volta per ogni cambio del key set
+        self._public_key_pem = None
+        self._verification_key = None
+        # (JWKS, JSON serializzato, ETag) in un'unica tupla: la rotazione gira in un thread
+        self._jwks_cache: Optional[Tuple[dict, bytes, str]] = None
+
+        if private_key_pem:
+            self._load_private_key(private_key_pem.encode("utf-8"))
+        elif key_file:
+            self._load_or_create_key_file(key_file)
+        else:
+            self._generate_keys()
+
+    def _generate_keys(self):
+        """Genera una coppia di chiavi per l'algoritmo configurato"""
+        self._set_private_key(generate_private_key(self.algorithm))
+
+    def _set_private_key(self, private_key):
+        """Imposta la chiave privata come unica chiave attiva e ricalcola il materiale derivato"""
+        key = SigningKey(private_key, self.algorithm)
+        self._keys = {key.kid: key}
+        self._pending = None
+        self._activate(key)
+        self._secret_material = private_key.private_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
         )
-        return pem.decode("utf-8")
+        self._build_cache()
+
+    def _activate(self, key: SigningKey):
+        """Rende attiva la chiave (usata per firmare i nuovi token)"""
+        key.activated_at = time.time()
+        self._active = key
+        self.private_key = key.private_key
+        self.public_key = key.public_key
+        self.kid = key.kid
+        self._public_key_pem = key.public_key_pem
+        self._verification_key = key.verification_key
+
+    def publish_next_key(self) -> SigningKey:
+        """Pubblica nel JWKS la prossima chiave (presa dal pool) senza ancora usarla per firmare"""
+        if self._pending is None:
+            key = SigningKey(self.key_pool.take(), self.algorithm)
+            self._keys[key.kid] = key
+            self._pending = key
+            self._build_cache()
+            logger.info(f"Signing key {key.kid} published")
+        return self._pending
+
+    def activate_pending_key(self):
+        """Attiva la chiave pubblicata; la precedente resta nel JWKS finché i suoi token possono essere validi"""
+        if self._pending is None:
+            return
+        previous = self._active
+        previous.retire_at = time.time() + max(settings.access_token_expiry, settings.id_token_expiry)
+        self._activate(self._pending)
+        self._pending = None
+        logger.info(f"Signing key {self.kid} activated, {previous.kid} retired")
+
+    def rotate(self):
+        """Rotazione immediata: pubblica e attiva subito una nuova chiave"""
+        self.publish_next_key()
+        self.activate_pending_key()
+
+    def rotate_if_due(self) -> bool:
+        """
+        Esegue i passi di rotazione pianificata dovuti (da chiamare periodicamente)
+
+        La nuova chiave viene pubblicata key_rotation_grace_period secondi prima di diventare
+        attiva, così i resource server la trovano già nel JWKS in cache; le chiavi ritirate
+        vengono rimosse dopo la durata massima dei token.
+
+        Returns:
+            True se il key set o la chiave attiva sono cambiati
+        """
+        interval = settings.key_rotation_interval
+        if interval <= 0:
+            return False
+
+        now = time.time()
+        grace = min(settings.key_rotation_grace_period, interval)
+        changed = False
+
+        active_age = now - self._active.activated_at
+        if self._pending is None and active_age >= interval - grace:
+            self.publish_next_key()
+            changed = True
+        if self._pending is not None and active_age >= interval and now - self._pending.published_at >= grace:
+            self.activate_pending_key()
+            changed = True
+
+        retired = [kid for kid, key in self._keys.items() if key.retire_at is not None and key.retire_at <= now]
+        for kid in retired:
+            del self._keys[kid]
+            logger.info(f"Signing key {kid} removed from JWKS")
+        if retired:
+            self._build_cache()
+            changed = True
+
+        return changed
+
+    def _load_private_key(self, pem: bytes):
+        """Carica una chiave privata da PEM, verificando che sia adatta all'algoritmo"""
+        # Le variabili d'ambiente spesso contengono i newline come sequenza letterale "\n"
+        pem = pem.replace(b"\\n", b"\n")
+        private_key = serialization.load_pem_private_key(pem, password=None, backend=default_backend())
+        check_private_key(private_key, self.algorithm)
+        self._set_private_key(private_key)
+
+    def _load_or_create_key_file(self, key_file: str):
+        """
+        Carica la chiave dal file PEM, generandola e salvandola al primo avvio
+
+        Il file viene creato in modo atomico (link di un file temporaneo), quindi più worker
+        o repliche che partono insieme sullo stesso volume finiscono per usare la stessa chiave.
+        """
+        if os.path.exists(key_file):
+            with open(key_file, "rb") as f:
+                self._load_private_key(f.read())
+            logger.info(f"Signing key loaded from {key_file}")
+            return
+
+        self._generate_keys()
+        directory = os.path.dirname(os.path.abspath(key_file))
+        os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{key_file}.{os.getpid()}.tmp"
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.get_private_key_pem())
+            try:
+                os.link(tmp_file, key_file)
+                logger.info(f"Signing key generated and saved to {key_file}")
+            except FileExistsError:
+                # Un altro processo ha salvato la chiave per primo: usa la sua
+                with open(key_file, "rb") as f:
+                    self._load_private_key(f.read())
+                logger.info(f"Signing key loaded from {key_file}")
+        finally:
+            os.unlink(tmp_file)
+
+    def _build_cache(self):
+        """Pre-calcola JWKS, JSON serializzato ed ETag per le chiavi pubblicate"""
+        jwks = {"keys": [key.jwk for key in list(self._keys.values())]}
+        jwks_json = json.dumps(jwks, separators=(",", ":")).encode("utf-8")
+        # ETag forte: cambia solo quando cambia il contenuto del key set
+        self._jwks_cache = (jwks, jwks_json, f'"{hashlib.sha256(jwks_json).hexdigest()}"')
+
+    def get_private_key_pem(self) -> str:
+        """Restituisce la chiave privata in formato PEM"""
+        return self._active.private_key_pem()
+
+    def get_public_key_pem(self, kid: Optional[str] = None) -> Optional[str]:
+        """Restituisce la chiave pubblica in formato PEM (della chiave attiva, o di quella con il kid indicato)"""
+        if kid is None:
+            return self._public_key_pem
+        key = self._keys.get(kid)
+        return key.public_key_pem if key is not None else None
+
+    def get_verification_key(self, kid: Optional[str] = None) -> Optional[Key]:
+        """
+        Restituisce la chiave di verifica pre-caricata (python-jose)
+
+        Args:
+            kid: Key ID dall'header del token (se None, la chiave attiva)
+
+        Returns:
+            Chiave di verifica, o None se il kid non è pubblicato
+        """
+        if kid is None:
+            return self._verification_key
+        key = self._keys.get(kid)
+        return key.verification_key if key is not None else None
+
+    def get_secret_material(self) -> bytes:
+        """Restituisce il materiale segreto della chiave iniziale (stabile tra le rotazioni)"""
+        return self._secret_material
 
     def get_public_numbers(self) -> Tuple[int, int]:
-        """Restituisce i numeri pubblici (n, e) della chiave RSA"""
+        """Restituisce i numeri pubblici (n, e) della chiave RSA (solo RS256/PS256)"""
         public_numbers = self.public_key.public_numbers()
         return public_numbers.n, public_numbers.e
 
@@ -52,26 +373,41 @@ class JWKSService:
         return base64.urlsafe_b64encode(value_bytes).rstrip(b"=").decode("utf-8")
 
     def get_jwks(self) -> dict:
-        """Restituisce il JWKS (JSON Web Key Set)"""
-        n, e = self.get_public_numbers()
-
-        return {
-            "keys": [
-                {
-                    "kty": "RSA",
-                    "use": "sig",
-                    "kid": self.kid,
-                    "alg": "RS256",
-                    "n": self._int_to_base64url(n),
-                    "e": self._int_to_base64url(e),
-                }
-            ]
-        }
+        """Restituisce il JWKS (JSON Web Key Set) pre-calcolato (da non modificare)"""
+        return self._jwks_cache[0]
+
+    def get_jwks_json(self) -> bytes:
+        """Restituisce il JWKS già serializzato in JSON"""
+        return self._jwks_cache[1]
+
+    def get_jwks_etag(self) -> str:
+        """Restituisce l'ETag forte del JWKS corrente"""
+        return self._jwks_cache[2]
+
+    def get_jwks_document(self) -> Tuple[bytes, str]:
+        """Restituisce JSON ed ETag del JWKS letti insieme (coerenti anche durante una rotazione)"""
+        _, jwks_json, etag = self._jwks_cache
+        return jwks_json, etag
 
     def get_kid(self) -> str:
         """Restituisce il Key ID"""
         return self.kid
 
+    def get_active_key(self) -> SigningKey:
+        """
+        Restituisce la chiave attiva
+
+        Chiave privata e kid vanno letti da questo unico riferimento: durante una rotazione
+        gli attributi private_key e kid del servizio vengono aggiornati uno alla volta.
+        """
+        return self._active
+
 
 # Istanza globale del servizio
-jwks_service = JWKSService()
+jwks_service = JWKSService(
+    private_key_pem=settings.signing_key_pem,
+    key_file=settings.signing_key_file,
+    algorithm=settings.signing_algorithm,
+    key_pool_size=settings.key_pool_size,
+    key_pool_processes=settings.key_pool_processes,
+)
@@ -0,0 +1,141 @@
+"""
+Login Page - Pagina di login di /authorize pre-renderizzata
+
+Il template viene compilato una sola volta in segmenti statici (già codificati in bytes)
+alternati ai campi dinamici: per ogni richiesta restano solo l'escape HTML dei parametri
+e la concatenazione. Il CSS è servito a parte, con varianti gzip (e brotli, se il pacchetto
+opzionale `brotli` è installato) compresse all'avvio, così i browser lo mettono in cache.
+"""
+
+import gzip
+import hashlib
+import html
+import re
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dipendenza opzionale
+    brotli = None
+
+LOGIN_CSS_PATH = "/assets/login.css"
+
+LOGIN_CSS = """body{font-family:Arial,sans-serif;max-width:400px;margin:100px auto;padding:20px}
+input{width:100%;padding:10px;margin:10px 0;box-sizing:border-box}
+button{width:100%;padding:10px;background:#0066cc;color:white;border:none;cursor:pointer}
+button:hover{background:#0052a3}
+.info{background:#f0f0f0;padding:10px;margin:20px 0;border-radius:5px}
+"""
+
+LOGIN_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Mock OIDC - Login</title>
+<link rel="stylesheet" href="{css_path}">
+</head>
+<body>
+<h2>Mock OIDC Login</h2>
+<div class="info">
+<strong>Client ID:</strong> {client_id}<br>
+<strong>Scopes:</strong> {scope}
+</div>
+<form method="get">
+<input type="hidden" name="response_type" value="{response_type}">
+<input type="hidden" name="client_id" value="{client_id}">
+<input type="hidden" name="redirect_uri" value="{redirect_uri}">
+<input type="hidden" name="scope" value="{scope}">
+<input type="hidden" name="state" value="{state}">
+<input type="hidden" name="nonce" value="{nonce}">
+<input type="hidden" name="code_challenge" value="{code_challenge}">
+<input type="hidden" name="code_challenge_method" value="{code_challenge_method}">
+<input type="text" name="username" placeholder="Username" required>
+<input type="password" name="password" placeholder="Password" required>
+<button type="submit">Login</button>
+</form>
+<div class="info">
+<strong>💡 Suggerimento:</strong><br>
+Puoi usare <strong>qualsiasi email e password</strong>!<br>
+I claims saranno generati automaticamente dalla tua email.<br><br>
+<em>Esempi: mario.rossi@company.com, test@example.com</em>
+</div>
+</body>
+</html>
+"""
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class CompiledTemplate:
+    """Template HTML compilato: segmenti statici in bytes e campi dinamici con escape"""
+
+    def __init__(self, source: str, **static_fields: str):
+        """
+        Args:
+            source: Template con segnaposto {nome}
+            static_fields: Campi noti all'avvio, inseriti (con escape) direttamente nei segmenti statici
+        """
+        self.fields: List[str] = []
+        self._static: List[bytes] = []
+
+        pending = ""
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            pending += source[position : match.start()]
+            position = match.end()
+            name = match.group(1)
+            if name in static_fields:
+                pending += html.escape(static_fields[name], quote=True)
+                continue
+            self._static.append(pending.encode("utf-8"))
+            self.fields.append(name)
+            pending = ""
+        self._static.append((pending + source[position:]).encode("utf-8"))
+
+    def render(self, **values: Optional[str]) -> bytes:
+        """Restituisce il documento con i campi dinamici sostituiti (escape HTML, None = stringa vuota)"""
+        parts = [self._static[0]]
+        for name, static in zip(self.fields, self._static[1:]):
+            parts.append(html.escape(values.get(name) or "", quote=True).encode("utf-8"))
+            parts.append(static)
+        return b"".join(parts)
+
+
+class StaticAsset:
+    """Risorsa statica con varianti pre-compresse ed ETag calcolati una volta"""
+
+    def __init__(self, content: str, media_type: str):
+        self.media_type = media_type
+        self.identity = content.encode("utf-8")
+        digest = hashlib.sha256(self.identity).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        # mtime=0: output deterministico (stesso ETag e stessi bytes su ogni replica)
+        self.variants: Dict[str, bytes] = {"gzip": gzip.compress(self.identity, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(self.identity)
+        # Un ETag forte per variante: codifiche diverse sono rappresentazioni diverse (RFC 9110 §8.8.3)
+        self.etags: Dict[Optional[str], str] = {None: self.etag}
+        self.etags.update((coding, f'"{digest}-{coding}"') for coding in self.variants)
+
+    def negotiate(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """
+        Sceglie la variante in base all'header Accept-Encoding (brotli, poi gzip, poi non compressa)
+
+        Returns:
+            (contenuto, Content-Encoding o None)
+        """
+        accepted = set()
+        for item in accept_encoding.lower().split(","):
+            coding, _, params = item.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(coding.strip())
+
+        for coding in ("br", "gzip"):
+            if coding in self.variants and coding in accepted:
+                return self.variants[coding], coding
+        return self.identity, None
+
+
+# Template e CSS compilati all'import (istanze globali)
+login_template = CompiledTemplate(LOGIN_TEMPLATE, css_path=LOGIN_CSS_PATH)
+login_css = StaticAsset(LOGIN_CSS, "text/css; charset=utf-8")
@@ -1,47 +1,336 @@
+import asyncio
+import base64
+import hashlib
+import json
 import logging
-from typing import Dict, Optional
+import time
+from contextlib import asynccontextmanager
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote_plus
 
 from fastapi import FastAPI, Form, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 
-from claims_generator import generate_claims_from_email
-from config import MOCK_USERS, settings
+from cache import LRUCache
+from claims_generator import generate_claims_bulk, generate_claims_from_email, get_claims_cache_stats
+from config import get_config_status, on_config_reload, reload_config, settings
+from crypto_executor import ExecutorBusyError, crypto_executor
 from jwks_service import jwks_service
-from models import AuthorizationCode, DiscoveryResponse, JWKSResponse, TokenResponse, UserInfoResponse
+from login_page import LOGIN_CSS_PATH, login_css, login_template
+from mock_users import user_index
+from models import (
+    AuthorizationCode,
+    DiscoveryResponse,
+    IntrospectionBatchRequest,
+    JWKSResponse,
+    TokenBatchRequest,
+    TokenResponse,
+    UserInfoResponse,
+)
+from refresh_token_service import refresh_token_service
+from storage import StoreBusyError, create_store
 from token_service import token_service
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Crea l'app FastAPI
-app = FastAPI(title="Mock OIDC Server", description="Mock OpenID Connect Provider for testing", version="1.0.0")
-
-# Storage in-memory per authorization codes, tokens e sessioni
-authorization_codes: Dict[str, AuthorizationCode] = {}
-refresh_tokens: Dict[str, dict] = {}
-revoked_tokens: set = set()
+# Storage per authorization codes, tokens e sessioni (backend configurabile, vedi storage.py)
+authorization_codes = create_store("authorization_codes")
+revoked_tokens = create_store("revoked_tokens")
+# Cache di replay dei code self-contained (modalità stateless): jti già riscattati fino alla scadenza
+used_authorization_codes = create_store("used_authorization_codes")
+
+STORES = {
+    "authorization_codes": authorization_codes,
+    "used_authorization_codes": used_authorization_codes,
+    "refresh_tokens": refresh_token_service.tokens,
+    "claim_sets": refresh_token_service.claim_sets,
+    "refresh_token_index": refresh_token_service.index,
+    "revoked_tokens": revoked_tokens,
+}
+
+
+async def _sweep_expired_loop():
+    """Task in background che rimuove periodicamente le chiavi scadute dagli store"""
+    while True:
+        await asyncio.sleep(settings.storage_sweep_interval)
+        for name, store in STORES.items():
+            try:
+                removed = store.sweep()
+                if removed:
+                    logger.info(f"Swept {removed} expired entries from {name}")
+            except Exception as e:
+                logger.error(f"Sweep of {name} failed: {str(e)}")
+
+
+async def _key_rotation_loop():
+    """Task in background che esegue la rotazione pianificata delle chiavi di firma"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(1)
+        try:
+            # In un thread: con il pool vuoto la nuova chiave viene generata al momento (CPU-bound)
+            await loop.run_in_executor(None, jwks_service.rotate_if_due)
+        except Exception as e:
+            logger.error(f"Key rotation failed: {str(e)}")
+
+
+async def _config_reload_loop():
+    """Task in background che applica le modifiche al file di configurazione (CONFIG_FILE)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.config_reload_interval)
+        try:
+            # Lettura del file e ricaricamento degli utenti in un thread: l'event loop continua a servire
+            await loop.run_in_executor(None, reload_config)
+        except Exception as e:
+            logger.error(f"Config reload failed: {str(e)}")
+
+
+async def _mock_users_reload_loop():
+    """Task in background che ricarica il file degli utenti (MOCK_USERS_FILE) quando cambia"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.mock_users_reload_interval)
+        try:
+            # Un file con 100k+ utenti richiede secondi: la rilettura avviene in un thread
+            await loop.run_in_executor(None, user_index.refresh)
+        except Exception as e:
+            logger.error(f"Mock users reload failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvia e ferma i task in background dell'applicazione"""
+    # Utenti pre-configurati caricati prima di accettare richieste: i login fanno solo un lookup
+    await asyncio.get_running_loop().run_in_executor(None, user_index.load)
+    tasks = [asyncio.create_task(_sweep_expired_loop()), asyncio.create_task(_mock_users_reload_loop())]
+    if settings.key_rotation_interval > 0:
+        # Le chiavi della prossima rotazione vengono generate in anticipo in un processo separato
+        jwks_service.key_pool.fill()
+        tasks.append(asyncio.create_task(_key_rotation_loop()))
+    if settings.config_file:
+        tasks.append(asyncio.create_task(_config_reload_loop()))
+    yield
+    for task in tasks:
+        task.cancel()
+    jwks_service.key_pool.shutdown()
+    crypto_executor.shutdown()
 
 
-@app.get("/.well-known/openid-configuration", response_model=DiscoveryResponse)
-async def discovery(request: Request):
-    """Discovery endpoint - restituisce la configurazione OIDC"""
-    # Costruisce il base_url dinamicamente dalla richiesta
-    base_url = str(request.base_url).rstrip("/")
-
-    logger.info(f"Discovery endpoint called - base_url: {base_url}")
+# Crea l'app FastAPI
+app = FastAPI(
+    title="Mock OIDC Server",
+    description="Mock OpenID Connect Provider for testing",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request: Request, exc: ExecutorBusyError):
+    """Backpressure: con il pool crittografico saturo la richiesta viene rifiutata subito invece di accodarsi"""
+    logger.warning(str(exc))
+    return JSONResponse(status_code=503, content={"detail": "Server busy, retry later"}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(StoreBusyError)
+async def store_busy_handler(request: Request, exc: StoreBusyError):
+    """Storage condiviso conteso o irraggiungibile oltre STORAGE_TIMEOUT: la richiesta può essere ripetuta"""
+    logger.warning(str(exc))
+    return JSONResponse(status_code=503, content={"detail": "Storage busy, retry later"}, headers={"Retry-After": "1"})
+
+
+# Token dei client (grant client_credentials): (client_id, scope, audience, issuer) -> (token, exp)
+client_token_cache = LRUCache(maxsize=settings.client_credentials_cache_size)
+
+# Claims dei token già verificati da /userinfo: hash del token -> (claims, exp)
+verified_token_cache = LRUCache(maxsize=settings.userinfo_cache_size)
+
+# Discovery document pre-serializzati (body JSON, ETag) per issuer
+discovery_cache = LRUCache(maxsize=settings.discovery_cache_size)
+# Un cambio di configurazione può modificare scopes, response types e algoritmo pubblicati
+on_config_reload(discovery_cache.clear)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Verifica se l'header If-None-Match della richiesta corrisponde all'ETag (confronto debole)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    opaque_tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque_tag:
+            return True
+    return False
+
+
+def _cacheable_json_response(request: Request, content: bytes, etag: str, max_age: int) -> Response:
+    """Restituisce un JSON con ETag e Cache-Control, oppure 304 se il client ha già la versione corrente"""
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def _get_discovery_document(base_url: str) -> Tuple[bytes, str]:
+    """Restituisce il discovery document serializzato e il suo ETag, usando la cache per-issuer"""
+    # I settings esposti fanno parte della chiave: se cambiano, la voce precedente non viene più usata
+    cache_key = (
+        base_url,
+        tuple(settings.supported_response_types),
+        tuple(settings.supported_scopes),
+        jwks_service.algorithm,
+    )
+    cached = discovery_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    return DiscoveryResponse(
+    document = DiscoveryResponse(
         issuer=base_url,
         authorization_endpoint=f"{base_url}/authorize",
         token_endpoint=f"{base_url}/token",
         userinfo_endpoint=f"{base_url}/userinfo",
         jwks_uri=f"{base_url}/jwks",
         revocation_endpoint=f"{base_url}/revoke",
+        introspection_endpoint=f"{base_url}/introspect",
         end_session_endpoint=f"{base_url}/logout",
         response_types_supported=settings.supported_response_types,
         scopes_supported=settings.supported_scopes,
+        id_token_signing_alg_values_supported=[jwks_service.algorithm],
     )
+    content = document.model_dump_json().encode("utf-8")
+    # ETag derivato dal documento per-issuer
+    etag = f'"{hashlib.sha256(content).hexdigest()}"'
+
+    discovery_cache.set(cache_key, (content, etag))
+    return content, etag
+
+
+def _consume_authorization_code(code: str) -> Optional[AuthorizationCode]:
+    """Recupera e consuma un authorization code (una sola volta), sia opaco che self-contained"""
+    if not settings.stateless_tokens:
+        # Recupera ed elimina atomicamente il code, anche con più worker che condividono lo storage
+        auth_code_data = authorization_codes.pop(code)
+        return AuthorizationCode.from_dict(auth_code_data) if auth_code_data else None
+
+    try:
+        payload = token_service.open_token("code", code)
+    except ValueError:
+        return None
+    # Solo il primo riscatto del jti viene accettato
+    if not used_authorization_codes.add(payload["jti"], {}, ttl=payload["exp"] - time.time()):
+        return None
+    payload.pop("jti")
+    payload.pop("exp")
+    return AuthorizationCode.from_dict({**payload, "code": code})
+
+
+@app.get("/.well-known/openid-configuration", response_model=DiscoveryResponse)
+async def discovery(request: Request):
+    """Discovery endpoint - restituisce la configurazione OIDC"""
+    # Costruisce il base_url dinamicamente dalla richiesta
+    base_url = str(request.base_url).rstrip("/")
+
+    logger.info(f"Discovery endpoint called - base_url: {base_url}")
+
+    content, etag = _get_discovery_document(base_url)
+    return _cacheable_json_response(request, content, etag, settings.discovery_cache_max_age)
+
+
+def _client_id_from_basic_auth(request: Request) -> Optional[str]:
+    """Estrae il client_id dall'header Authorization Basic (client_secret_basic)"""
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Basic "):
+        return None
+    try:
+        decoded = base64.b64decode(auth_header[len("Basic ") :]).decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return None
+    client_id, _, _ = decoded.partition(":")
+    return unquote_plus(client_id) or None
+
+
+async def _issue_client_token(client_id: str, scope: str, audience: str, issuer: str) -> Tuple[str, int]:
+    """
+    Restituisce il token client_credentials e la sua validità residua
+
+    Con CLIENT_CREDENTIALS_CACHE attiva un token emesso per la stessa combinazione
+    (client_id, scope, audience, issuer) viene riusato finché gli restano almeno
+    CLIENT_CREDENTIALS_CACHE_MIN_TTL secondi di validità e non è stato revocato.
+    """
+    cache_key = (client_id, scope, audience, issuer)
+    if settings.client_credentials_cache:
+        cached = client_token_cache.get(cache_key)
+        if cached is not None:
+            token, exp = cached
+            remaining = exp - int(time.time())
+            if (
+                remaining > settings.client_credentials_cache_min_ttl
+                and token_service.hash_token(token) not in revoked_tokens
+            ):
+                return token, remaining
+            client_token_cache.pop(cache_key)
+
+    token = await token_service.generate_client_token_async(client_id, scope, audience, issuer=issuer)
+    exp = token_service.get_unverified_expiry(token)
+    if settings.client_credentials_cache:
+        client_token_cache.set(cache_key, (token, exp))
+    return token, exp - int(time.time())
+
+
+def _authenticate_user(username: str, password: str) -> Dict:
+    """
+    Autentica l'utente e ne restituisce i claims
+
+    Con utenti pre-configurati (MOCK_USERS, MOCK_USERS_FILE o MOCK_USERS_JSON) verifica le
+    credenziali, altrimenti accetta qualsiasi email/password e genera i claims dall'email.
+
+    Raises:
+        HTTPException: Se le credenziali non sono valide
+    """
+    # Se ci sono utenti pre-configurati, cerca l'utente nell'indice
+    if user_index.enabled:
+        user_claims = user_index.authenticate(username, password)
+        if user_claims is None:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        return user_claims
+
+    # Modalità dinamica: accetta qualsiasi email/password
+    # Valida che l'username sia una email valida
+    if not username or "@" not in username:
+        raise HTTPException(status_code=400, detail="Username must be a valid email address")
+
+    # Genera claims dinamicamente dalla email
+    logger.info(f"Generating dynamic claims for email: {username}")
+    return generate_claims_from_email(username)
+
+
+@app.get(LOGIN_CSS_PATH, include_in_schema=False)
+async def login_stylesheet(request: Request):
+    """CSS della pagina di login (pre-compresso, con un ETag per variante)"""
+    content, encoding = login_css.negotiate(request.headers.get("accept-encoding", ""))
+    etag = login_css.etags[encoding]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.static_cache_max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type=login_css.media_type, headers=headers)
 
 
 @app.get("/authorize")
@@ -66,97 +355,45 @@ async def authorize(
 
     # Se non ci sono credenziali, mostra form di login
     if not username or not password:
-        return HTMLResponse(
-            content=f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Mock OIDC - Login</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; max-width: 400px; margin: 100px auto; padding: 20px; }}
-                input {{ width: 100%; padding: 10px; margin: 10px 0; box-sizing: border-box; }}
-            button {{ width: 100%; padding: 10px; background: #0066cc; color: white; border: none; cursor: pointer; }}
-                button:hover {{ background: #0052a3; }}
-                .info {{ background: #f0f0f0; padding: 10px; margin: 20px 0; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <h2>Mock OIDC Login</h2>
-            <div class="info">
-                <strong>Client ID:</strong> {client_id}<br>
-                <strong>Scopes:</strong> {scope}
-            </div>
-            <form method="get">
-                <input type="hidden" name="response_type" value="{response_type}">
-                <input type="hidden" name="client_id" value="{client_id}">
-                <input type="hidden" name="redirect_uri" value="{redirect_uri}">
-                <input type="hidden" name="scope" value="{scope}">
-                <input type="hidden" name="state" value="{state or ""}">
-                <input type="hidden" name="nonce" value="{nonce or ""}">
-                <input type="hidden" name="code_challenge" value="{code_challenge or ""}">
-                <input type="hidden" name="code_challenge_method" value="{code_challenge_method or ""}">
-
-                <input type="text" name="username" placeholder="Username" required>
-                <input type="password" name="password" placeholder="Password" required>
-                <button type="submit">Login</button>
-            </form>
-
-            <div class="info">
-                <strong>💡 Suggerimento:</strong><br>
-                Puoi usare <strong>qualsiasi email e password</strong>!<br>
-                I claims saranno generati automaticamente dalla tua email.<br><br>
-                <em>Esempi: mario.rossi@company.com, test@example.com</em>
-            </div>
-        </body>
-        </html>
-        """
+        page = login_template.render(
+            client_id=client_id,
+            scope=scope,
+            response_type=response_type,
+            redirect_uri=redirect_uri,
+            state=state,
+            nonce=nonce,
+            code_challenge=code_challenge,
+            code_challenge_method=code_challenge_method,
         )
+        return HTMLResponse(content=page)
 
     # Autentica l'utente
-    user = None
-
-    # Se MOCK_USERS è configurato, cerca l'utente nella lista
-    if MOCK_USERS is not None:
-        for mock_user in MOCK_USERS:
-            if mock_user["username"] == username and mock_user["password"] == password:
-                user = mock_user
-                break
-
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-    else:
-        # Modalità dinamica: accetta qualsiasi email/password
-        # Valida che l'username sia una email valida
-        if not username or "@" not in username:
-            raise HTTPException(status_code=400, detail="Username must be a valid email address")
-
-        # Genera claims dinamicamente dalla email
-        logger.info(f"Generating dynamic claims for email: {username}")
-        user_claims = generate_claims_from_email(username)
-
-        user = {
-            "username": username,
-            "password": password,  # Non viene validata in modalità dinamica
-            "claims": user_claims,
-        }
+    user_claims = _authenticate_user(username, password)
 
     # Gestisce il flusso authorization code
     if "code" in response_type:
-        # Genera authorization code
-        code = token_service.generate_authorization_code()
-
-        # Salva il code con i dati associati
-        authorization_codes[code] = AuthorizationCode(
-            code=code,
+        auth_code = AuthorizationCode(
+            code="",
             client_id=client_id,
             redirect_uri=redirect_uri,
             scope=scope,
-            user_claims=user["claims"],
+            user_claims=user_claims,
             code_challenge=code_challenge,
             code_challenge_method=code_challenge_method,
             nonce=nonce,
         )
 
+        if settings.stateless_tokens:
+            # Code self-contained: i dati viaggiano cifrati nel code stesso, nessuno storage
+            code_data = auth_code.to_dict()
+            del code_data["code"]
+            code = token_service.generate_authorization_code(data=code_data)
+        else:
+            # Genera authorization code e lo salva con i dati associati
+            code = token_service.generate_authorization_code()
+            auth_code.code = code
+            authorization_codes.set(code, auth_code.to_dict(), ttl=settings.authorization_code_expiry)
+
         # Costruisci URL di redirect
         redirect_params = f"code={code}"
         if state:
@@ -180,6 +417,10 @@ async def token(
     client_secret: Optional[str] = Form(default=None),
     code_verifier: Optional[str] = Form(default=None),
     refresh_token: Optional[str] = Form(default=None),
+    username: Optional[str] = Form(default=None),
+    password: Optional[str] = Form(default=None),
+    scope: Optional[str] = Form(default=None),
+    audience: Optional[str] = Form(default=None),
 ):
     """Token endpoint - scambia authorization code con access token"""
     logger.info(f"Token endpoint called - grant_type: {grant_type}")
@@ -188,48 +429,78 @@ async def token(
         if not code:
             raise HTTPException(status_code=400, detail="Missing code parameter")
 
-        # Recupera l'authorization code
-        auth_code = authorization_codes.get(code)
-        if not auth_code:
-            raise HTTPException(status_code=400, detail="Invalid authorization code")
+        # Posti per le due firme riservati prima di consumare il code: con il pool saturo la
+        # richiesta viene rifiutata (503) lasciando il code valido per un nuovo tentativo
+        with crypto_executor.reserve(2):
+            # Recupera e consuma l'authorization code (può essere usato una sola volta)
+            auth_code = _consume_authorization_code(code)
+            if not auth_code:
+                raise HTTPException(status_code=400, detail="Invalid authorization code")
+
+            if auth_code.is_expired(settings.authorization_code_expiry):
+                raise HTTPException(status_code=400, detail="Authorization code expired")
+
+            # Valida redirect_uri
+            if redirect_uri != auth_code.redirect_uri:
+                raise HTTPException(status_code=400, detail="Invalid redirect_uri")
+
+            # Valida PKCE se presente
+            if auth_code.code_challenge:
+                if not code_verifier:
+                    raise HTTPException(status_code=400, detail="Missing code_verifier")
+
+                if not token_service.validate_pkce(
+                    code_verifier, auth_code.code_challenge, auth_code.code_challenge_method
+                ):
+                    raise HTTPException(status_code=400, detail="Invalid code_verifier")
+
+            # Ricava l'issuer dinamicamente dalla richiesta
+            base_url = str(request.base_url).rstrip("/")
+
+            # Genera i token con issuer dinamico (le due firme in parallelo nel pool crittografico)
+            access_token, id_token = await asyncio.gather(
+                token_service.generate_access_token_async(auth_code.user_claims, auth_code.scope, issuer=base_url),
+                token_service.generate_id_token_async(
+                    auth_code.user_claims, auth_code.client_id, auth_code.nonce, issuer=base_url
+                ),
+            )
+
+        # Emette e salva il refresh token
+        refresh_token_value = refresh_token_service.issue(auth_code.user_claims, auth_code.scope, auth_code.client_id)
 
-        # Valida redirect_uri
-        if redirect_uri != auth_code.redirect_uri:
-            raise HTTPException(status_code=400, detail="Invalid redirect_uri")
+        logger.info("Tokens generated successfully")
 
-        # Valida PKCE se presente
-        if auth_code.code_challenge:
-            if not code_verifier:
-                raise HTTPException(status_code=400, detail="Missing code_verifier")
+        return TokenResponse(
+            access_token=access_token,
+            token_type="Bearer",
+            expires_in=settings.access_token_expiry,
+            id_token=id_token,
+            refresh_token=refresh_token_value,
+            scope=auth_code.scope,
+        )
 
-            if not token_service.validate_pkce(
-                code_verifier, auth_code.code_challenge, auth_code.code_challenge_method
-            ):
-                raise HTTPException(status_code=400, detail="Invalid code_verifier")
+    elif grant_type == "password" and settings.password_grant_enabled:
+        # Grant di sola utilità per i test: token in una sola chiamata, senza authorize né authorization code
+        if not username or not password:
+            raise HTTPException(status_code=400, detail="Missing username or password parameter")
+        if not client_id:
+            raise HTTPException(status_code=400, detail="Missing client_id parameter")
 
-        # Ricava l'issuer dinamicamente dalla richiesta
+        user_claims = _authenticate_user(username, password)
+        scope = scope or "openid profile email"
         base_url = str(request.base_url).rstrip("/")
 
-        # Genera i token con issuer dinamico
-        access_token = token_service.generate_access_token(auth_code.user_claims, auth_code.scope, issuer=base_url)
-
-        id_token = token_service.generate_id_token(
-            auth_code.user_claims, auth_code.client_id, auth_code.nonce, issuer=base_url
+        access_token, id_token = await asyncio.gather(
+            token_service.generate_access_token_async(user_claims, scope, issuer=base_url),
+            token_service.generate_id_token_async(user_claims, client_id, issuer=base_url),
         )
 
-        refresh_token_value = token_service.generate_refresh_token()
-
-        # Salva il refresh token
-        refresh_tokens[refresh_token_value] = {
-            "user_claims": auth_code.user_claims,
-            "scope": auth_code.scope,
-            "client_id": auth_code.client_id,
-        }
+        # Refresh token solo se richiesto esplicitamente, per non popolare lo store ad ogni test
+        refresh_token_value = None
+        if "offline_access" in scope.split():
+            refresh_token_value = refresh_token_service.issue(user_claims, scope, client_id)
 
-        # Elimina il code (può essere usato una sola volta)
-        del authorization_codes[code]
-
-        logger.info("Tokens generated successfully")
+        logger.info("Tokens generated successfully (password grant)")
 
         return TokenResponse(
             access_token=access_token,
@@ -237,25 +508,48 @@ async def token(
             expires_in=settings.access_token_expiry,
             id_token=id_token,
             refresh_token=refresh_token_value,
-            scope=auth_code.scope,
+            scope=scope,
         )
 
-    elif grant_type == "refresh_token":
-        if not refresh_token:
-            raise HTTPException(status_code=400, detail="Missing refresh_token parameter")
-
-        # Recupera il refresh token
-        rt_data = refresh_tokens.get(refresh_token)
-        if not rt_data:
-            raise HTTPException(status_code=400, detail="Invalid refresh token")
+    elif grant_type == "client_credentials":
+        # Mock: il client secret non viene validato, basta identificare il client (form o Basic auth)
+        client_id = client_id or _client_id_from_basic_auth(request)
+        if not client_id:
+            raise HTTPException(status_code=400, detail="Missing client_id parameter")
 
-        # Ricava l'issuer dinamicamente dalla richiesta
+        scope = scope or ""
         base_url = str(request.base_url).rstrip("/")
+        access_token, expires_in = await _issue_client_token(
+            client_id, scope, audience or "api://default", issuer=base_url
+        )
+
+        logger.info(f"Client token issued - client_id: {client_id}")
+
+        # RFC 6749 §4.4.3: nessun refresh token (né ID token, non c'è un utente)
+        return TokenResponse(access_token=access_token, token_type="Bearer", expires_in=expires_in, scope=scope or None)
 
-        # Genera nuovi token con issuer dinamico
-        access_token = token_service.generate_access_token(rt_data["user_claims"], rt_data["scope"], issuer=base_url)
+    elif grant_type == "refresh_token":
+        if not refresh_token:
+            raise HTTPException(status_code=400, detail="Missing refresh_token parameter")
 
-        id_token = token_service.generate_id_token(rt_data["user_claims"], rt_data["client_id"], issuer=base_url)
+        # Come per il code: con il pool saturo il refresh token non viene consumato né ruotato
+        with crypto_executor.reserve(2):
+            # Recupera il refresh token (con rotazione attiva viene consumato e sostituito)
+            try:
+                rt_data = refresh_token_service.redeem(refresh_token)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail="Invalid refresh token") from e
+            if not rt_data:
+                raise HTTPException(status_code=400, detail="Invalid refresh token")
+
+            # Ricava l'issuer dinamicamente dalla richiesta
+            base_url = str(request.base_url).rstrip("/")
+
+            # Genera nuovi token con issuer dinamico
+            access_token, id_token = await asyncio.gather(
+                token_service.generate_access_token_async(rt_data["user_claims"], rt_data["scope"], issuer=base_url),
+                token_service.generate_id_token_async(rt_data["user_claims"], rt_data["client_id"], issuer=base_url),
+            )
 
         logger.info("Tokens refreshed successfully")
 
@@ -264,6 +558,7 @@ async def token(
             token_type="Bearer",
             expires_in=settings.access_token_expiry,
             id_token=id_token,
+            refresh_token=rt_data["refresh_token"],
             scope=rt_data["scope"],
         )
 
@@ -271,6 +566,30 @@ async def token(
         raise HTTPException(status_code=400, detail="Unsupported grant_type")
 
 
+async def _verify_bearer_token(token: str, token_hash: str) -> Dict:
+    """
+    Verifica un bearer token, riusando i claims già verificati fino alla scadenza del token
+
+    Raises:
+        ValueError: Se il token non è valido
+    """
+    if not settings.userinfo_cache:
+        return await token_service.decode_token_async(token)
+
+    cached = verified_token_cache.get(token_hash)
+    if cached is not None:
+        claims, exp = cached
+        if exp > time.time():
+            return claims
+        verified_token_cache.pop(token_hash)
+
+    claims = await token_service.decode_token_async(token)
+    exp = claims.get("exp")
+    if isinstance(exp, (int, float)):
+        verified_token_cache.set(token_hash, (claims, exp))
+    return claims
+
+
 @app.get("/userinfo", response_model=UserInfoResponse)
 async def userinfo(request: Request):
     """UserInfo endpoint - restituisce i dati dell'utente autenticato"""
@@ -284,12 +603,13 @@ async def userinfo(request: Request):
     token = auth_header.replace("Bearer ", "")
 
     # Verifica che il token non sia revocato
-    if token in revoked_tokens:
+    token_hash = token_service.hash_token(token)
+    if token_hash in revoked_tokens:
         raise HTTPException(status_code=401, detail="Token has been revoked")
 
     try:
-        # Decodifica il token
-        claims = token_service.decode_token(token)
+        # Decodifica il token (o riusa i claims già verificati finché non scade)
+        claims = await _verify_bearer_token(token, token_hash)
 
         # Restituisci le informazioni dell'utente
         return UserInfoResponse(
@@ -305,16 +625,96 @@ async def userinfo(request: Request):
             roles=claims.get("roles"),
             groups=claims.get("groups"),
         )
+    except ExecutorBusyError:
+        raise
     except Exception as e:
         logger.error(f"Token validation failed: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid token") from e
 
 
+async def _introspect_jwt(token: str) -> Optional[Dict]:
+    """Metadati di un JWT firmato attivo, oppure None se non valido o revocato"""
+    token_hash = token_service.hash_token(token)
+    if token_hash in revoked_tokens:
+        return None
+    try:
+        claims = await _verify_bearer_token(token, token_hash)
+    except ValueError:
+        return None
+
+    response = {**claims, "active": True, "token_type": "Bearer"}
+    if claims.get("azp"):
+        response["client_id"] = claims["azp"]
+    if claims.get("preferred_username"):
+        response["username"] = claims["preferred_username"]
+    return response
+
+
+def _introspect_refresh_token(token: str) -> Optional[Dict]:
+    """Metadati di un refresh token attivo, oppure None se non valido, ruotato o revocato"""
+    metadata = refresh_token_service.introspect(token)
+    if metadata is None:
+        return None
+    response = {"active": True, "token_type": "refresh_token"}
+    response.update((name, value) for name, value in metadata.items() if value is not None)
+    return response
+
+
+async def _introspect(token: str, token_type_hint: Optional[str] = None) -> Dict:
+    """
+    Introspection di un token (RFC 7662): JWT firmati e refresh token
+
+    Ogni lookup è O(1): revoche e claims già verificati sono indicizzati dall'hash del token,
+    i refresh token dal token stesso. token_type_hint decide solo l'ordine dei lookup: se il
+    token non è del tipo indicato viene cercato anche tra gli altri (RFC 7662 §2.1).
+    I token non validi risultano {"active": false}.
+    """
+    # I JWT hanno tre segmenti; i refresh token sono opachi (o sigillati) con prefisso
+    is_jwt = token.count(".") == 2
+
+    if token_type_hint == "refresh_token":
+        response = _introspect_refresh_token(token)
+        if response is None and is_jwt:
+            response = await _introspect_jwt(token)
+    else:
+        response = await _introspect_jwt(token) if is_jwt else None
+        if response is None:
+            response = _introspect_refresh_token(token)
+    return response or {"active": False}
+
+
+@app.post("/introspect")
+async def introspect(token: str = Form(...), token_type_hint: Optional[str] = Form(default=None)):
+    """Introspection endpoint (RFC 7662) - stato e metadati di un token"""
+    return JSONResponse(content=await _introspect(token, token_type_hint))
+
+
+@app.post("/introspect/batch")
+async def introspect_batch(batch: IntrospectionBatchRequest):
+    """
+    Introspection di più token in una sola richiesta (per gateway ad alto QPS)
+
+    I risultati sono nell'ordine dei token. Le verifiche procedono a blocchi grandi quanto il pool
+    crittografico, così un batch non satura la coda degli altri endpoint.
+    """
+    if len(batch.tokens) > settings.introspection_batch_max_size:
+        raise HTTPException(status_code=400, detail=f"Too many tokens (max {settings.introspection_batch_max_size})")
+
+    results = []
+    step = crypto_executor.max_workers
+    for start in range(0, len(batch.tokens), step):
+        chunk = batch.tokens[start : start + step]
+        results.extend(await asyncio.gather(*(_introspect(token, batch.token_type_hint) for token in chunk)))
+    return JSONResponse(content={"results": results})
+
+
 @app.get("/jwks", response_model=JWKSResponse)
-async def jwks():
+async def jwks(request: Request):
     """JWKS endpoint - restituisce le chiavi pubbliche per validare i token"""
     logger.info("JWKS endpoint called")
-    return jwks_service.get_jwks()
+    # Il documento è già serializzato: nessuna validazione/serializzazione per richiesta
+    content, etag = jwks_service.get_jwks_document()
+    return _cacheable_json_response(request, content, etag, settings.jwks_cache_max_age)
 
 
 @app.post("/revoke")
@@ -322,12 +722,20 @@ async def revoke(token: str = Form(...), token_type_hint: Optional[str] = Form(d
     """Revoke endpoint - revoca un token"""
     logger.info(f"Revoke endpoint called - token_type_hint: {token_type_hint}")
 
-    # Aggiungi il token alla lista dei revocati
-    revoked_tokens.add(token)
+    # Aggiungi il token alla lista dei revocati, indicizzato dall'hash e solo finché potrebbe
+    # ancora essere valido: dopo exp lo store lo rimuove automaticamente
+    exp = token_service.get_unverified_expiry(token)
+    now = time.time()
+    if exp is not None and exp > now:
+        # exp non è verificato (l'endpoint non è autenticato): nessun token emesso vive più a lungo
+        # della scadenza massima configurata, quindi un exp contraffatto non allunga la revoca
+        exp = min(exp, int(now) + max(settings.access_token_expiry, settings.id_token_expiry))
+        token_hash = token_service.hash_token(token)
+        revoked_tokens.set(token_hash, {"exp": exp}, ttl=exp - now)
+        verified_token_cache.pop(token_hash)
 
     # Se è un refresh token, rimuovilo dallo storage
-    if token in refresh_tokens:
-        del refresh_tokens[token]
+    refresh_token_service.revoke(token)
 
     return JSONResponse(content={"message": "Token revoked successfully"})
 
@@ -360,13 +768,106 @@ async def root(request: Request):
     }
 
 
+@app.post("/admin/config/reload")
+async def admin_config_reload():
+    """Admin endpoint - ricarica subito la configurazione (file CONFIG_FILE, variabili d'ambiente e .env)"""
+    if not settings.admin_api_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    reloaded = await asyncio.get_running_loop().run_in_executor(None, reload_config, True)
+    return JSONResponse(content={"reloaded": reloaded, **get_config_status()})
+
+
+@app.post("/admin/tokens/batch")
+async def admin_token_batch(request: Request, batch: TokenBatchRequest):
+    """
+    Admin endpoint - emissione massiva di access e ID token per utenti sintetici (fixture per load test)
+
+    Restituisce una riga NDJSON per utente, nell'ordine ricevuto (prima le email, poi i claim set),
+    generata e inviata man mano che i blocchi vengono firmati. Se la firma si interrompe dopo l'invio
+    degli header, l'ultima riga è {"error": ...} invece di un output troncato senza segnalazione.
+    """
+    if not settings.admin_api_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    if len(batch.emails) + len(batch.users) > settings.token_batch_max_size:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {settings.token_batch_max_size} users)")
+
+    base_url = str(request.base_url).rstrip("/")
+    users = chain(generate_claims_bulk(batch.emails), batch.users)
+
+    entries = token_service.generate_token_batch_async(users, batch.client_id, batch.scope, issuer=base_url)
+    # Primo blocco firmato prima di restituire la risposta: con il pool saturo si risponde ancora 503
+    try:
+        first = await entries.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def _ndjson():
+        if first is None:
+            return
+        yield json.dumps(first, separators=(",", ":")) + "\n"
+        try:
+            async for entry in entries:
+                yield json.dumps(entry, separators=(",", ":")) + "\n"
+        except Exception as e:
+            # Header già inviati: l'errore non può più diventare un codice di stato
+            logger.exception("Batch token issuance interrupted")
+            detail = "Server busy, retry later" if isinstance(e, ExecutorBusyError) else "Token issuance failed"
+            yield json.dumps({"error": detail}, separators=(",", ":")) + "\n"
+
+    logger.info(f"Batch token issuance - {len(batch.emails) + len(batch.users)} users")
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics")
+async def metrics():
+    """Metrics endpoint - contatori degli store, chiavi di firma e latenze di firma/verifica"""
+    return {
+        "stores": {name: store.stats() for name, store in STORES.items()},
+        "refresh_token_reuse_detected": refresh_token_service.reuse_detected_count,
+        "signing_keys": {"active_kid": jwks_service.get_kid(), "published": len(jwks_service.get_jwks()["keys"])},
+        "crypto_executor": crypto_executor.stats(),
+        "client_token_cache": client_token_cache.stats(),
+        "userinfo_cache": verified_token_cache.stats(),
+        "claims_cache": get_claims_cache_stats(),
+        "mock_users": user_index.stats(),
+        "config": get_config_status(),
+    }
+
+
 @app.get("/health")
 async def health():
     """Health check endpoint"""
     return {"status": "healthy"}
 
 
+def _multi_worker_problems() -> List[str]:
+    """
+    Configurazioni incompatibili con più worker uvicorn
+
+    Ogni worker è un processo separato: senza storage condiviso un code emesso da un worker
+    non è riscattabile sugli altri, e senza chiave di firma condivisa (o con la rotazione attiva)
+    ogni worker firma con una chiave che il JWKS servito dagli altri non contiene.
+    """
+    problems = []
+    if settings.storage_backend == "memory":
+        problems.append("STORAGE_BACKEND=memory is per-process: use sqlite or redis")
+    if not settings.signing_key_file and not settings.signing_key_pem:
+        problems.append("each worker would generate its own signing key: set SIGNING_KEY_FILE or SIGNING_KEY_PEM")
+    if settings.key_rotation_interval > 0:
+        problems.append("KEY_ROTATION_INTERVAL rotates keys independently in each worker: disable it")
+    return problems
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host=settings.host, port=settings.port)
+    if settings.workers > 1:
+        problems = _multi_worker_problems()
+        if problems:
+            raise SystemExit(f"WORKERS={settings.workers} is not supported: " + "; ".join(problems))
+        # Con più worker uvicorn richiede l'app come import string
+        uvicorn.run("main:app", host=settings.host, port=settings.port, workers=settings.workers)
+    else:
+        uvicorn.run(app, host=settings.host, port=settings.port)
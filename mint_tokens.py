@@ -0,0 +1,161 @@
+"""
+Mint Tokens - Generazione offline di token per fixture di load test (k6, Locust)
+
+Riutilizza TokenService, JWKSService e claims_generator senza avviare il server: i token
+vengono firmati con una chiave persistita (la stessa del server, così li può verificare)
+da una pipeline multiprocessing e scritti in streaming su file NDJSON o CSV, con memoria
+costante indipendentemente dal numero di token.
+
+Uso:
+    uv run python mint_tokens.py --count 1000000 --key-file signing-key.pem --output tokens.ndjson
+    uv run python mint_tokens.py --emails-file users.txt --format csv --output tokens.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from typing import Iterator, List, Optional
+
+from claims_generator import generate_claims_bulk
+from config import settings
+from jwks_service import JWKSService
+from signing_algorithms import SUPPORTED_ALGORITHMS
+from token_service import TokenService
+
+CSV_FIELDS = ["sub", "email", "access_token", "id_token", "expires_in"]
+
+# Servizio di firma del processo worker (inizializzato una volta per processo)
+_worker_service: Optional[TokenService] = None
+
+
+def _init_worker(private_key_pem: str, algorithm: str):
+    """Inizializza il worker con la chiave di firma condivisa"""
+    global _worker_service
+    _worker_service = TokenService()
+    _worker_service.jwks_service = JWKSService(private_key_pem=private_key_pem, algorithm=algorithm)
+
+
+def _mint_chunk(emails: List[str], client_id: str, scope: str, issuer: str, output_format: str) -> str:
+    """Genera i token per un blocco di email e restituisce le righe già serializzate"""
+    users = generate_claims_bulk(emails)
+    entries = _worker_service.generate_token_batch(users, client_id, scope, issuer=issuer)
+
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore", lineterminator="\n")
+        writer.writerows(entries)
+        return buffer.getvalue()
+    return "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+
+
+def _iter_emails(args) -> Iterator[str]:
+    """Email degli utenti: dal file indicato (una per riga) o sintetiche user{N}@dominio"""
+    if args.emails_file:
+        with open(args.emails_file, encoding="utf-8") as f:
+            emails = (line.strip() for line in f)
+            yield from islice((email for email in emails if email), args.count)
+        return
+    for i in range(args.count):
+        yield f"user{i}@{args.domain}"
+
+
+def _iter_chunks(emails: Iterator[str], chunk_size: int) -> Iterator[List[str]]:
+    """Raggruppa le email in blocchi di chunk_size (un job per blocco)"""
+    while True:
+        chunk = list(islice(emails, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _load_signing_key(args) -> JWKSService:
+    """Carica (o crea e persiste) la chiave di firma condivisa con il server"""
+    if args.key_file:
+        return JWKSService(key_file=args.key_file, algorithm=args.algorithm)
+    if settings.signing_key_pem:
+        return JWKSService(private_key_pem=settings.signing_key_pem, algorithm=args.algorithm)
+    raise SystemExit("A persisted signing key is required: use --key-file, SIGNING_KEY_FILE or SIGNING_KEY_PEM")
+
+
+def mint(args, out) -> int:
+    """
+    Esegue la pipeline: blocchi di email -> worker (claims + firma + serializzazione) -> scrittura ordinata
+
+    Al massimo due blocchi per processo sono in lavorazione alla volta, così la memoria
+    resta costante anche per milioni di token.
+
+    Returns:
+        Numero di token (righe) scritti
+    """
+    jwks = _load_signing_key(args)
+    initargs = (jwks.get_private_key_pem(), args.algorithm)
+    max_in_flight = args.processes * 2
+
+    if args.format == "csv":
+        out.write(",".join(CSV_FIELDS) + "\n")
+
+    written = 0
+    with multiprocessing.Pool(args.processes, initializer=_init_worker, initargs=initargs) as pool:
+        in_flight: deque = deque()
+        for chunk in _iter_chunks(_iter_emails(args), args.chunk_size):
+            job_args = (chunk, args.client_id, args.scope, args.issuer, args.format)
+            in_flight.append((len(chunk), pool.apply_async(_mint_chunk, job_args)))
+            if len(in_flight) >= max_in_flight:
+                count, result = in_flight.popleft()
+                out.write(result.get())
+                written += count
+        while in_flight:
+            count, result = in_flight.popleft()
+            out.write(result.get())
+            written += count
+
+    return written
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Costruisce il parser degli argomenti da riga di comando"""
+    parser = argparse.ArgumentParser(description="Mint signed access/ID tokens offline for load-test fixtures")
+    parser.add_argument("--count", type=int, help="Number of tokens (default: 1000, or every line of --emails-file)")
+    parser.add_argument("--emails-file", help="File with one email per line (default: synthetic users)")
+    parser.add_argument("--domain", default="loadtest.example.com", help="Domain of the synthetic users")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="Output format")
+    parser.add_argument("--output", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--key-file", default=settings.signing_key_file, help="PEM signing key (created if missing)")
+    parser.add_argument(
+        "--algorithm", choices=SUPPORTED_ALGORITHMS, default=settings.signing_algorithm, help="Signing algorithm"
+    )
+    parser.add_argument("--issuer", default=f"http://localhost:{settings.port}", help="Token issuer (server URL)")
+    parser.add_argument("--client-id", default="load-test", help="Audience of the ID tokens")
+    parser.add_argument("--scope", default="openid profile email", help="Scope of the access tokens")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Tokens per worker job")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point della CLI"""
+    args = build_parser().parse_args(argv)
+    if args.emails_file is None and args.count is None:
+        args.count = 1000
+
+    start = time.perf_counter()
+    if args.output == "-":
+        written = mint(args, sys.stdout)
+    else:
+        with open(args.output, "w", encoding="utf-8", newline="") as out:
+            written = mint(args, out)
+
+    elapsed = time.perf_counter() - start
+    print(f"Minted {written} tokens in {elapsed:.2f}s ({written / elapsed:.0f} token/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""
+Mock Users - Indice degli utenti pre-configurati caricati da file o variabile d'ambiente
+
+Gli utenti vengono indicizzati per username (lookup O(1)) con la password già hashata,
+così ogni login costa un accesso al dizionario e un hash. Formati supportati:
+
+    .json         lista di utenti (o {"users": [...]})
+    .ndjson/.jsonl un utente per riga, letto in streaming (adatto a 100k+ utenti)
+    .yaml/.yml    come JSON (richiede il pacchetto opzionale `pyyaml`)
+    .csv          colonne username, password (o password_hash) e claims opzionali;
+                  roles e groups separati da ";"
+
+Ogni utente ha username e password (in chiaro) oppure password_hash ("sha256:<hex>");
+i claims generati dall'email al primo login vengono completati (o sovrascritti) da
+quelli indicati per l'utente, così anche un file con poche colonne produce claims completi.
+L'indice viene caricato all'avvio e, quando il file cambia (data di modifica o dimensione),
+ricaricato in background: il login non legge mai il file.
+"""
+
+import csv
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from claims_generator import generate_claims_from_email
+from config import MOCK_USERS, file_version, on_config_reload, settings
+
+logger = logging.getLogger(__name__)
+
+# Colonne CSV che non sono claims
+_CREDENTIAL_FIELDS = ("username", "password", "password_hash")
+# Claims CSV multi-valore
+_LIST_CLAIMS = ("roles", "groups")
+
+# username -> (digest SHA-256 della password, claims da applicare su quelli generati o None)
+UserEntry = Tuple[bytes, Optional[Dict]]
+
+
+def hash_password(password: str) -> bytes:
+    """Digest della password confrontato al login"""
+    return hashlib.sha256(password.encode("utf-8")).digest()
+
+
+def _password_digest(record: Dict) -> bytes:
+    """Digest della password di un utente (in chiaro o già hashata come "sha256:<hex>")"""
+    password_hash = record.get("password_hash")
+    if password_hash:
+        scheme, _, hex_digest = password_hash.partition(":")
+        if scheme != "sha256" or len(hex_digest) != 64:
+            raise ValueError(f"Unsupported password_hash for user {record.get('username')}: expected sha256:<hex>")
+        return bytes.fromhex(hex_digest)
+    return hash_password(record["password"])
+
+
+def _iter_json_records(data) -> Iterator[Dict]:
+    if isinstance(data, dict):
+        data = data.get("users", [])
+    if not isinstance(data, list):
+        raise ValueError('Mock users must be a list of users (or {"users": [...]})')
+    yield from data
+
+
+def _iter_csv_records(f) -> Iterator[Dict]:
+    for row in csv.DictReader(f):
+        record = {name: row.get(name) for name in _CREDENTIAL_FIELDS if row.get(name)}
+        claims = {}
+        for name, value in row.items():
+            if name in _CREDENTIAL_FIELDS or not value:
+                continue
+            claims[name] = [v.strip() for v in value.split(";") if v.strip()] if name in _LIST_CLAIMS else value
+        if claims:
+            record["claims"] = claims
+        yield record
+
+
+def iter_user_records(path: str) -> Iterator[Dict]:
+    """
+    Legge gli utenti dal file (in streaming per NDJSON e CSV)
+
+    Raises:
+        ValueError: Se il formato non è supportato o il contenuto non è valido
+        RuntimeError: Se il file è YAML e pyyaml non è installato
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline="") as f:
+        if extension in (".ndjson", ".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == ".json":
+            yield from _iter_json_records(json.load(f))
+        elif extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError as e:
+                raise RuntimeError("Loading mock users from YAML requires the 'pyyaml' package") from e
+            yield from _iter_json_records(yaml.safe_load(f) or [])
+        elif extension == ".csv":
+            yield from _iter_csv_records(f)
+        else:
+            raise ValueError(f"Unsupported mock users file format: {extension}")
+
+
+def build_index(records) -> Dict[str, UserEntry]:
+    """
+    Costruisce l'indice username -> (digest password, claims)
+
+    Raises:
+        ValueError: Se un utente non è un oggetto, non ha username o password o ha campi del tipo sbagliato
+    """
+    index: Dict[str, UserEntry] = {}
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Invalid mock user: expected an object, got {type(record).__name__}")
+        username = record.get("username")
+        secret = record.get("password") or record.get("password_hash")
+        if not isinstance(username, str) or not username or not isinstance(secret, str) or not secret:
+            raise ValueError("Invalid mock user: username and password (or password_hash) are required strings")
+        claims = record.get("claims")
+        if claims is not None and not isinstance(claims, dict):
+            raise ValueError(f"Invalid mock user {username}: claims must be an object")
+        index[username] = (_password_digest(record), claims or None)
+    return index
+
+
+class UserIndex:
+    """
+    Indice degli utenti pre-configurati
+
+    L'indice viene caricato all'avvio (load) e ricaricato da un task in background quando il
+    file cambia (refresh), entrambi fuori dall'event loop: il login fa solo un lookup nel dizionario.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        inline_json: Optional[str] = None,
+        users: Optional[List[Dict]] = None,
+    ):
+        """
+        Args:
+            path: File degli utenti (JSON, NDJSON, YAML o CSV)
+            inline_json: Utenti come stringa JSON (es. da variabile d'ambiente)
+            users: Utenti già in memoria (es. MOCK_USERS di config.py)
+        """
+        self.path = path
+        self.inline_json = inline_json
+        self.users = users
+        self.reload_count = 0
+        self._index: Optional[Dict[str, UserEntry]] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """True se è configurata almeno una sorgente di utenti (altrimenti login dinamico)"""
+        return bool(self.path or self.inline_json or self.users is not None)
+
+    def _load(self) -> Dict[str, UserEntry]:
+        """Legge tutte le sorgenti configurate (il file ha la precedenza in caso di username duplicati)"""
+        index: Dict[str, UserEntry] = {}
+        if self.users is not None:
+            index.update(build_index(self.users))
+        if self.inline_json:
+            index.update(build_index(_iter_json_records(json.loads(self.inline_json))))
+        if self.path:
+            index.update(build_index(iter_user_records(self.path)))
+        return index
+
+    def _get_index(self) -> Dict[str, UserEntry]:
+        """
+        Restituisce l'indice corrente
+
+        Il caricamento qui è solo un ripiego per l'uso fuori dall'app (indice non caricato con load).
+        """
+        index = self._index
+        if index is not None:
+            return index
+        with self._lock:
+            if self._index is None:
+                version = file_version(self.path)
+                self._index, self._version = self._load(), version
+            return self._index
+
+    def load(self) -> None:
+        """
+        Carica l'indice (all'avvio dell'app, fuori dall'event loop)
+
+        Raises:
+            ValueError, OSError, RuntimeError: Se gli utenti configurati non sono validi
+        """
+        if self.enabled:
+            self._get_index()
+
+    def refresh(self) -> bool:
+        """
+        Ricarica l'indice se il file degli utenti è cambiato (chiamata periodicamente in background)
+
+        Un file a metà scrittura o non valido lascia in uso l'indice precedente e viene riletto
+        solo dopo una nuova modifica.
+
+        Returns:
+            True se l'indice è stato sostituito
+        """
+        if not self.path:
+            return False
+        with self._lock:
+            version = file_version(self.path)
+            if self._index is not None and version == self._version:
+                return False
+            try:
+                new_index = self._load()
+            except (OSError, ValueError, RuntimeError):
+                self._version = version
+                if self._index is None:
+                    raise
+                logger.exception(f"Failed to reload mock users from {self.path} - keeping the previous users")
+                return False
+
+            if self._index is not None:
+                self.reload_count += 1
+                logger.info(f"Reloaded {len(new_index)} mock users from {self.path}")
+            # Sostituzione atomica: le richieste in corso continuano a usare l'indice precedente
+            self._index, self._version = new_index, version
+            return True
+
+    def authenticate(self, username: str, password: str) -> Optional[Dict]:
+        """
+        Verifica le credenziali
+
+        Returns:
+            Claims dell'utente, oppure None se l'utente non esiste o la password è errata
+        """
+        entry = self._get_index().get(username)
+        if entry is None or not hmac.compare_digest(entry[0], hash_password(password)):
+            return None
+        generated = generate_claims_from_email(username)
+        return generated if entry[1] is None else {**generated, **entry[1]}
+
+    def reconfigure(self, path: Optional[str], inline_json: Optional[str], users: Optional[List[Dict]]) -> None:
+        """
+        Applica nuove sorgenti degli utenti (dopo un reload della configurazione)
+
+        Gli utenti vengono caricati subito, nel thread del reload e fuori dal percorso dei login;
+        se il caricamento fallisce resta in uso l'indice precedente.
+        """
+        with self._lock:
+            self.path, self.inline_json, self.users = path, inline_json, users
+            if not self.enabled:
+                self._index = None
+                return
+            version = file_version(path)
+            try:
+                new_index = self._load()
+            except (OSError, ValueError, RuntimeError):
+                self._version = version
+                logger.exception("Failed to load mock users after a configuration change - keeping the previous users")
+                return
+            if self._index is not None:
+                self.reload_count += 1
+            self._index, self._version = new_index, version
+
+    def invalidate(self) -> None:
+        """Scarta l'indice: verrà ricaricato alla prossima richiesta"""
+        with self._lock:
+            self._index = None
+            self._version = None
+
+    def stats(self) -> Dict:
+        """Restituisce numero di utenti caricati e ricaricamenti"""
+        index = self._index
+        return {"users": len(index) if index is not None else 0, "reloads": self.reload_count}
+
+    def __len__(self) -> int:
+        return len(self._get_index()) if self.enabled else 0
+
+
+# Istanza globale del servizio
+user_index = UserIndex(path=settings.mock_users_file, inline_json=settings.mock_users_json, users=MOCK_USERS)
+
+
+@on_config_reload
+def _reconfigure_user_index() -> None:
+    """Applica le sorgenti degli utenti della nuova configurazione"""
+    import config
+
+    user_index.reconfigure(settings.mock_users_file, settings.mock_users_json, config.MOCK_USERS)
@@ -1,3 +1,4 @@
+import time
 from typing import List, Optional
 
 from pydantic import BaseModel
@@ -35,6 +36,7 @@ class DiscoveryResponse(BaseModel):
     userinfo_endpoint: str
     jwks_uri: str
     revocation_endpoint: str
+    introspection_endpoint: Optional[str] = None
     end_session_endpoint: str
     response_types_supported: List[str]
     subject_types_supported: List[str] = ["public"]
@@ -70,9 +72,14 @@ class JWK(BaseModel):
     kty: str
     use: str
     kid: str
-    n: str
-    e: str
     alg: str = "RS256"
+    # RSA
+    n: Optional[str] = None
+    e: Optional[str] = None
+    # EC / OKP
+    crv: Optional[str] = None
+    x: Optional[str] = None
+    y: Optional[str] = None
 
 
 class JWKSResponse(BaseModel):
@@ -98,6 +105,23 @@ class UserInfoResponse(BaseModel):
     groups: Optional[List[str]] = None
 
 
+class TokenBatchRequest(BaseModel):
+    """Request dell'endpoint di emissione massiva dei token"""
+
+    # Utenti sintetici: email (claims generati) e/o claim set completi
+    emails: List[str] = []
+    users: List[dict] = []
+    client_id: str = "load-test"
+    scope: str = "openid profile email"
+
+
+class IntrospectionBatchRequest(BaseModel):
+    """Request dell'introspection batch: più token in una sola chiamata"""
+
+    tokens: List[str]
+    token_type_hint: Optional[str] = None
+
+
 class AuthorizationCode:
     """Authorization code con i dati associati"""
 
@@ -111,6 +135,7 @@ class AuthorizationCode:
         code_challenge: Optional[str] = None,
         code_challenge_method: Optional[str] = None,
         nonce: Optional[str] = None,
+        created_at: Optional[float] = None,
     ):
         self.code = code
         self.client_id = client_id
@@ -120,3 +145,27 @@ class AuthorizationCode:
         self.code_challenge = code_challenge
         self.code_challenge_method = code_challenge_method
         self.nonce = nonce
+        self.created_at = created_at if created_at is not None else time.time()
+
+    def is_expired(self, expiry: int) -> bool:
+        """Verifica se sono trascorsi più di `expiry` secondi dalla creazione"""
+        return time.time() - self.created_at > expiry
+
+    def to_dict(self) -> dict:
+        """Serializza l'authorization code per lo storage"""
+        return {
+            "code": self.code,
+            "client_id": self.client_id,
+            "redirect_uri": self.redirect_uri,
+            "scope": self.scope,
+            "user_claims": self.user_claims,
+            "code_challenge": self.code_challenge,
+            "code_challenge_method": self.code_challenge_method,
+            "nonce": self.nonce,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AuthorizationCode":
+        """Ricostruisce l'authorization code dai dati salvati nello storage"""
+        return cls(**data)
@@ -0,0 +1,255 @@
+"""
+Refresh Token Service - Ciclo di vita dei refresh token (scadenza, rotazione, limiti per utente)
+"""
+
+import hashlib
+import json
+import logging
+import secrets
+import time
+from typing import Dict, Optional
+
+from config import settings
+from storage import Store, create_store
+from token_service import token_service
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshTokenService:
+    """
+    Servizio per emissione, riscatto e revoca dei refresh token
+
+    I claims dell'utente non vengono copiati in ogni refresh token: sono salvati una sola
+    volta per contenuto (claim set "internato", indicizzato dal suo hash) e ogni token
+    ne conserva solo il riferimento.
+
+    In modalità stateless (STATELESS_TOKENS) i token sono self-contained e lo storage
+    contiene solo le revoche e, con la rotazione attiva, i jti già usati.
+    """
+
+    def __init__(self, tokens: Store, claim_sets: Store, index: Store):
+        """
+        Args:
+            tokens: Store token -> metadati del refresh token
+            claim_sets: Store hash -> claims dell'utente condivisi tra i token
+            index: Store per gli indici utente/client e famiglie di rotazione
+        """
+        self.tokens = tokens
+        self.claim_sets = claim_sets
+        self.index = index
+        self.reuse_detected_count = 0
+
+    def _intern_claims(self, user_claims: Dict) -> str:
+        """Salva il claim set (una volta per contenuto) e ne restituisce il riferimento"""
+        canonical = json.dumps(user_claims, sort_keys=True, separators=(",", ":"))
+        claims_ref = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        # La scadenza viene estesa ad ogni emissione: il claim set vive almeno quanto l'ultimo token
+        self.claim_sets.set(claims_ref, user_claims, ttl=settings.refresh_token_expiry)
+        return claims_ref
+
+    def _enforce_user_cap(self, token: str, sub: Optional[str], client_id: Optional[str]) -> None:
+        """Registra il token nell'indice utente/client ed elimina i più vecchi oltre il limite"""
+        max_tokens = settings.refresh_token_max_per_user
+        if max_tokens <= 0:
+            return
+
+        index_key = f"user:{sub}:{client_id}"
+        entry = self.index.get(index_key) or {"tokens": []}
+        user_tokens = entry["tokens"] + [token]
+        if len(user_tokens) > max_tokens:
+            # Scarta prima i riferimenti a token già scaduti, ruotati o revocati
+            user_tokens = [t for t in user_tokens if t in self]
+            while len(user_tokens) > max_tokens:
+                self.revoke(user_tokens.pop(0))
+        self.index.set(index_key, {"tokens": user_tokens}, ttl=settings.refresh_token_expiry)
+
+    def issue(self, user_claims: Dict, scope: str, client_id: Optional[str], family_id: Optional[str] = None) -> str:
+        """
+        Emette un nuovo refresh token
+
+        Args:
+            user_claims: Claims dell'utente
+            scope: Scopes concessi
+            client_id: Client ID dell'applicazione
+            family_id: Famiglia di rotazione (None per un nuovo login)
+
+        Returns:
+            Refresh token opaco
+        """
+        family_id = family_id or secrets.token_urlsafe(16)
+        if settings.stateless_tokens:
+            return token_service.generate_refresh_token(
+                data={"user_claims": user_claims, "scope": scope, "client_id": client_id, "family_id": family_id}
+            )
+
+        token = token_service.generate_refresh_token()
+
+        self.tokens.set(
+            token,
+            {
+                "claims_ref": self._intern_claims(user_claims),
+                "scope": scope,
+                "client_id": client_id,
+                "family_id": family_id,
+                "exp": int(time.time()) + settings.refresh_token_expiry,
+            },
+            ttl=settings.refresh_token_expiry,
+        )
+        if settings.refresh_token_rotation:
+            self.index.set(f"family:{family_id}", {"current": token}, ttl=settings.refresh_token_expiry)
+        self._enforce_user_cap(token, user_claims.get("sub"), client_id)
+        return token
+
+    def redeem(self, token: str) -> Optional[Dict]:
+        """
+        Riscatta un refresh token
+
+        Con la rotazione attiva il token viene consumato e ne viene emesso uno nuovo nella stessa
+        famiglia; il riutilizzo di un token già ruotato revoca l'intera famiglia.
+
+        Returns:
+            Dict con user_claims, scope, client_id e refresh_token (nuovo token o None senza rotazione),
+            oppure None se il token non è valido
+
+        Raises:
+            ValueError: Se viene rilevato il riutilizzo di un token già ruotato
+        """
+        if settings.stateless_tokens:
+            return self._redeem_stateless(token)
+
+        if not settings.refresh_token_rotation:
+            data = self.tokens.get(token)
+            if not data or data.get("rotated"):
+                return None
+            user_claims = self.claim_sets.get(data["claims_ref"])
+            if user_claims is None:
+                return None
+            return {
+                "user_claims": user_claims,
+                "scope": data["scope"],
+                "client_id": data["client_id"],
+                "refresh_token": None,
+            }
+
+        data = self.tokens.pop(token)
+        if not data:
+            return None
+
+        if data.get("rotated"):
+            # Token già ruotato riutilizzato: possibile furto, revoca tutta la famiglia
+            self.reuse_detected_count += 1
+            family = self.index.pop(f"family:{data['family_id']}")
+            if family:
+                self.tokens.delete(family["current"])
+            logger.warning(f"Refresh token reuse detected - family {data['family_id']} revoked")
+            raise ValueError("Refresh token reuse detected")
+
+        user_claims = self.claim_sets.get(data["claims_ref"])
+        if user_claims is None:
+            return None
+
+        new_token = self.issue(user_claims, data["scope"], data["client_id"], family_id=data["family_id"])
+        # Il vecchio token resta come marcatore per rilevarne il riutilizzo
+        self.tokens.set(token, {"rotated": True, "family_id": data["family_id"]}, ttl=settings.refresh_token_expiry)
+        return {
+            "user_claims": user_claims,
+            "scope": data["scope"],
+            "client_id": data["client_id"],
+            "refresh_token": new_token,
+        }
+
+    def _open_stateless(self, token: str) -> Optional[Dict]:
+        """Decifra un refresh token self-contained, restituendo None se non valido o revocato"""
+        if not token.startswith("refresh_"):
+            return None
+        try:
+            payload = token_service.open_token("refresh", token[len("refresh_") :])
+        except ValueError:
+            return None
+        if f"revoked:{payload['jti']}" in self.index or f"family_revoked:{payload['family_id']}" in self.index:
+            return None
+        return payload
+
+    def _redeem_stateless(self, token: str) -> Optional[Dict]:
+        """Riscatta un refresh token self-contained"""
+        payload = self._open_stateless(token)
+        if payload is None:
+            return None
+
+        new_token = None
+        if settings.refresh_token_rotation:
+            # Cache di replay: ogni jti può essere usato una sola volta fino alla sua scadenza
+            if not self.index.add(f"used:{payload['jti']}", {}, ttl=payload["exp"] - time.time()):
+                self.reuse_detected_count += 1
+                self.index.set(f"family_revoked:{payload['family_id']}", {}, ttl=settings.refresh_token_expiry)
+                logger.warning(f"Refresh token reuse detected - family {payload['family_id']} revoked")
+                raise ValueError("Refresh token reuse detected")
+            new_token = self.issue(
+                payload["user_claims"], payload["scope"], payload["client_id"], family_id=payload["family_id"]
+            )
+
+        return {
+            "user_claims": payload["user_claims"],
+            "scope": payload["scope"],
+            "client_id": payload["client_id"],
+            "refresh_token": new_token,
+        }
+
+    def revoke(self, token: str) -> None:
+        """Revoca un refresh token (e la sua famiglia di rotazione)"""
+        if settings.stateless_tokens:
+            payload = self._open_stateless(token)
+            if payload is not None:
+                self.index.set(f"revoked:{payload['jti']}", {}, ttl=payload["exp"] - time.time())
+            return
+
+        data = self.tokens.pop(token)
+        if data and not data.get("rotated") and settings.refresh_token_rotation:
+            self.index.delete(f"family:{data['family_id']}")
+
+    def introspect(self, token: str) -> Optional[Dict]:
+        """
+        Restituisce i metadati di un refresh token attivo senza consumarlo
+
+        Returns:
+            Dict con sub, scope, client_id ed exp (se nota), oppure None se il token non è valido,
+            già ruotato o revocato
+        """
+        if settings.stateless_tokens:
+            payload = self._open_stateless(token)
+            if payload is None or f"used:{payload['jti']}" in self.index:
+                return None
+            return {
+                "sub": payload["user_claims"].get("sub"),
+                "scope": payload["scope"],
+                "client_id": payload["client_id"],
+                "exp": payload["exp"],
+            }
+
+        data = self.tokens.get(token)
+        if not data or data.get("rotated"):
+            return None
+        user_claims = self.claim_sets.get(data["claims_ref"])
+        if user_claims is None:
+            return None
+        return {
+            "sub": user_claims.get("sub"),
+            "scope": data["scope"],
+            "client_id": data["client_id"],
+            "exp": data.get("exp"),
+        }
+
+    def __contains__(self, token: str) -> bool:
+        if settings.stateless_tokens:
+            payload = self._open_stateless(token)
+            return payload is not None and f"used:{payload['jti']}" not in self.index
+
+        data = self.tokens.get(token)
+        return bool(data) and not data.get("rotated")
+
+
+# Istanza globale del servizio
+refresh_token_service = RefreshTokenService(
+    create_store("refresh_tokens"), create_store("claim_sets"), create_store("refresh_token_index")
+)
@@ -0,0 +1,195 @@
+"""
+Signing Algorithms - Algoritmi di firma supportati per i JWT (RS256, PS256, ES256, EdDSA)
+
+python-jose supporta nativamente RS256 ed ES256; PS256 ed EdDSA vengono registrati qui
+come chiavi aggiuntive, così firma e verifica passano comunque da jwt.encode/jwt.decode.
+"""
+
+import abc
+import base64
+import hashlib
+import json
+from typing import Dict
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from jose import jwk
+from jose.backends.base import Key
+from jose.exceptions import JWKError
+
+SUPPORTED_ALGORITHMS = ("RS256", "PS256", "ES256", "EdDSA")
+
+
+def _b64url(value: bytes) -> str:
+    """Codifica bytes in base64url senza padding"""
+    return base64.urlsafe_b64encode(value).rstrip(b"=").decode("utf-8")
+
+
+def _load_pem_key(key):
+    """Carica una chiave (pubblica o privata) da PEM, restituendo gli oggetti già caricati così come sono"""
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    if not isinstance(key, bytes):
+        return key
+    try:
+        return serialization.load_pem_public_key(key, backend=default_backend())
+    except ValueError:
+        return serialization.load_pem_private_key(key, password=None, backend=default_backend())
+
+
+class _CryptographyKey(Key, abc.ABC):
+    """Chiave python-jose basata su un oggetto chiave della libreria cryptography (astratta: firma e verifica)"""
+
+    private_types: tuple = ()
+    public_types: tuple = ()
+
+    def __init__(self, key, algorithm):
+        self._algorithm = algorithm
+        try:
+            self.prepared_key = _load_pem_key(key)
+        except Exception as e:
+            raise JWKError(e) from e
+        if not isinstance(self.prepared_key, self.private_types + self.public_types):
+            raise JWKError(f"Invalid key type for {algorithm}")
+
+    def is_public(self) -> bool:
+        return isinstance(self.prepared_key, self.public_types)
+
+    def public_key(self):
+        if self.is_public():
+            return self
+        return type(self)(self.prepared_key.public_key(), self._algorithm)
+
+    def verify(self, msg: bytes, sig: bytes) -> bool:
+        key = self.prepared_key if self.is_public() else self.prepared_key.public_key()
+        try:
+            self._verify(key, msg, sig)
+            return True
+        except InvalidSignature:
+            return False
+
+    @abc.abstractmethod
+    def sign(self, msg: bytes) -> bytes:
+        """Firma il messaggio con la chiave privata"""
+
+    @abc.abstractmethod
+    def _verify(self, key, msg: bytes, sig: bytes) -> None:
+        """Verifica la firma con la chiave pubblica (solleva InvalidSignature se non valida)"""
+
+    def to_dict(self) -> Dict:
+        key = self.prepared_key if self.is_public() else self.prepared_key.public_key()
+        return {"alg": self._algorithm, **public_jwk_params(key)}
+
+
+class PSSKey(_CryptographyKey):
+    """Chiave RSASSA-PSS con SHA-256 (PS256)"""
+
+    private_types = (rsa.RSAPrivateKey,)
+    public_types = (rsa.RSAPublicKey,)
+    # RFC 7518 §3.5: salt della stessa lunghezza dell'hash
+    _padding = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=32)
+
+    def sign(self, msg: bytes) -> bytes:
+        return self.prepared_key.sign(msg, self._padding, hashes.SHA256())
+
+    def _verify(self, key, msg: bytes, sig: bytes) -> None:
+        key.verify(sig, msg, self._padding, hashes.SHA256())
+
+
+class EdDSAKey(_CryptographyKey):
+    """Chiave Ed25519 (EdDSA)"""
+
+    private_types = (ed25519.Ed25519PrivateKey,)
+    public_types = (ed25519.Ed25519PublicKey,)
+
+    def sign(self, msg: bytes) -> bytes:
+        return self.prepared_key.sign(msg)
+
+    def _verify(self, key, msg: bytes, sig: bytes) -> None:
+        key.verify(sig, msg)
+
+
+jwk.register_key("PS256", PSSKey)
+jwk.register_key("EdDSA", EdDSAKey)
+
+
+def generate_private_key(algorithm: str):
+    """Genera una chiave privata adatta all'algoritmo di firma"""
+    if algorithm in ("RS256", "PS256"):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1(), backend=default_backend())
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+
+def generate_private_key_der(algorithm: str) -> bytes:
+    """
+    Genera una chiave privata e la restituisce serializzata (PKCS8 DER)
+
+    Funzione di modulo (serializzabile con pickle) pensata per l'esecuzione in un processo
+    separato: gli oggetti chiave di cryptography non attraversano il confine tra processi.
+    """
+    return generate_private_key(algorithm).private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+def check_private_key(private_key, algorithm: str) -> None:
+    """
+    Verifica che la chiave privata sia compatibile con l'algoritmo
+
+    Raises:
+        ValueError: Se il tipo di chiave non corrisponde all'algoritmo
+    """
+    if algorithm in ("RS256", "PS256"):
+        valid = isinstance(private_key, rsa.RSAPrivateKey)
+    elif algorithm == "ES256":
+        valid = isinstance(private_key, ec.EllipticCurvePrivateKey) and isinstance(private_key.curve, ec.SECP256R1)
+    elif algorithm == "EdDSA":
+        valid = isinstance(private_key, ed25519.Ed25519PrivateKey)
+    else:
+        raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+    if not valid:
+        raise ValueError(f"Signing key type does not match algorithm {algorithm}")
+
+
+def public_jwk_params(public_key) -> Dict:
+    """Restituisce i parametri JWK (kty e parametri pubblici) di una chiave pubblica"""
+    if isinstance(public_key, rsa.RSAPublicKey):
+        numbers = public_key.public_numbers()
+        return {
+            "kty": "RSA",
+            "n": _b64url(numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, byteorder="big")),
+            "e": _b64url(numbers.e.to_bytes((numbers.e.bit_length() + 7) // 8, byteorder="big")),
+        }
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        numbers = public_key.public_numbers()
+        return {
+            "kty": "EC",
+            "crv": "P-256",
+            "x": _b64url(numbers.x.to_bytes(32, byteorder="big")),
+            "y": _b64url(numbers.y.to_bytes(32, byteorder="big")),
+        }
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw)
+        return {"kty": "OKP", "crv": "Ed25519", "x": _b64url(raw)}
+    raise ValueError("Unsupported public key type")
+
+
+def jwk_thumbprint(public_key) -> str:
+    """
+    Thumbprint JWK SHA-256 della chiave pubblica (RFC 7638), usato come kid
+
+    Il kid dipende solo dalla chiave: repliche che ruotano indipendentemente non possono
+    pubblicare chiavi diverse con lo stesso kid.
+    """
+    # public_jwk_params contiene esattamente i membri richiesti dalla RFC 7638 §3.2
+    canonical = json.dumps(public_jwk_params(public_key), sort_keys=True, separators=(",", ":"))
+    return _b64url(hashlib.sha256(canonical.encode("utf-8")).digest())
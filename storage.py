@@ -0,0 +1,342 @@
+"""
+Storage - Backend pluggabili per authorization codes, refresh tokens e token revocati
+
+Backend disponibili (STORAGE_BACKEND):
+    memory  - dizionario in-process (default, un solo worker)
+    sqlite  - file SQLite in modalità WAL condiviso tra i worker dello stesso nodo
+    redis   - server Redis (o compatibile) condiviso tra worker e repliche
+"""
+
+import heapq
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+
+
+class StoreBusyError(Exception):
+    """Sollevata quando lo storage non risponde entro il timeout (lock SQLite conteso, Redis lento o irraggiungibile)"""
+
+
+class Store(ABC):
+    """Interfaccia di uno store chiave/valore per i dati di sessione (valori dict serializzabili in JSON)"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        # Numero di chiavi rimosse perché scadute (dall'avvio del processo)
+        self.expired_count = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict]:
+        """Restituisce il valore associato alla chiave, o None se assente o scaduto"""
+
+    @abstractmethod
+    def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        """Salva il valore per la chiave, sovrascrivendo quello esistente (ttl in secondi, None = senza scadenza)"""
+
+    @abstractmethod
+    def add(self, key: str, value: Dict, ttl: Optional[float] = None) -> bool:
+        """Salva il valore solo se la chiave è assente (atomico); restituisce True se è stato salvato"""
+
+    @abstractmethod
+    def pop(self, key: str) -> Optional[Dict]:
+        """Rimuove e restituisce atomicamente il valore (garantisce un solo consumatore)"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Rimuove la chiave se presente"""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Rimuove le chiavi scadute e restituisce quante ne sono state rimosse"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Numero di chiavi nello store"""
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def stats(self) -> Dict[str, int]:
+        """Restituisce il numero di chiavi vive e di quelle scadute"""
+        return {"live": len(self), "expired": self.expired_count}
+
+
+class MemoryStore(Store):
+    """Store in-process basato su dizionario, con scadenze gestite da un heap"""
+
+    def __init__(self, namespace: str):
+        super().__init__(namespace)
+        # key -> (valore, scadenza assoluta o None)
+        self._data: Dict[str, Tuple[Dict, Optional[float]]] = {}
+        # Heap (scadenza, key): le voci obsolete (chiave riscritta o cancellata) vengono ignorate nello sweep
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            self.expired_count += 1
+            return None
+        return value
+
+    def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+
+    def add(self, key: str, value: Dict, ttl: Optional[float] = None) -> bool:
+        if self.get(key) is not None:
+            return False
+        self.set(key, value, ttl=ttl)
+        return True
+
+    def pop(self, key: str) -> Optional[Dict]:
+        value = self.get(key)
+        if value is not None:
+            del self._data[key]
+        return value
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def sweep(self) -> int:
+        now = time.time()
+        removed = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+                removed += 1
+        self.expired_count += removed
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore(Store):
+    """Store su file SQLite in modalità WAL, condivisibile tra processi dello stesso nodo"""
+
+    def __init__(self, namespace: str, path: str, timeout: float = 1.0):
+        """
+        Args:
+            namespace: Nome logico dello store
+            path: File del database
+            timeout: Secondi di attesa massima di un lock conteso da un altro processo: gli store
+                sono usati dagli endpoint async, quindi l'attesa blocca l'event loop del worker
+        """
+        super().__init__(namespace)
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # isolation_level=None: autocommit, le transazioni sono gestite esplicitamente
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Accesso esclusivo alla connessione; un database bloccato oltre il timeout solleva StoreBusyError"""
+        with self._lock:
+            try:
+                yield
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                raise StoreBusyError(f"SQLite store {self.namespace} locked for more than {self.timeout}s") from e
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._locked():
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self.namespace, key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._locked():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires_at),
+            )
+
+    def add(self, key: str, value: Dict, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._locked():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Una riga scaduta non ancora rimossa dallo sweep non deve bloccare l'inserimento
+                self._conn.execute(
+                    "DELETE FROM kv WHERE namespace = ? AND key = ? AND expires_at <= ?", (self.namespace, key, now)
+                )
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value), expires_at),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def pop(self, key: str) -> Optional[Dict]:
+        with self._locked():
+            # BEGIN IMMEDIATE acquisisce subito il lock in scrittura: un solo processo legge e cancella
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (self.namespace, key, time.time()),
+                ).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return json.loads(row[0]) if row else None
+
+    def delete(self, key: str) -> None:
+        with self._locked():
+            self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def sweep(self) -> int:
+        with self._locked():
+            cursor = self._conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time())
+            )
+        self.expired_count += cursor.rowcount
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._locked():
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self.namespace, time.time()),
+            ).fetchone()[0]
+
+
+class RedisStore(Store):
+    """Store su Redis (richiede il pacchetto opzionale `redis`)"""
+
+    def __init__(
+        self,
+        namespace: str,
+        url: Optional[str] = None,
+        client=None,
+        key_prefix: str = "mockoidc:",
+        timeout: float = 1.0,
+    ):
+        """
+        Args:
+            namespace: Nome logico dello store
+            url: URL del server Redis (ignorato se client è indicato)
+            client: Client Redis già configurato
+            key_prefix: Prefisso comune delle chiavi
+            timeout: Secondi massimi di connessione e di risposta del server (le chiamate bloccano l'event loop)
+        """
+        super().__init__(namespace)
+        try:
+            import redis
+        except ImportError as e:
+            if client is None:
+                raise RuntimeError("The redis storage backend requires the 'redis' package") from e
+            redis = None
+        if client is None:
+            client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._client = client
+        self._prefix = f"{key_prefix}{namespace}:"
+        self._errors: tuple = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) if redis else ()
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}{key}"
+
+    @contextmanager
+    def _unavailable_as_busy(self) -> Iterator[None]:
+        """Converte timeout ed errori di connessione di Redis in StoreBusyError"""
+        try:
+            yield
+        except self._errors as e:
+            raise StoreBusyError(f"Redis store {self.namespace} unavailable: {str(e)}") from e
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._unavailable_as_busy():
+            raw = self._client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        # Redis gestisce la scadenza lato server (PX in millisecondi)
+        px = max(1, int(ttl * 1000)) if ttl is not None else None
+        with self._unavailable_as_busy():
+            self._client.set(self._key(key), json.dumps(value), px=px)
+
+    def add(self, key: str, value: Dict, ttl: Optional[float] = None) -> bool:
+        px = max(1, int(ttl * 1000)) if ttl is not None else None
+        with self._unavailable_as_busy():
+            return bool(self._client.set(self._key(key), json.dumps(value), px=px, nx=True))
+
+    def pop(self, key: str) -> Optional[Dict]:
+        # GETDEL è atomico lato server
+        with self._unavailable_as_busy():
+            raw = self._client.getdel(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def delete(self, key: str) -> None:
+        with self._unavailable_as_busy():
+            self._client.delete(self._key(key))
+
+    def sweep(self) -> int:
+        # Le chiavi scadute vengono rimosse da Redis stesso
+        return 0
+
+    def __len__(self) -> int:
+        with self._unavailable_as_busy():
+            return sum(1 for _ in self._client.scan_iter(match=f"{self._prefix}*"))
+
+
+def create_store(namespace: str, backend: Optional[str] = None) -> Store:
+    """
+    Crea uno store per il namespace indicato in base alla configurazione
+
+    Args:
+        namespace: Nome logico dello store (es. "authorization_codes")
+        backend: Backend da usare (se None, usa settings.storage_backend)
+
+    Returns:
+        Istanza di Store
+    """
+    backend = backend or settings.storage_backend
+
+    if backend == "memory":
+        return MemoryStore(namespace)
+    if backend == "sqlite":
+        return SQLiteStore(namespace, settings.storage_sqlite_path, timeout=settings.storage_timeout)
+    if backend == "redis":
+        return RedisStore(
+            namespace,
+            url=settings.storage_redis_url,
+            key_prefix=settings.storage_key_prefix,
+            timeout=settings.storage_timeout,
+        )
+
+    raise ValueError(f"Unsupported storage backend: {backend}")
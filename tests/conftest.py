@@ -61,3 +61,35 @@ def auth_params():
 def pkce_params():
     """Parametri PKCE per authorization request"""
     return {"code_challenge": "E9Melhoa2OwvFrEMTJguCHaoeK1t8URWbuGJSstw-cM", "code_challenge_method": "S256"}
+
+
+@pytest.fixture
+def obtain_tokens(test_client, auth_params):
+    """Esegue il flusso authorize -> token e restituisce la response JSON del token endpoint"""
+
+    def _obtain_tokens(username="test@example.com", password="test123"):
+        params = {**auth_params, "username": username, "password": password}
+        auth_response = test_client.get("/authorize", params=params, follow_redirects=False)
+        code = auth_response.headers["location"].split("code=")[1].split("&")[0]
+
+        token_data = {
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": auth_params["redirect_uri"],
+            "client_id": auth_params["client_id"],
+        }
+        return test_client.post("/token", data=token_data).json()
+
+    return _obtain_tokens
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    """File di configurazione temporaneo; la configurazione originale viene ripristinata alla fine"""
+    import config
+
+    saved = (config.settings.snapshot(), config.DYNAMIC_CLAIMS_CONFIG, config.MOCK_USERS)
+    path = tmp_path / "config.json"
+    monkeypatch.setattr(config.settings, "config_file", str(path))
+    yield path
+    config.apply_config(*saved)
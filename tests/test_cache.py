@@ -0,0 +1,66 @@
+"""
+Unit tests per il modulo cache
+"""
+
+import pytest
+
+from cache import LRUCache
+
+
+class TestLRUCache:
+    """Test per la cache LRU"""
+
+    def test_get_returns_stored_value(self):
+        """Verifica che un valore inserito venga restituito"""
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert "a" in cache
+
+    def test_get_missing_returns_default(self):
+        """Verifica che una chiave assente restituisca il default"""
+        cache = LRUCache(maxsize=2)
+
+        assert cache.get("missing") is None
+        assert cache.get("missing", "default") == "default"
+
+    def test_evicts_least_recently_used(self):
+        """Verifica che venga scartato l'elemento usato meno di recente"""
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert len(cache) == 2
+
+    def test_stats_count_hits_and_misses(self):
+        """Verifica i contatori hit/miss"""
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+
+        stats = cache.stats()
+        assert stats == {"size": 1, "maxsize": 2, "hits": 1, "misses": 1}
+
+    def test_pop_and_clear(self):
+        """Verifica la rimozione di singole chiavi e lo svuotamento"""
+        cache = LRUCache(maxsize=4)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        assert cache.pop("a") == 1
+        assert "a" not in cache
+
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_invalid_maxsize_raises(self):
+        """Verifica che maxsize non positivo sollevi un errore"""
+        with pytest.raises(ValueError):
+            LRUCache(maxsize=0)
@@ -2,7 +2,23 @@
 Unit tests per il modulo claims_generator
 """
 
-from claims_generator import generate_claims_from_email, generate_deterministic_uuid
+import json
+import pickle
+import re
+from itertools import count, islice
+
+import pytest
+
+import config
+from claims_generator import (
+    clear_claims_cache,
+    generate_claims_bulk,
+    generate_claims_columns,
+    generate_claims_from_email,
+    generate_deterministic_uuid,
+    generate_deterministic_uuids,
+    get_claims_cache_stats,
+)
 
 
 class TestGenerateClaimsFromEmail:
@@ -132,8 +148,6 @@ class TestGenerateClaimsFromEmail:
 
     def test_generate_claims_uuid_format(self):
         """Verifica che sub, oid e tid siano UUID validi"""
-        import re
-
         uuid_pattern = r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
 
         email = "test@example.com"
@@ -161,8 +175,6 @@ class TestGenerateDeterministicUUID:
 
     def test_generate_uuid_valid_format(self):
         """Verifica che l'UUID sia in formato valido"""
-        import re
-
         uuid_pattern = r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
 
         uuid_str = generate_deterministic_uuid("test")
@@ -182,3 +194,104 @@ class TestGenerateDeterministicUUID:
         uuid2 = generate_deterministic_uuid("seed2")
 
         assert uuid1 != uuid2
+
+
+class TestClaimsMemoization:
+    """Test per la memoizzazione dei claim set"""
+
+    def test_same_email_returns_shared_claims(self):
+        """Verifica che login ripetuti della stessa email restituiscano lo stesso claim set"""
+        first = generate_claims_from_email("memo.user@example.com")
+        second = generate_claims_from_email("memo.user@example.com")
+
+        assert first is second
+
+    def test_shared_claims_are_read_only(self):
+        """Verifica che il claim set condiviso non possa essere modificato"""
+        claims = generate_claims_from_email("readonly.user@example.com")
+
+        with pytest.raises(TypeError):
+            claims["name"] = "Changed"
+        with pytest.raises(TypeError):
+            claims.update({"name": "Changed"})
+        copy = dict(claims)
+        copy["name"] = "Changed"
+        assert generate_claims_from_email("readonly.user@example.com")["name"] == "Readonly User"
+
+    def test_claims_are_serializable(self):
+        """Verifica che il claim set resti serializzabile in JSON e con pickle"""
+        claims = generate_claims_from_email("serial.user@example.com")
+
+        assert json.loads(json.dumps(claims)) == claims
+        assert pickle.loads(pickle.dumps(claims)) == claims
+
+    def test_cache_is_invalidated_when_config_changes(self, monkeypatch):
+        """Verifica che una modifica di DYNAMIC_CLAIMS_CONFIG rigeneri i claims"""
+        before = generate_claims_from_email("config.user@example.com")
+        monkeypatch.setitem(config.DYNAMIC_CLAIMS_CONFIG, "default_roles", ["Admin"])
+        after = generate_claims_from_email("config.user@example.com")
+
+        assert after is not before
+        assert after["roles"] == ["Admin"]
+        assert after["sub"] == before["sub"]
+
+    def test_memoized_claims_match_uncached_generation(self):
+        """Verifica che la cache non alteri i claims generati"""
+        cached = generate_claims_from_email("same.result@example.com")
+        clear_claims_cache()
+        fresh = generate_claims_from_email("same.result@example.com")
+
+        assert fresh is not cached
+        assert fresh == cached
+
+
+class TestBulkClaimsGeneration:
+    """Test per la generazione bulk dei claims"""
+
+    EMAILS = [
+        "mario.rossi@example.com",
+        "giulia_bianchi@azienda.it",
+        "anna-maria.verdi@example.com",
+        "user12345@loadtest.example.com",
+        "abc@example.com",
+        "a1@example.com",
+        "nodomain",
+        "mario.rossi@example.com",
+    ]
+
+    def test_bulk_claims_are_byte_identical_to_single_generation(self):
+        """Verifica che il percorso bulk produca esattamente gli stessi claims serializzati"""
+        clear_claims_cache()
+        bulk = list(generate_claims_bulk(self.EMAILS))
+
+        assert len(bulk) == len(self.EMAILS)
+        for email, claims in zip(self.EMAILS, bulk):
+            assert json.dumps(claims) == json.dumps(generate_claims_from_email(email))
+
+    def test_bulk_generation_is_lazy(self):
+        """Verifica che le email vengano consumate man mano (iterabili infiniti)"""
+        emails = (f"user{i}@example.com" for i in count())
+        first = list(islice(generate_claims_bulk(emails), 3))
+
+        assert [c["email"] for c in first] == ["user0@example.com", "user1@example.com", "user2@example.com"]
+
+    def test_bulk_generation_bypasses_cache(self):
+        """Verifica che il percorso bulk non riempia la cache dei claims"""
+        clear_claims_cache()
+        list(generate_claims_bulk(f"bulk{i}@example.com" for i in range(50)))
+
+        assert get_claims_cache_stats()["size"] == 0
+
+    def test_columns_are_aligned_with_emails(self):
+        """Verifica il formato colonnare"""
+        columns = generate_claims_columns(self.EMAILS[:3])
+
+        assert columns["email"] == self.EMAILS[:3]
+        assert columns["sub"][1] == generate_claims_from_email(self.EMAILS[1])["sub"]
+        assert generate_claims_columns([]) == {}
+
+    def test_bulk_uuids_match_single_generation(self):
+        """Verifica che gli UUID bulk coincidano con generate_deterministic_uuid"""
+        seeds = ["a", "test-seed", "", "mario.rossi@example.com"]
+
+        assert generate_deterministic_uuids(seeds) == [generate_deterministic_uuid(s) for s in seeds]
@@ -2,7 +2,16 @@
 Unit tests per il modulo config
 """
 
-from config import DYNAMIC_CLAIMS_CONFIG, MOCK_USERS, Settings
+import json
+import os
+
+import pytest
+from pydantic import ValidationError
+
+import config
+from claims_generator import generate_claims_from_email
+from config import DYNAMIC_CLAIMS_CONFIG, MOCK_USERS, Settings, settings
+from mock_users import user_index
 
 
 class TestSettings:
@@ -86,3 +95,111 @@ class TestDynamicClaimsConfiguration:
         """Verifica il tenant ID di default"""
         assert isinstance(DYNAMIC_CLAIMS_CONFIG["default_tenant_id"], str)
         assert len(DYNAMIC_CLAIMS_CONFIG["default_tenant_id"]) > 0
+
+
+def _write_config(path, data: dict) -> None:
+    path.write_text(json.dumps(data), encoding="utf-8")
+    # Forza una data di modifica diversa anche per scritture nello stesso istante
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+class TestSettingsSnapshots:
+    """Test per le snapshot immutabili dei settings"""
+
+    def test_snapshot_is_immutable(self):
+        """Verifica che la snapshot condivisa non possa essere modificata"""
+        with pytest.raises(ValidationError):
+            settings.snapshot().port = 1
+
+    def test_assignment_swaps_snapshot(self, monkeypatch):
+        """Verifica che un'assegnazione crei una nuova snapshot lasciando intatta la precedente"""
+        before = settings.snapshot()
+        monkeypatch.setattr(settings, "access_token_expiry", 42)
+
+        assert settings.access_token_expiry == 42
+        assert settings.snapshot() is not before
+        assert before.access_token_expiry == 3600
+
+
+class TestConfigReload:
+    """Test per il ricaricamento a caldo della configurazione"""
+
+    def test_file_overrides_are_applied(self, config_file):
+        """Verifica che settings e claims dinamici del file vengano applicati"""
+        before = generate_claims_from_email("reload.user@example.com")
+        version = config.get_config_status()["version"]
+        _write_config(config_file, {"access_token_expiry": 120, "dynamic_claims": {"default_roles": ["Admin"]}})
+
+        assert config.reload_config() is True
+        assert config.settings.access_token_expiry == 120
+        assert config.settings.config_file == str(config_file)
+        assert config.DYNAMIC_CLAIMS_CONFIG["default_roles"] == ["Admin"]
+        assert config.DYNAMIC_CLAIMS_CONFIG["default_groups"] == ["default-group"]
+        assert generate_claims_from_email("reload.user@example.com")["roles"] == ["Admin"]
+        assert before["roles"] == ["User"]
+        assert config.get_config_status()["version"] == version + 1
+
+    def test_unchanged_file_is_not_reloaded(self, config_file):
+        """Verifica che senza modifiche al file la configurazione non venga sostituita"""
+        _write_config(config_file, {"access_token_expiry": 120})
+        assert config.reload_config() is True
+        snapshot = config.settings.snapshot()
+
+        assert config.reload_config() is False
+        assert config.settings.snapshot() is snapshot
+
+    def test_invalid_file_keeps_current_config(self, config_file):
+        """Verifica che un file non valido lasci in uso la configurazione corrente"""
+        _write_config(config_file, {"access_token_expiry": 120})
+        config.reload_config()
+        failures = config.get_config_status()["failures"]
+
+        config_file.write_text("{not json", encoding="utf-8")
+        assert config.reload_config() is False
+        _write_config(config_file, {"access_token_expiry": "not a number"})
+        assert config.reload_config() is False
+
+        assert config.settings.access_token_expiry == 120
+        assert config.get_config_status()["failures"] == failures + 2
+
+    def test_invalid_file_is_retried_only_after_a_change(self, config_file):
+        """Verifica che un file non valido venga contato una volta e riletto solo dopo una nuova modifica"""
+        _write_config(config_file, {"access_token_expiry": 120})
+        config.reload_config()
+        failures = config.get_config_status()["failures"]
+
+        config_file.write_text("{not json", encoding="utf-8")
+        for _ in range(3):
+            assert config.reload_config() is False
+        assert config.get_config_status()["failures"] == failures + 1
+
+        _write_config(config_file, {"access_token_expiry": 90})
+        assert config.reload_config() is True
+        assert config.settings.access_token_expiry == 90
+
+    def test_mock_users_are_reloaded(self, config_file):
+        """Verifica che gli utenti del file di configurazione sostituiscano il login dinamico"""
+        _write_config(config_file, {"mock_users": [{"username": "only@example.com", "password": "secret"}]})
+        config.reload_config()
+
+        assert user_index.enabled
+        assert user_index.authenticate("only@example.com", "secret") is not None
+        assert user_index.authenticate("other@example.com", "secret") is None
+
+    def test_listeners_are_notified(self, config_file):
+        """Verifica che i moduli registrati vengano notificati e che un errore non blocchi gli altri"""
+        calls = []
+
+        def failing():
+            raise RuntimeError("boom")
+
+        config.on_config_reload(failing)
+        config.on_config_reload(lambda: calls.append(config.settings.access_token_expiry))
+        try:
+            _write_config(config_file, {"access_token_expiry": 90})
+            config.reload_config()
+        finally:
+            del config._reload_listeners[-2:]
+
+        assert calls == [90]
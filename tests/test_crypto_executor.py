@@ -0,0 +1,135 @@
+"""
+Unit tests per il modulo crypto_executor
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from crypto_executor import CryptoExecutor, ExecutorBusyError, LatencyHistogram
+from token_service import token_service
+
+
+class TestLatencyHistogram:
+    """Test per l'istogramma delle latenze"""
+
+    def test_buckets_are_cumulative(self):
+        """Verifica che i conteggi per bucket siano cumulativi"""
+        histogram = LatencyHistogram(buckets=(1, 10))
+        histogram.observe(0.0005)
+        histogram.observe(0.005)
+        histogram.observe(2)
+
+        snapshot = histogram.snapshot()
+        assert snapshot["count"] == 3
+        assert snapshot["buckets"] == {"le_1ms": 1, "le_10ms": 2, "le_inf": 3}
+        assert snapshot["sum_ms"] == pytest.approx(2005.5)
+
+
+class TestCryptoExecutor:
+    """Test per il pool crittografico"""
+
+    @pytest.mark.parametrize("mode", ["inline", "thread"])
+    def test_run_returns_result_and_records_latency(self, mode):
+        """Verifica esecuzione e registrazione della latenza"""
+        executor = CryptoExecutor(mode=mode, max_workers=2)
+        try:
+            result = asyncio.run(executor.run("sign", sum, [1, 2, 3]))
+        finally:
+            executor.shutdown()
+
+        assert result == 6
+        assert executor.stats()["latency"]["sign"]["count"] == 1
+        assert executor.pending == 0
+
+    def test_queue_full_is_rejected(self):
+        """Verifica la backpressure oltre max_pending operazioni"""
+        executor = CryptoExecutor(mode="thread", max_workers=1, max_pending=0)
+
+        with pytest.raises(ExecutorBusyError):
+            asyncio.run(executor.run("sign", sum, [1]))
+        assert executor.stats()["rejected"] == 1
+
+    def test_concurrent_operations_are_bounded(self):
+        """Verifica che le operazioni oltre il limite vengano rifiutate mentre le altre proseguono"""
+        executor = CryptoExecutor(mode="thread", max_workers=1, max_pending=2)
+
+        async def burst():
+            return await asyncio.gather(
+                *(executor.run("sign", time.sleep, 0.05) for _ in range(3)), return_exceptions=True
+            )
+
+        try:
+            results = asyncio.run(burst())
+        finally:
+            executor.shutdown()
+
+        assert sum(isinstance(result, ExecutorBusyError) for result in results) == 1
+
+    def test_reserved_slots_are_not_rejected(self):
+        """Verifica che le operazioni nel blocco reserve usino i posti riservati"""
+        executor = CryptoExecutor(mode="thread", max_workers=1, max_pending=2)
+
+        async def reserved():
+            with executor.reserve(2):
+                # La coda è piena: solo le operazioni coperte dalla prenotazione vengono eseguite
+                return await asyncio.gather(
+                    *(executor.run("sign", sum, [n]) for n in range(1, 4)), return_exceptions=True
+                )
+
+        try:
+            results = asyncio.run(reserved())
+            assert results[:2] == [1, 2]
+            assert isinstance(results[2], ExecutorBusyError)
+        finally:
+            executor.shutdown()
+        assert executor.pending == 0
+
+    def test_reservation_beyond_capacity_is_rejected(self):
+        """Verifica che una prenotazione oltre max_pending venga rifiutata senza occupare posti"""
+        executor = CryptoExecutor(mode="thread", max_workers=1, max_pending=1)
+
+        with pytest.raises(ExecutorBusyError):
+            with executor.reserve(2):
+                pass
+        assert executor.pending == 0
+        assert executor.stats()["rejected"] == 1
+
+    def test_unused_reserved_slots_are_released(self):
+        """Verifica che i posti riservati e non usati vengano rilasciati"""
+        executor = CryptoExecutor(mode="thread", max_workers=1, max_pending=2)
+
+        with executor.reserve(2):
+            assert executor.pending == 2
+        assert executor.pending == 0
+
+    def test_exceptions_are_propagated(self):
+        """Verifica che gli errori dell'operazione arrivino al chiamante"""
+        executor = CryptoExecutor(mode="thread", max_workers=1)
+
+        with pytest.raises(ValueError):
+            asyncio.run(executor.run("verify", int, "not-a-number"))
+        executor.shutdown()
+        assert executor.pending == 0
+
+
+class TestProcessMode:
+    """Test per firma e verifica nei processi worker"""
+
+    def test_sign_and_decode_in_worker_process(self, monkeypatch, sample_user_claims):
+        """Verifica che i token firmati nei processi worker siano validi e verificabili"""
+        executor = CryptoExecutor(mode="process", max_workers=1)
+        monkeypatch.setattr("token_service.crypto_executor", executor)
+
+        async def roundtrip():
+            token = await token_service.generate_access_token_async(sample_user_claims, "openid", "http://localhost")
+            return token, await token_service.decode_token_async(token)
+
+        try:
+            token, claims = asyncio.run(roundtrip())
+        finally:
+            executor.shutdown()
+
+        assert token_service.decode_token(token)["sub"] == sample_user_claims["sub"]
+        assert claims["scope"] == "openid"
@@ -2,6 +2,28 @@
 Unit tests per gli endpoint principali del Mock OIDC Server
 """
 
+import base64
+import json
+import time
+
+from jose import jwt
+
+import main
+from config import settings
+from crypto_executor import ExecutorBusyError, crypto_executor
+from jwks_service import jwks_service
+from main import (
+    _multi_worker_problems,
+    authorization_codes,
+    client_token_cache,
+    discovery_cache,
+    revoked_tokens,
+    verified_token_cache,
+)
+from mock_users import UserIndex
+from storage import StoreBusyError
+from token_service import token_service
+
 
 class TestDiscoveryEndpoint:
     """Test per il discovery endpoint"""
@@ -47,6 +69,54 @@ class TestDiscoveryEndpoint:
         assert "issuer" in data
         assert data["issuer"].startswith("http://")
 
+    def test_discovery_endpoint_sets_cache_headers(self, test_client):
+        """Verifica che il discovery endpoint esponga ETag e Cache-Control"""
+        response = test_client.get("/.well-known/openid-configuration")
+
+        assert response.headers["etag"].startswith('"')
+        assert "max-age=" in response.headers["cache-control"]
+
+    def test_discovery_endpoint_returns_304_on_matching_etag(self, test_client):
+        """Verifica che If-None-Match con ETag corrente restituisca 304"""
+        etag = test_client.get("/.well-known/openid-configuration").headers["etag"]
+
+        response = test_client.get("/.well-known/openid-configuration", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    def test_discovery_etag_is_per_issuer(self, test_client):
+        """Verifica che issuer diversi abbiano ETag diversi"""
+        etag1 = test_client.get("/.well-known/openid-configuration").headers["etag"]
+        etag2 = test_client.get("http://other-host:9000/.well-known/openid-configuration").headers["etag"]
+
+        assert etag1 != etag2
+
+    def test_discovery_document_is_cached_per_issuer(self, test_client):
+        """Verifica che il documento venga servito dalla cache per lo stesso issuer"""
+        discovery_cache.clear()
+        first = test_client.get("/.well-known/openid-configuration")
+        hits_before = discovery_cache.stats()["hits"]
+        second = test_client.get("/.well-known/openid-configuration")
+
+        assert discovery_cache.stats()["hits"] == hits_before + 1
+        assert first.content == second.content
+
+    def test_discovery_cache_invalidated_on_settings_change(self, test_client, monkeypatch):
+        """Verifica che una modifica ai settings produca un nuovo documento"""
+        etag_before = test_client.get("/.well-known/openid-configuration").headers["etag"]
+        monkeypatch.setattr(settings, "supported_scopes", ["openid"])
+
+        response = test_client.get("/.well-known/openid-configuration")
+        assert response.headers["etag"] != etag_before
+        assert response.json()["scopes_supported"] == ["openid"]
+
+    def test_discovery_signing_alg_follows_configuration(self, test_client, monkeypatch):
+        """Verifica che id_token_signing_alg_values_supported segua l'algoritmo configurato"""
+        monkeypatch.setattr(jwks_service, "algorithm", "ES256")
+        data = test_client.get("/.well-known/openid-configuration").json()
+        assert data["id_token_signing_alg_values_supported"] == ["ES256"]
+
 
 class TestJWKSEndpoint:
     """Test per il JWKS endpoint"""
@@ -86,6 +156,31 @@ class TestJWKSEndpoint:
         assert key["alg"] == "RS256"
         assert key["use"] == "sig"
 
+    def test_jwks_endpoint_returns_json_content_type(self, test_client):
+        """Verifica che il JWKS pre-serializzato sia servito come JSON"""
+        response = test_client.get("/jwks")
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == jwks_service.get_jwks_json()
+
+    def test_jwks_endpoint_sets_cache_headers(self, test_client):
+        """Verifica che il JWKS endpoint esponga ETag e Cache-Control"""
+        response = test_client.get("/jwks")
+        assert response.headers["etag"] == jwks_service.get_jwks_etag()
+        assert "max-age=" in response.headers["cache-control"]
+
+    def test_jwks_endpoint_returns_304_on_matching_etag(self, test_client):
+        """Verifica che If-None-Match (anche in lista o debole) restituisca 304"""
+        etag = test_client.get("/jwks").headers["etag"]
+
+        assert test_client.get("/jwks", headers={"If-None-Match": etag}).status_code == 304
+        assert test_client.get("/jwks", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+
+    def test_jwks_endpoint_returns_200_on_stale_etag(self, test_client):
+        """Verifica che un ETag non corrente restituisca il documento completo"""
+        response = test_client.get("/jwks", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == 200
+        assert "keys" in response.json()
+
 
 class TestAuthorizationEndpoint:
     """Test per l'authorization endpoint"""
@@ -97,6 +192,43 @@ class TestAuthorizationEndpoint:
         assert "text/html" in response.headers["content-type"]
         assert b"login" in response.content.lower()
 
+    def test_login_form_escapes_request_parameters(self, test_client, auth_params):
+        """Verifica che i parametri della richiesta non possano iniettare HTML nella pagina"""
+        params = {**auth_params, "client_id": '"><script>alert(1)</script>', "state": "a&b"}
+        response = test_client.get("/authorize", params=params)
+
+        assert b"<script>alert(1)" not in response.content
+        assert b'value="&quot;&gt;&lt;script&gt;alert(1)&lt;/script&gt;"' in response.content
+        assert b'name="state" value="a&amp;b"' in response.content
+
+    def test_login_stylesheet_is_precompressed_and_cacheable(self, test_client, auth_params):
+        """Verifica che il CSS linkato dalla pagina sia servito compresso, con ETag e 304"""
+        page = test_client.get("/authorize", params=auth_params).content
+        assert b'href="/assets/login.css"' in page
+
+        response = test_client.get("/assets/login.css", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert b"button" in response.content
+
+        etag = response.headers["etag"]
+        cached = test_client.get("/assets/login.css", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag
+
+    def test_login_stylesheet_variants_have_distinct_etags(self, test_client):
+        """Verifica che ogni codifica abbia il proprio ETag e che quello di un'altra variante non dia 304"""
+        gzipped = test_client.get("/assets/login.css", headers={"Accept-Encoding": "gzip"})
+        identity = test_client.get("/assets/login.css", headers={"Accept-Encoding": "identity"})
+
+        assert gzipped.headers["etag"] != identity.headers["etag"]
+        response = test_client.get(
+            "/assets/login.css", headers={"Accept-Encoding": "identity", "If-None-Match": gzipped.headers["etag"]}
+        )
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
     def test_authorize_with_invalid_response_type_returns_400(self, test_client):
         """Verifica che un response_type non valido restituisca 400"""
         params = {
@@ -176,6 +308,200 @@ class TestTokenEndpoint:
         assert "refresh_token" in tokens
         assert tokens["token_type"] == "Bearer"
 
+    def test_token_endpoint_rejects_expired_code(self, test_client, auth_params, monkeypatch):
+        """Verifica che un authorization code scaduto venga rifiutato"""
+        params = {**auth_params, "username": "test@example.com", "password": "test123"}
+        auth_response = test_client.get("/authorize", params=params, follow_redirects=False)
+        code = auth_response.headers["location"].split("code=")[1].split("&")[0]
+
+        expired_at = time.time() + settings.authorization_code_expiry + 1
+        monkeypatch.setattr(time, "time", lambda: expired_at)
+
+        token_data = {
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": auth_params["redirect_uri"],
+            "client_id": auth_params["client_id"],
+        }
+        response = test_client.post("/token", data=token_data)
+        assert response.status_code == 400
+
+    def test_refresh_token_grant(self, test_client, obtain_tokens):
+        """Verifica che il refresh token permetta di ottenere nuovi token"""
+        refresh_token = obtain_tokens()["refresh_token"]
+
+        response = test_client.post("/token", data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+        assert response.status_code == 200
+        assert "access_token" in response.json()
+
+    def test_refresh_token_rotation_and_reuse(self, test_client, obtain_tokens, monkeypatch):
+        """Verifica rotazione e rifiuto del riutilizzo con REFRESH_TOKEN_ROTATION attivo"""
+        monkeypatch.setattr(settings, "refresh_token_rotation", True)
+        refresh_token = obtain_tokens()["refresh_token"]
+
+        response = test_client.post("/token", data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+        new_refresh_token = response.json()["refresh_token"]
+        assert new_refresh_token and new_refresh_token != refresh_token
+
+        reuse = test_client.post("/token", data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+        assert reuse.status_code == 400
+
+    def test_stateless_code_flow_and_replay(self, test_client, auth_params, monkeypatch):
+        """Verifica il flusso con code self-contained e il rifiuto del secondo riscatto"""
+        monkeypatch.setattr(settings, "stateless_tokens", True)
+        live_before = authorization_codes.stats()["live"]
+
+        params = {**auth_params, "username": "test@example.com", "password": "test123"}
+        auth_response = test_client.get("/authorize", params=params, follow_redirects=False)
+        code = auth_response.headers["location"].split("code=")[1].split("&")[0]
+        assert authorization_codes.stats()["live"] == live_before
+
+        token_data = {
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": auth_params["redirect_uri"],
+            "client_id": auth_params["client_id"],
+        }
+        response = test_client.post("/token", data=token_data)
+        assert response.status_code == 200
+        refresh_token = response.json()["refresh_token"]
+
+        assert test_client.post("/token", data=token_data).status_code == 400
+
+        refresh = test_client.post("/token", data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+        assert refresh.status_code == 200
+
+
+class TestPasswordGrant:
+    """Test per il grant password di sola utilità per i test"""
+
+    def _password_grant(self, test_client, **extra):
+        data = {
+            "grant_type": "password",
+            "username": "mario.rossi@example.com",
+            "password": "secret",
+            "client_id": "test-client",
+            **extra,
+        }
+        return test_client.post("/token", data=data)
+
+    def test_disabled_by_default(self, test_client):
+        """Verifica che senza PASSWORD_GRANT_ENABLED il grant non sia supportato"""
+        response = self._password_grant(test_client)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Unsupported grant_type"
+
+    def test_returns_tokens_in_one_call(self, test_client, monkeypatch):
+        """Verifica che il grant restituisca token utilizzabili senza creare authorization code"""
+        monkeypatch.setattr(settings, "password_grant_enabled", True)
+        codes_before = len(authorization_codes)
+
+        response = self._password_grant(test_client)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["id_token"]
+        assert data["refresh_token"] is None
+        assert len(authorization_codes) == codes_before
+        userinfo = test_client.get("/userinfo", headers={"Authorization": f"Bearer {data['access_token']}"})
+        assert userinfo.json()["email"] == "mario.rossi@example.com"
+
+    def test_offline_access_issues_refresh_token(self, test_client, monkeypatch):
+        """Verifica che il refresh token venga emesso solo con lo scope offline_access"""
+        monkeypatch.setattr(settings, "password_grant_enabled", True)
+
+        data = self._password_grant(test_client, scope="openid offline_access").json()
+
+        assert data["refresh_token"]
+        assert data["scope"] == "openid offline_access"
+
+    def test_mock_users_credentials_are_checked(self, test_client, monkeypatch):
+        """Verifica che con MOCK_USERS configurato le credenziali vengano validate"""
+        monkeypatch.setattr(settings, "password_grant_enabled", True)
+        users = [{"username": "mario.rossi@example.com", "password": "right", "claims": {"sub": "mock-sub"}}]
+        monkeypatch.setattr("main.user_index", UserIndex(users=users))
+
+        assert self._password_grant(test_client, password="wrong").status_code == 401
+        assert self._password_grant(test_client, password="right").status_code == 200
+
+
+class TestClientCredentialsGrant:
+    """Test per il grant client_credentials"""
+
+    def _client_token(self, test_client, **extra):
+        data = {"grant_type": "client_credentials", "client_id": "svc-orders", "scope": "orders.read", **extra}
+        return test_client.post("/token", data=data)
+
+    def test_issues_client_token(self, test_client):
+        """Verifica che il token del client abbia sub/azp del client e l'audience richiesta"""
+        response = self._client_token(test_client, audience="api://orders")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["id_token"] is None
+        assert data["refresh_token"] is None
+        claims = token_service.decode_token(data["access_token"])
+        assert claims["sub"] == claims["azp"] == "svc-orders"
+        assert claims["aud"] == "api://orders"
+        assert claims["scope"] == "orders.read"
+
+    def test_client_id_from_basic_auth(self, test_client):
+        """Verifica l'autenticazione client_secret_basic"""
+        credentials = base64.b64encode(b"svc-basic:secret").decode()
+        response = test_client.post(
+            "/token", data={"grant_type": "client_credentials"}, headers={"Authorization": f"Basic {credentials}"}
+        )
+
+        assert response.status_code == 200
+
+    def test_missing_client_id(self, test_client):
+        """Verifica che senza client_id la richiesta venga rifiutata"""
+        response = test_client.post("/token", data={"grant_type": "client_credentials"})
+        assert response.status_code == 400
+
+    def test_cache_disabled_by_default(self, test_client):
+        """Verifica che senza cache ogni richiesta emetta un nuovo token"""
+        first = self._client_token(test_client).json()["access_token"]
+        second = self._client_token(test_client).json()["access_token"]
+
+        assert first != second
+
+    def test_cached_token_is_reused(self, test_client, monkeypatch):
+        """Verifica che con la cache attiva il token valido venga riusato per la stessa chiave"""
+        monkeypatch.setattr(settings, "client_credentials_cache", True)
+        client_token_cache.clear()
+
+        first = self._client_token(test_client).json()
+        second = self._client_token(test_client).json()
+        other_audience = self._client_token(test_client, audience="api://other").json()
+
+        assert second["access_token"] == first["access_token"]
+        assert second["expires_in"] <= first["expires_in"]
+        assert other_audience["access_token"] != first["access_token"]
+
+    def test_cached_token_near_expiry_is_reissued(self, test_client, monkeypatch):
+        """Verifica che un token in cache prossimo alla scadenza venga riemesso"""
+        monkeypatch.setattr(settings, "client_credentials_cache", True)
+        monkeypatch.setattr(settings, "client_credentials_cache_min_ttl", settings.access_token_expiry)
+        client_token_cache.clear()
+
+        first = self._client_token(test_client).json()["access_token"]
+        second = self._client_token(test_client).json()["access_token"]
+
+        assert second != first
+        assert len(client_token_cache) == 1
+
+    def test_revoked_cached_token_is_not_reused(self, test_client, monkeypatch):
+        """Verifica che un token revocato non venga restituito dalla cache"""
+        monkeypatch.setattr(settings, "client_credentials_cache", True)
+        client_token_cache.clear()
+
+        first = self._client_token(test_client).json()["access_token"]
+        test_client.post("/revoke", data={"token": first})
+        second = self._client_token(test_client).json()["access_token"]
+
+        assert second != first
+
 
 class TestUserInfoEndpoint:
     """Test per il userinfo endpoint"""
@@ -222,6 +548,185 @@ class TestUserInfoEndpoint:
         assert "email" in userinfo
         assert "name" in userinfo
 
+    def test_repeated_userinfo_skips_verification(self, test_client, obtain_tokens, monkeypatch):
+        """Verifica che lo stesso token venga verificato una sola volta"""
+        access_token = obtain_tokens()["access_token"]
+        headers = {"Authorization": f"Bearer {access_token}"}
+        first = test_client.get("/userinfo", headers=headers).json()
+
+        async def _fail(token):
+            raise AssertionError("token verified again")
+
+        monkeypatch.setattr(token_service, "decode_token_async", _fail)
+        hits_before = verified_token_cache.stats()["hits"]
+        response = test_client.get("/userinfo", headers=headers)
+
+        assert response.status_code == 200
+        assert response.json() == first
+        assert verified_token_cache.stats()["hits"] == hits_before + 1
+        assert test_client.get("/metrics").json()["userinfo_cache"]["hits"] >= 1
+
+    def test_cached_token_expires_with_token(self, test_client, obtain_tokens):
+        """Verifica che un token in cache non venga più accettato dopo la sua scadenza"""
+        access_token = obtain_tokens()["access_token"]
+        headers = {"Authorization": f"Bearer {access_token}"}
+        test_client.get("/userinfo", headers=headers)
+
+        # Simula la scadenza della voce in cache: il token viene verificato di nuovo
+        token_hash = token_service.hash_token(access_token)
+        claims, _ = verified_token_cache.get(token_hash)
+        verified_token_cache.set(token_hash, (claims, 0))
+        assert test_client.get("/userinfo", headers=headers).status_code == 200
+        assert verified_token_cache.get(token_hash)[1] == claims["exp"]
+
+    def test_revoked_cached_token_is_rejected(self, test_client, obtain_tokens):
+        """Verifica che la revoca prevalga sui claims in cache"""
+        access_token = obtain_tokens(username="cached.revoked@example.com")["access_token"]
+        headers = {"Authorization": f"Bearer {access_token}"}
+        test_client.get("/userinfo", headers=headers)
+        test_client.post("/revoke", data={"token": access_token})
+
+        assert test_client.get("/userinfo", headers=headers).status_code == 401
+        assert token_service.hash_token(access_token) not in verified_token_cache
+
+
+class TestRevokeEndpoint:
+    """Test per il revoke endpoint"""
+
+    def test_revoked_access_token_is_rejected_by_userinfo(self, test_client, obtain_tokens):
+        """Verifica che un access token revocato non sia più accettato"""
+        access_token = obtain_tokens()["access_token"]
+        headers = {"Authorization": f"Bearer {access_token}"}
+        assert test_client.get("/userinfo", headers=headers).status_code == 200
+
+        response = test_client.post("/revoke", data={"token": access_token})
+        assert response.status_code == 200
+
+        assert test_client.get("/userinfo", headers=headers).status_code == 401
+
+    def test_revocation_is_keyed_by_token_hash_with_expiry(self, test_client, obtain_tokens):
+        """Verifica che lo store contenga solo l'hash del token, con scadenza pari a exp"""
+        access_token = obtain_tokens()["access_token"]
+        test_client.post("/revoke", data={"token": access_token})
+
+        entry = revoked_tokens.get(token_service.hash_token(access_token))
+        assert entry == {"exp": token_service.get_unverified_expiry(access_token)}
+        assert revoked_tokens.get(access_token) is None
+
+    def test_forged_far_future_expiry_is_capped(self, test_client):
+        """Verifica che un JWT contraffatto con exp lontanissimo non resti tra i revocati oltre la durata massima"""
+        forged = jwt.encode({"sub": "attacker", "exp": 10**11}, "not-the-signing-key", algorithm="HS256")
+        response = test_client.post("/revoke", data={"token": forged})
+
+        assert response.status_code == 200
+        entry = revoked_tokens.get(token_service.hash_token(forged))
+        max_lifetime = max(settings.access_token_expiry, settings.id_token_expiry)
+        assert entry["exp"] <= time.time() + max_lifetime
+
+    def test_revoke_refresh_token_removes_it(self, test_client, obtain_tokens):
+        """Verifica che la revoca di un refresh token lo renda inutilizzabile"""
+        refresh_token = obtain_tokens()["refresh_token"]
+        test_client.post("/revoke", data={"token": refresh_token, "token_type_hint": "refresh_token"})
+
+        response = test_client.post("/token", data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+        assert response.status_code == 400
+
+    def test_revoke_opaque_token_is_not_stored(self, test_client):
+        """Verifica che token non JWT non occupino spazio nella lista dei revocati"""
+        live_before = revoked_tokens.stats()["live"]
+        response = test_client.post("/revoke", data={"token": "not-a-jwt"})
+
+        assert response.status_code == 200
+        assert revoked_tokens.stats()["live"] == live_before
+
+
+class TestIntrospectionEndpoint:
+    """Test per l'introspection endpoint (RFC 7662)"""
+
+    def test_discovery_advertises_introspection(self, test_client):
+        """Verifica che il discovery document pubblichi l'endpoint"""
+        config = test_client.get("/.well-known/openid-configuration").json()
+
+        assert config["introspection_endpoint"].endswith("/introspect")
+
+    def test_active_access_token(self, test_client, obtain_tokens):
+        """Verifica i metadati di un access token valido"""
+        access_token = obtain_tokens(username="introspect.user@example.com")["access_token"]
+
+        result = test_client.post("/introspect", data={"token": access_token}).json()
+
+        assert result["active"] is True
+        assert result["token_type"] == "Bearer"
+        assert result["username"] == "introspect.user@example.com"
+        assert result["scope"] == "openid profile email"
+        assert result["exp"] > result["iat"]
+
+    def test_revoked_and_invalid_tokens_are_inactive(self, test_client, obtain_tokens):
+        """Verifica che token revocati o non validi risultino inattivi"""
+        access_token = obtain_tokens(username="introspect.revoked@example.com")["access_token"]
+        test_client.post("/revoke", data={"token": access_token})
+
+        assert test_client.post("/introspect", data={"token": access_token}).json() == {"active": False}
+        assert test_client.post("/introspect", data={"token": "a.b.c"}).json() == {"active": False}
+        assert test_client.post("/introspect", data={"token": "not-a-token"}).json() == {"active": False}
+
+    def test_malformed_header_is_inactive(self, test_client):
+        """Verifica che un header con kid non stringa dia {"active": false} e non un errore"""
+        token = jwt.encode({"sub": "x"}, "secret", algorithm="HS256", headers={"kid": ["x"]})
+
+        response = test_client.post("/introspect", data={"token": token})
+
+        assert response.status_code == 200
+        assert response.json() == {"active": False}
+
+    def test_refresh_token(self, test_client, obtain_tokens):
+        """Verifica l'introspection di un refresh token"""
+        refresh_token = obtain_tokens()["refresh_token"]
+
+        result = test_client.post(
+            "/introspect", data={"token": refresh_token, "token_type_hint": "refresh_token"}
+        ).json()
+
+        assert result["active"] is True
+        assert result["token_type"] == "refresh_token"
+        assert result["client_id"] == "test-client"
+
+    def test_wrong_hint_falls_back_to_other_token_types(self, test_client, obtain_tokens):
+        """Verifica che un hint errato non renda inattivo un token valido (RFC 7662 §2.1)"""
+        tokens = obtain_tokens(username="introspect.hint@example.com")
+
+        access = test_client.post(
+            "/introspect", data={"token": tokens["access_token"], "token_type_hint": "refresh_token"}
+        ).json()
+        refresh = test_client.post(
+            "/introspect", data={"token": tokens["refresh_token"], "token_type_hint": "access_token"}
+        ).json()
+
+        assert access["active"] is True
+        assert access["token_type"] == "Bearer"
+        assert refresh["active"] is True
+        assert refresh["token_type"] == "refresh_token"
+
+    def test_batch_preserves_order(self, test_client, obtain_tokens):
+        """Verifica che il batch restituisca un risultato per token, nello stesso ordine"""
+        tokens = obtain_tokens(username="introspect.batch@example.com")
+        batch = [tokens["access_token"], "invalid", tokens["refresh_token"], tokens["id_token"]]
+
+        response = test_client.post("/introspect/batch", json={"tokens": batch})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["active"] for r in results] == [True, False, True, True]
+        assert results[2]["token_type"] == "refresh_token"
+        assert results[3]["aud"] == "test-client"
+
+    def test_batch_size_is_limited(self, test_client, monkeypatch):
+        """Verifica il limite di token per richiesta batch"""
+        monkeypatch.setattr(settings, "introspection_batch_max_size", 2)
+        response = test_client.post("/introspect/batch", json={"tokens": ["a", "b", "c"]})
+
+        assert response.status_code == 400
+
 
 class TestHealthEndpoint:
     """Test per gli endpoint di health check"""
@@ -233,6 +738,85 @@ class TestHealthEndpoint:
         data = response.json()
         assert data["status"] == "healthy"
 
+    def test_metrics_endpoint_reports_store_counts(self, test_client):
+        """Verifica che l'endpoint metrics esponga i contatori degli store"""
+        response = test_client.get("/metrics")
+        assert response.status_code == 200
+        stores = response.json()["stores"]
+
+        for name in ["authorization_codes", "refresh_tokens", "revoked_tokens"]:
+            assert set(stores[name]) == {"live", "expired"}
+
+    def test_metrics_endpoint_reports_signing_latency(self, test_client, obtain_tokens):
+        """Verifica che l'endpoint metrics esponga gli istogrammi di latenza di firma"""
+        obtain_tokens()
+
+        crypto = test_client.get("/metrics").json()["crypto_executor"]
+
+        assert crypto["latency"]["sign"]["count"] >= 2
+        assert crypto["latency"]["sign"]["buckets"]["le_inf"] == crypto["latency"]["sign"]["count"]
+
+    def test_token_endpoint_rejects_when_executor_is_saturated(self, test_client, auth_params, monkeypatch):
+        """Verifica la backpressure: con il pool saturo il token endpoint risponde 503"""
+        params = {**auth_params, "username": "test@example.com", "password": "test123"}
+        auth_response = test_client.get("/authorize", params=params, follow_redirects=False)
+        code = auth_response.headers["location"].split("code=")[1].split("&")[0]
+        monkeypatch.setattr(crypto_executor, "max_pending", 0)
+
+        response = test_client.post(
+            "/token",
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": auth_params["redirect_uri"],
+                "client_id": auth_params["client_id"],
+            },
+        )
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+        # Il code non è stato consumato: il nuovo tentativo va a buon fine
+        monkeypatch.undo()
+        response = test_client.post(
+            "/token",
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": auth_params["redirect_uri"],
+                "client_id": auth_params["client_id"],
+            },
+        )
+        assert response.status_code == 200
+
+    def test_busy_storage_returns_503(self, test_client, monkeypatch):
+        """Verifica che uno storage conteso oltre il timeout dia 503 con Retry-After"""
+
+        def busy(key):
+            raise StoreBusyError("locked")
+
+        monkeypatch.setattr(main.authorization_codes, "pop", busy)
+        response = test_client.post(
+            "/token", data={"grant_type": "authorization_code", "code": "any", "redirect_uri": "http://x"}
+        )
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+    def test_rotated_refresh_token_survives_saturation(self, test_client, obtain_tokens, monkeypatch):
+        """Verifica che con il pool saturo il refresh token non venga ruotato né la famiglia revocata"""
+        monkeypatch.setattr(settings, "refresh_token_rotation", True)
+        refresh_token = obtain_tokens()["refresh_token"]
+        monkeypatch.setattr(crypto_executor, "max_pending", 0)
+
+        data = {"grant_type": "refresh_token", "refresh_token": refresh_token}
+        assert test_client.post("/token", data=data).status_code == 503
+
+        monkeypatch.setattr(crypto_executor, "max_pending", 256)
+        response = test_client.post("/token", data=data)
+        assert response.status_code == 200
+        assert response.json()["refresh_token"] != refresh_token
+
     def test_root_endpoint_returns_info(self, test_client):
         """Verifica che il root endpoint restituisca informazioni sul server"""
         response = test_client.get("/")
@@ -241,3 +825,118 @@ class TestHealthEndpoint:
         assert "name" in data
         assert "version" in data
         assert "status" in data
+
+
+class TestMultiWorkerSettings:
+    """Test per la validazione della configurazione con più worker"""
+
+    def test_default_configuration_is_rejected(self, monkeypatch):
+        """Verifica che storage in memoria e chiave generata per processo siano segnalati"""
+        monkeypatch.setattr(settings, "storage_backend", "memory")
+        monkeypatch.setattr(settings, "signing_key_file", None)
+        monkeypatch.setattr(settings, "signing_key_pem", None)
+
+        problems = _multi_worker_problems()
+
+        assert any("STORAGE_BACKEND" in p for p in problems)
+        assert any("SIGNING_KEY_FILE" in p for p in problems)
+
+    def test_shared_storage_and_key_are_accepted(self, monkeypatch):
+        """Verifica che con storage e chiave condivisi non ci siano problemi"""
+        monkeypatch.setattr(settings, "storage_backend", "sqlite")
+        monkeypatch.setattr(settings, "signing_key_file", "signing-key.pem")
+        monkeypatch.setattr(settings, "key_rotation_interval", 0)
+
+        assert _multi_worker_problems() == []
+
+
+class TestAdminConfigReloadEndpoint:
+    """Test per il ricaricamento della configurazione via admin API"""
+
+    def test_disabled_by_default(self, test_client):
+        """Verifica che senza ADMIN_API_ENABLED l'endpoint non esista"""
+        assert test_client.post("/admin/config/reload").status_code == 404
+
+    def test_reload_applies_new_config(self, test_client, config_file, monkeypatch):
+        """Verifica che la nuova configurazione sia applicata e la cache del discovery svuotata"""
+        monkeypatch.setattr(settings, "admin_api_enabled", True)
+        test_client.get("/.well-known/openid-configuration")
+        assert len(discovery_cache) > 0
+
+        config = {"admin_api_enabled": True, "supported_scopes": ["openid", "orders.read"], "access_token_expiry": 60}
+        config_file.write_text(json.dumps(config), encoding="utf-8")
+        response = test_client.post("/admin/config/reload")
+
+        assert response.status_code == 200
+        assert response.json()["reloaded"] is True
+        assert len(discovery_cache) == 0
+        discovery = test_client.get("/.well-known/openid-configuration").json()
+        assert discovery["scopes_supported"] == ["openid", "orders.read"]
+        assert test_client.get("/metrics").json()["config"]["version"] == response.json()["version"]
+
+
+class TestAdminTokenBatchEndpoint:
+    """Test per l'endpoint di emissione massiva dei token"""
+
+    def test_disabled_by_default(self, test_client):
+        """Verifica che l'endpoint non sia esposto senza ADMIN_API_ENABLED"""
+        response = test_client.post("/admin/tokens/batch", json={"emails": ["a@example.com"]})
+        assert response.status_code == 404
+
+    def test_streams_ndjson_tokens(self, test_client, monkeypatch):
+        """Verifica che venga restituita una riga NDJSON con token validi per ogni utente"""
+        monkeypatch.setattr(settings, "admin_api_enabled", True)
+        emails = [f"user{i}@example.com" for i in range(5)]
+        claim_set = {"sub": "custom-sub", "email": "custom@example.com", "name": "Custom"}
+
+        response = test_client.post(
+            "/admin/tokens/batch", json={"emails": emails, "users": [claim_set], "client_id": "k6"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["email"] for line in lines] == emails + ["custom@example.com"]
+        assert lines[-1]["sub"] == "custom-sub"
+        assert token_service.decode_token(lines[0]["access_token"])["email"] == emails[0]
+        assert token_service.decode_token(lines[-1]["id_token"])["aud"] == "k6"
+
+    def test_saturated_executor_returns_503(self, test_client, monkeypatch):
+        """Verifica che con il pool saturo il batch venga rifiutato prima di inviare gli header"""
+        monkeypatch.setattr(settings, "admin_api_enabled", True)
+        monkeypatch.setattr(crypto_executor, "max_pending", 0)
+
+        response = test_client.post("/admin/tokens/batch", json={"emails": ["a@example.com"]})
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+    def test_failure_mid_stream_ends_with_error_line(self, test_client, monkeypatch):
+        """Verifica che un errore dopo il primo blocco termini l'output con una riga di errore"""
+        monkeypatch.setattr(settings, "admin_api_enabled", True)
+        sign_many_async = token_service._sign_many_async
+        calls = []
+
+        async def failing_after_first(claims_list):
+            calls.append(claims_list)
+            if len(calls) > 1:
+                raise ExecutorBusyError("queue full")
+            return await sign_many_async(claims_list)
+
+        monkeypatch.setattr(token_service, "_sign_many_async", failing_after_first)
+        emails = [f"user{i}@example.com" for i in range(150)]
+
+        response = test_client.post("/admin/tokens/batch", json={"emails": emails})
+
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["email"] for line in lines[:-1]] == emails[:100]
+        assert lines[-1] == {"error": "Server busy, retry later"}
+
+    def test_batch_size_is_limited(self, test_client, monkeypatch):
+        """Verifica il limite sul numero di utenti per richiesta"""
+        monkeypatch.setattr(settings, "admin_api_enabled", True)
+        monkeypatch.setattr(settings, "token_batch_max_size", 2)
+
+        response = test_client.post("/admin/tokens/batch", json={"emails": ["a@x.com", "b@x.com", "c@x.com"]})
+        assert response.status_code == 400
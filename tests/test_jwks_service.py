@@ -2,7 +2,25 @@
 Unit tests per il modulo jwks_service
 """
 
-from jwks_service import JWKSService
+import base64
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from config import settings
+from jwks_service import JWKSService, KeyPool
+from signing_algorithms import check_private_key, jwk_thumbprint
+
+# Chiave RSA d'esempio della RFC 7638 §3.1 e relativo thumbprint
+RFC7638_N = (
+    "0vx7agoebGcQSuuPiLJXZptN9nndrQmbXEps2aiAFbWhM78LhWx4cbbfAAtVT86zwu1RK7aPFFxuhDR1L6tSoc_BJECPebWKRXjBZCiFV4n3oknjhMs"
+    "tn64tZ_2W-5JsGY4Hc5n9yBXArwl93lqt7_RN5w6Cf0h4QyQ5v-65YGjQR0_FDW2QvzqY368QQMicAtaSqzs8KJZgnYb9c7d0zgdAZHzu6qMQvRL5ha"
+    "jrn1n91CbOpbISD08qNLyrdkt-bFTWhAI4vMQFh6WeZu0fM4lFd2NcRwr3XPksINHaQ-G_xBniIqbw0Ls1jF44-csFCur-kEgU8awapJzKnqDKgw"
+)
+RFC7638_THUMBPRINT = "NzbLsXh8uDCcd-6MNwXF4W_7noWXFZAfHkxZsRGC9Xs"
 
 
 class TestJWKSService:
@@ -102,3 +120,265 @@ class TestJWKSService:
 
         # Le chiavi dovrebbero essere diverse
         assert jwks1["keys"][0]["n"] != jwks2["keys"][0]["n"]
+
+    def test_jwks_json_matches_jwks(self):
+        """Verifica che il JSON pre-serializzato corrisponda al JWKS"""
+        service = JWKSService()
+
+        assert isinstance(service.get_jwks_json(), bytes)
+        assert json.loads(service.get_jwks_json()) == service.get_jwks()
+
+    def test_jwks_is_materialized_once(self):
+        """Verifica che JWKS, JSON e chiave di verifica siano calcolati una sola volta"""
+        service = JWKSService()
+
+        assert service.get_jwks() is service.get_jwks()
+        assert service.get_jwks_json() is service.get_jwks_json()
+        assert service.get_verification_key() is service.get_verification_key()
+
+    def test_jwks_etag_is_strong_and_stable(self):
+        """Verifica che l'ETag sia forte e stabile per la stessa chiave"""
+        service = JWKSService()
+        etag = service.get_jwks_etag()
+
+        assert etag.startswith('"') and etag.endswith('"')
+        assert not etag.startswith("W/")
+        assert service.get_jwks_etag() == etag
+
+    def test_jwks_etag_changes_with_key(self):
+        """Verifica che l'ETag cambi quando vengono rigenerate le chiavi"""
+        service = JWKSService()
+        old_etag = service.get_jwks_etag()
+
+        service._generate_keys()
+
+        assert service.get_jwks_etag() != old_etag
+
+
+class TestPersistentSigningKey:
+    """Test per il caricamento/salvataggio della chiave di firma"""
+
+    def test_load_from_pem(self):
+        """Verifica che una chiave PEM fornita venga usata così com'è"""
+        source = JWKSService()
+        service = JWKSService(private_key_pem=source.get_private_key_pem())
+
+        assert service.get_jwks() == source.get_jwks()
+
+    def test_load_from_pem_with_escaped_newlines(self):
+        """Verifica il supporto ai newline letterali tipici delle variabili d'ambiente"""
+        source = JWKSService()
+        escaped = source.get_private_key_pem().replace("\n", "\\n")
+        service = JWKSService(private_key_pem=escaped)
+
+        assert service.get_jwks() == source.get_jwks()
+
+    def test_key_file_is_generated_and_persisted(self, tmp_path):
+        """Verifica che al primo avvio la chiave venga generata e salvata nel file"""
+        key_file = tmp_path / "keys" / "signing-key.pem"
+        service = JWKSService(key_file=str(key_file))
+
+        assert key_file.exists()
+        assert key_file.read_text() == service.get_private_key_pem()
+        assert (key_file.stat().st_mode & 0o777) == 0o600
+        assert list(key_file.parent.iterdir()) == [key_file]
+
+    def test_key_file_is_reused(self, tmp_path):
+        """Verifica che più istanze con lo stesso file condividano la chiave"""
+        key_file = str(tmp_path / "signing-key.pem")
+        service1 = JWKSService(key_file=key_file)
+        service2 = JWKSService(key_file=key_file)
+
+        assert service1.get_jwks() == service2.get_jwks()
+
+    def test_non_rsa_key_is_rejected(self):
+        """Verifica che una chiave non RSA venga rifiutata"""
+        pem = (
+            ec.generate_private_key(ec.SECP256R1())
+            .private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+            .decode()
+        )
+
+        with pytest.raises(ValueError):
+            JWKSService(private_key_pem=pem)
+
+
+class TestSigningAlgorithms:
+    """Test per gli algoritmi di firma configurabili"""
+
+    @pytest.mark.parametrize(
+        "algorithm, kty, params",
+        [
+            ("RS256", "RSA", {"n", "e"}),
+            ("PS256", "RSA", {"n", "e"}),
+            ("ES256", "EC", {"crv", "x", "y"}),
+            ("EdDSA", "OKP", {"crv", "x"}),
+        ],
+    )
+    def test_jwks_follows_algorithm(self, algorithm, kty, params):
+        """Verifica tipo di chiave e parametri pubblici del JWKS per ogni algoritmo"""
+        service = JWKSService(algorithm=algorithm)
+        key = service.get_jwks()["keys"][0]
+
+        assert key["kty"] == kty
+        assert key["alg"] == algorithm
+        assert set(key) == {"kty", "use", "kid", "alg"} | params
+
+    def test_es256_coordinates_have_fixed_length(self):
+        """Verifica che le coordinate EC siano codificate su 32 byte"""
+        key = JWKSService(algorithm="ES256").get_jwks()["keys"][0]
+
+        assert key["crv"] == "P-256"
+        for coordinate in ("x", "y"):
+            assert len(base64.urlsafe_b64decode(key[coordinate] + "==")) == 32
+
+    def test_key_file_with_matching_algorithm(self, tmp_path):
+        """Verifica il salvataggio/caricamento di chiavi non RSA"""
+        key_file = str(tmp_path / "ed25519.pem")
+        service1 = JWKSService(key_file=key_file, algorithm="EdDSA")
+        service2 = JWKSService(key_file=key_file, algorithm="EdDSA")
+
+        assert service1.get_jwks() == service2.get_jwks()
+
+    def test_kid_is_rfc7638_thumbprint(self):
+        """Verifica il thumbprint con l'esempio della RFC 7638 e il kid della chiave attiva"""
+        n = int.from_bytes(base64.urlsafe_b64decode(RFC7638_N + "=="), byteorder="big")
+        public_key = rsa.RSAPublicNumbers(65537, n).public_key()
+        service = JWKSService(algorithm="ES256")
+
+        assert jwk_thumbprint(public_key) == RFC7638_THUMBPRINT
+        assert service.get_kid() == jwk_thumbprint(service.public_key)
+
+    def test_key_of_wrong_type_is_rejected(self):
+        """Verifica che una chiave RSA non possa essere usata per ES256"""
+        pem = JWKSService().get_private_key_pem()
+
+        with pytest.raises(ValueError):
+            JWKSService(private_key_pem=pem, algorithm="ES256")
+
+
+class TestKeyRotation:
+    """Test per la rotazione delle chiavi di firma"""
+
+    def test_rotate_publishes_both_keys(self):
+        """Verifica che dopo la rotazione il JWKS contenga la chiave nuova e quella ritirata"""
+        service = JWKSService()
+        old_kid = service.get_kid()
+        old_etag = service.get_jwks_etag()
+
+        service.rotate()
+
+        kids = [key["kid"] for key in service.get_jwks()["keys"]]
+        assert service.get_kid() != old_kid
+        assert kids == [old_kid, service.get_kid()]
+        assert service.get_jwks_etag() != old_etag
+
+    def test_independent_rotations_publish_distinct_kids(self, tmp_path):
+        """Verifica che repliche con la stessa chiave iniziale non riusino un kid dopo la rotazione"""
+        key_file = str(tmp_path / "signing-key.pem")
+        replica1 = JWKSService(key_file=key_file)
+        replica2 = JWKSService(key_file=key_file)
+        assert replica1.get_kid() == replica2.get_kid()
+
+        replica1.rotate()
+        replica2.rotate()
+
+        assert replica1.get_kid() != replica2.get_kid()
+
+    def test_verification_key_by_kid(self):
+        """Verifica la selezione della chiave di verifica per kid"""
+        service = JWKSService()
+        old_kid = service.get_kid()
+        old_key = service.get_verification_key()
+
+        service.rotate()
+
+        assert service.get_verification_key(old_kid) is old_key
+        assert service.get_verification_key(service.get_kid()) is service.get_verification_key()
+        assert service.get_verification_key("unknown-kid") is None
+
+    def test_scheduled_rotation(self, monkeypatch):
+        """Verifica pubblicazione anticipata, attivazione e rimozione della chiave ritirata"""
+        monkeypatch.setattr(settings, "key_rotation_interval", 3600)
+        monkeypatch.setattr(settings, "key_rotation_grace_period", 300)
+        monkeypatch.setattr(settings, "access_token_expiry", 600)
+        monkeypatch.setattr(settings, "id_token_expiry", 600)
+        service = JWKSService()
+        now = time.time()
+        old_kid = service.get_kid()
+
+        # Prima della finestra di grazia non cambia nulla
+        monkeypatch.setattr(time, "time", lambda: now + 3000)
+        assert service.rotate_if_due() is False
+
+        # La nuova chiave viene pubblicata ma non usata per firmare
+        monkeypatch.setattr(time, "time", lambda: now + 3300)
+        assert service.rotate_if_due() is True
+        assert len(service.get_jwks()["keys"]) == 2
+        assert service.get_kid() == old_kid
+
+        # Dopo la finestra di grazia diventa attiva
+        monkeypatch.setattr(time, "time", lambda: now + 3600)
+        assert service.rotate_if_due() is True
+        assert service.get_kid() != old_kid
+        assert len(service.get_jwks()["keys"]) == 2
+
+        # La vecchia chiave viene rimossa dopo la durata massima dei token
+        monkeypatch.setattr(time, "time", lambda: now + 4200)
+        assert service.rotate_if_due() is True
+        assert [key["kid"] for key in service.get_jwks()["keys"]] == [service.get_kid()]
+
+    def test_rotation_disabled_by_default(self):
+        """Verifica che senza KEY_ROTATION_INTERVAL la chiave non ruoti"""
+        service = JWKSService()
+
+        assert service.rotate_if_due() is False
+        assert len(service.get_jwks()["keys"]) == 1
+
+    def test_key_pool_is_used_for_rotation(self):
+        """Verifica che la rotazione usi una chiave pre-generata dal pool"""
+        service = JWKSService(key_pool_size=1, key_pool_processes=0)
+        service.key_pool.fill()
+        service.key_pool.wait()
+        pooled = service.key_pool._keys[0]
+
+        service.rotate()
+
+        assert service.private_key is pooled
+        service.key_pool.shutdown()
+
+
+class TestKeyPool:
+    """Test per il pool di chiavi pre-generate"""
+
+    @pytest.mark.parametrize("algorithm", ["RS256", "ES256"])
+    def test_pool_is_filled_by_worker_process(self, algorithm):
+        """Verifica che le chiavi generate nel processo separato siano utilizzabili"""
+        pool = KeyPool(algorithm, size=2, processes=1)
+        try:
+            pool.fill()
+            pool.wait(timeout=60)
+
+            assert len(pool) == 2
+            check_private_key(pool.take(), algorithm)
+        finally:
+            pool.shutdown()
+
+    def test_take_from_empty_pool_generates_synchronously(self):
+        """Verifica che con il pool vuoto la chiave venga comunque generata"""
+        pool = KeyPool("ES256", size=0)
+
+        assert pool.take() is not None
+        assert len(pool) == 0
+
+    def test_fill_does_not_overshoot(self):
+        """Verifica che le generazioni in corso contino per la dimensione del pool"""
+        pool = KeyPool("ES256", size=2, processes=0)
+        try:
+            pool.fill()
+            pool.fill()
+            pool.wait()
+
+            assert len(pool) == 2
+        finally:
+            pool.shutdown()
@@ -0,0 +1,90 @@
+"""
+Unit tests per il modulo login_page
+"""
+
+import gzip
+
+from login_page import CompiledTemplate, StaticAsset, login_template
+
+
+class TestCompiledTemplate:
+    """Test per il template compilato"""
+
+    def test_render_substitutes_fields(self):
+        """Verifica la sostituzione dei campi dinamici"""
+        template = CompiledTemplate("<p>{greeting}, {name}!</p>")
+
+        assert template.fields == ["greeting", "name"]
+        assert template.render(greeting="Ciao", name="Mario") == b"<p>Ciao, Mario!</p>"
+
+    def test_dynamic_fields_are_escaped(self):
+        """Verifica l'escape HTML dei valori (anche negli attributi)"""
+        template = CompiledTemplate('<input value="{value}">')
+
+        rendered = template.render(value='"><script>alert(1)</script>')
+
+        assert rendered == b'<input value="&quot;&gt;&lt;script&gt;alert(1)&lt;/script&gt;">'
+
+    def test_missing_fields_render_empty(self):
+        """Verifica che campi assenti o None diventino stringhe vuote"""
+        template = CompiledTemplate("[{a}|{b}]")
+
+        assert template.render(a=None) == b"[|]"
+
+    def test_static_fields_are_baked_in(self):
+        """Verifica che i campi statici siano inseriti una volta nei segmenti statici"""
+        template = CompiledTemplate('<link href="{css}"><p>{name}</p>', css="/a.css")
+
+        assert template.fields == ["name"]
+        assert template.render(name="x") == b'<link href="/a.css"><p>x</p>'
+
+    def test_login_template_fields(self):
+        """Verifica che il template di login abbia solo i parametri della richiesta come campi dinamici"""
+        assert "css_path" not in login_template.fields
+        assert set(login_template.fields) == {
+            "client_id",
+            "scope",
+            "response_type",
+            "redirect_uri",
+            "state",
+            "nonce",
+            "code_challenge",
+            "code_challenge_method",
+        }
+
+
+class TestStaticAsset:
+    """Test per le risorse statiche pre-compresse"""
+
+    def test_gzip_variant_is_precomputed(self):
+        """Verifica che la variante gzip decomprima al contenuto originale"""
+        asset = StaticAsset("body{color:red}" * 50, "text/css")
+
+        content, encoding = asset.negotiate("gzip, deflate")
+
+        assert encoding == "gzip"
+        assert gzip.decompress(content) == asset.identity
+        assert len(content) < len(asset.identity)
+
+    def test_identity_when_compression_not_accepted(self):
+        """Verifica il contenuto non compresso senza Accept-Encoding o con q=0"""
+        asset = StaticAsset("body{}", "text/css")
+
+        assert asset.negotiate("") == (asset.identity, None)
+        assert asset.negotiate("gzip;q=0") == (asset.identity, None)
+
+    def test_compression_is_deterministic(self):
+        """Verifica che ETag e bytes compressi siano identici tra istanze (repliche)"""
+        first = StaticAsset("body{}", "text/css")
+        second = StaticAsset("body{}", "text/css")
+
+        assert first.etags == second.etags
+        assert first.variants == second.variants
+
+    def test_each_variant_has_its_own_etag(self):
+        """Verifica che identity e varianti compresse abbiano ETag forti distinti"""
+        asset = StaticAsset("body{}", "text/css")
+
+        assert asset.etags[None] == asset.etag
+        assert asset.etags["gzip"] == asset.etag[:-1] + '-gzip"'
+        assert len(set(asset.etags.values())) == len(asset.variants) + 1
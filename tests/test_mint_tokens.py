@@ -0,0 +1,55 @@
+"""
+Unit tests per la CLI mint_tokens
+"""
+
+import csv
+import json
+
+from jwks_service import JWKSService
+from mint_tokens import main
+from token_service import TokenService
+
+
+def _verifier(key_file):
+    service = TokenService()
+    service.jwks_service = JWKSService(key_file=str(key_file))
+    return service
+
+
+class TestMintTokens:
+    """Test per la generazione offline dei token"""
+
+    def test_ndjson_output_is_verifiable_with_persisted_key(self, tmp_path):
+        """Verifica che i token siano scritti in ordine e firmati con la chiave persistita"""
+        key_file = tmp_path / "key.pem"
+        output = tmp_path / "tokens.ndjson"
+
+        main(
+            ["--count", "7", "--chunk-size", "3", "--processes", "2", "--key-file", str(key_file)]
+            + ["--output", str(output), "--issuer", "http://oidc.test"]
+        )
+
+        lines = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [line["email"] for line in lines] == [f"user{i}@loadtest.example.com" for i in range(7)]
+        verifier = _verifier(key_file)
+        claims = verifier.decode_token(lines[6]["access_token"])
+        assert claims["email"] == "user6@loadtest.example.com"
+        assert claims["iss"] == "http://oidc.test"
+        assert verifier.decode_token(lines[0]["id_token"])["aud"] == "load-test"
+
+    def test_csv_output_from_emails_file(self, tmp_path):
+        """Verifica l'output CSV a partire da un file di email (righe vuote ignorate)"""
+        key_file = tmp_path / "key.pem"
+        emails_file = tmp_path / "emails.txt"
+        emails_file.write_text("mario.rossi@example.com\n\nanna.bianchi@example.com\n")
+        output = tmp_path / "tokens.csv"
+
+        main(
+            ["--emails-file", str(emails_file), "--format", "csv", "--processes", "1"]
+            + ["--key-file", str(key_file), "--output", str(output)]
+        )
+
+        with open(output, newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert [row["email"] for row in rows] == ["mario.rossi@example.com", "anna.bianchi@example.com"]
+        assert _verifier(key_file).decode_token(rows[1]["access_token"])["sub"] == rows[1]["sub"]
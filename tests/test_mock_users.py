@@ -0,0 +1,211 @@
+"""
+Unit tests per il modulo mock_users
+"""
+
+import hashlib
+import json
+import os
+
+import pytest
+
+from claims_generator import generate_claims_from_email
+from mock_users import UserIndex, iter_user_records
+
+USERS = [
+    {"username": "user1@example.com", "password": "password1", "claims": {"sub": "sub-1", "roles": ["Reader"]}},
+    {"username": "admin@example.com", "password": "admin123"},
+]
+
+
+def _write(path, content: str) -> str:
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+class TestUserIndex:
+    """Test per l'autenticazione tramite indice"""
+
+    def test_valid_credentials_return_claims(self):
+        """Verifica che credenziali corrette restituiscano i claims configurati"""
+        index = UserIndex(users=USERS)
+
+        claims = index.authenticate("user1@example.com", "password1")
+
+        assert claims["sub"] == "sub-1"
+        assert claims["roles"] == ["Reader"]
+
+    def test_invalid_credentials_are_rejected(self):
+        """Verifica che password errate o utenti sconosciuti non siano autenticati"""
+        index = UserIndex(users=USERS)
+
+        assert index.authenticate("user1@example.com", "wrong") is None
+        assert index.authenticate("unknown@example.com", "password1") is None
+
+    def test_missing_claims_are_generated_from_email(self):
+        """Verifica che utenti senza claims ricevano i claims generati dall'email"""
+        index = UserIndex(users=USERS)
+
+        assert index.authenticate("admin@example.com", "admin123") == generate_claims_from_email("admin@example.com")
+
+    def test_prehashed_password(self):
+        """Verifica il supporto di password_hash al posto della password in chiaro"""
+        digest = hashlib.sha256(b"secret").hexdigest()
+        index = UserIndex(users=[{"username": "hashed@example.com", "password_hash": f"sha256:{digest}"}])
+
+        assert index.authenticate("hashed@example.com", "secret") is not None
+        assert index.authenticate("hashed@example.com", f"sha256:{digest}") is None
+
+    def test_invalid_user_is_rejected(self):
+        """Verifica che utenti senza password facciano fallire il caricamento"""
+        with pytest.raises(ValueError):
+            UserIndex(users=[{"username": "nopassword@example.com"}]).authenticate("nopassword@example.com", "")
+
+    def test_disabled_without_sources(self):
+        """Verifica che senza sorgenti l'indice sia disabilitato (login dinamico)"""
+        assert not UserIndex().enabled
+        assert UserIndex(users=[]).enabled
+
+    def test_inline_json(self):
+        """Verifica il caricamento da stringa JSON (variabile d'ambiente)"""
+        index = UserIndex(inline_json=json.dumps(USERS))
+
+        assert index.authenticate("user1@example.com", "password1")["sub"] == "sub-1"
+        assert len(index) == 2
+
+
+class TestUserFiles:
+    """Test per il caricamento degli utenti da file"""
+
+    def test_json_file(self, tmp_path):
+        """Verifica il caricamento da file JSON (lista o {"users": [...]})"""
+        path = _write(tmp_path / "users.json", json.dumps({"users": USERS}))
+
+        assert [u["username"] for u in iter_user_records(path)] == ["user1@example.com", "admin@example.com"]
+
+    def test_ndjson_file(self, tmp_path):
+        """Verifica il caricamento riga per riga da NDJSON"""
+        path = _write(tmp_path / "users.ndjson", "".join(json.dumps(u) + "\n" for u in USERS) + "\n")
+
+        index = UserIndex(path=path)
+
+        assert len(index) == 2
+        assert index.authenticate("user1@example.com", "password1")["roles"] == ["Reader"]
+
+    def test_csv_file(self, tmp_path):
+        """Verifica il caricamento da CSV con claims e liste separate da ';'"""
+        path = _write(
+            tmp_path / "users.csv",
+            "username,password,sub,roles\nuser1@example.com,password1,sub-1,Reader;Writer\nuser2@example.com,pw2,,\n",
+        )
+
+        index = UserIndex(path=path)
+
+        claims = index.authenticate("user1@example.com", "password1")
+        assert claims["sub"] == "sub-1"
+        assert claims["roles"] == ["Reader", "Writer"]
+        assert index.authenticate("user2@example.com", "pw2")["email"] == "user2@example.com"
+
+    def test_partial_claims_are_completed_from_email(self, tmp_path):
+        """Verifica che un CSV con solo alcune colonne di claims produca comunque claims completi"""
+        path = _write(tmp_path / "users.csv", "username,password,roles\nmario.rossi@example.com,pw,Admin;User\n")
+
+        claims = UserIndex(path=path).authenticate("mario.rossi@example.com", "pw")
+        generated = generate_claims_from_email("mario.rossi@example.com")
+
+        assert claims["roles"] == ["Admin", "User"]
+        assert claims["sub"] == generated["sub"]
+        assert claims["email"] == "mario.rossi@example.com"
+        assert claims["oid"] == generated["oid"]
+
+    def test_yaml_file(self, tmp_path):
+        """Verifica il caricamento da YAML"""
+        pytest.importorskip("yaml")
+        path = _write(tmp_path / "users.yaml", "- username: user1@example.com\n  password: password1\n")
+
+        assert UserIndex(path=path).authenticate("user1@example.com", "password1") is not None
+
+    def test_non_object_records_are_invalid(self, tmp_path):
+        """Verifica che righe valide in JSON ma non oggetti siano rifiutate come contenuto non valido"""
+        path = _write(tmp_path / "users.ndjson", json.dumps(USERS[0]) + "\n[1, 2]\n")
+
+        with pytest.raises(ValueError):
+            UserIndex(path=path).authenticate("user1@example.com", "password1")
+        with pytest.raises(ValueError):
+            UserIndex(users=[{"username": "x@example.com", "password": 123}]).authenticate("x@example.com", "123")
+
+    def test_unsupported_format(self, tmp_path):
+        """Verifica che un formato non supportato sia segnalato"""
+        path = _write(tmp_path / "users.txt", "user1@example.com")
+
+        with pytest.raises(ValueError):
+            list(iter_user_records(path))
+
+
+class TestHotReload:
+    """Test per il ricaricamento del file quando cambia"""
+
+    def test_file_changes_are_picked_up(self, tmp_path):
+        """Verifica che un file modificato venga ricaricato"""
+        path = _write(tmp_path / "users.json", json.dumps(USERS[:1]))
+        index = UserIndex(path=path)
+        index.load()
+        assert index.authenticate("admin@example.com", "admin123") is None
+
+        _write(tmp_path / "users.json", json.dumps(USERS))
+        os.utime(path, ns=(0, 10**18))
+
+        assert index.refresh() is True
+        assert index.authenticate("admin@example.com", "admin123") is not None
+        assert index.stats() == {"users": 2, "reloads": 1}
+
+    def test_login_does_not_read_the_file(self, tmp_path):
+        """Verifica che il login usi l'indice caricato senza ricontrollare il file"""
+        path = _write(tmp_path / "users.json", json.dumps(USERS[:1]))
+        index = UserIndex(path=path)
+        index.load()
+
+        _write(tmp_path / "users.json", json.dumps(USERS))
+        os.utime(path, ns=(0, 10**18))
+
+        assert index.authenticate("admin@example.com", "admin123") is None
+
+    def test_unchanged_file_is_not_reloaded(self, tmp_path):
+        """Verifica che senza modifiche al file l'indice non venga ricostruito"""
+        path = _write(tmp_path / "users.json", json.dumps(USERS))
+        index = UserIndex(path=path)
+        index.load()
+
+        assert index.refresh() is False
+        assert index.stats()["reloads"] == 0
+
+    def test_non_object_record_keeps_previous_users(self, tmp_path):
+        """Verifica che un record non oggetto in un reload lasci in uso gli utenti precedenti"""
+        path = _write(tmp_path / "users.ndjson", json.dumps(USERS[0]) + "\n")
+        index = UserIndex(path=path)
+        index.load()
+
+        _write(tmp_path / "users.ndjson", json.dumps(USERS[0]) + "\n[1, 2]\n")
+        os.utime(path, ns=(0, 10**18))
+
+        assert index.refresh() is False
+        assert index.authenticate("user1@example.com", "password1") is not None
+        assert index.stats()["reloads"] == 0
+
+    def test_invalid_file_keeps_previous_users(self, tmp_path):
+        """Verifica che un file non valido non interrompa i login e venga riletto solo dopo una modifica"""
+        path = _write(tmp_path / "users.json", json.dumps(USERS))
+        index = UserIndex(path=path)
+        index.load()
+
+        _write(tmp_path / "users.json", "[{not json")
+        os.utime(path, ns=(0, 10**18))
+
+        assert index.refresh() is False
+        assert index.authenticate("user1@example.com", "password1") is not None
+        assert index.stats()["reloads"] == 0
+
+        _write(tmp_path / "users.json", json.dumps(USERS[:1]))
+        os.utime(path, ns=(0, 2 * 10**18))
+
+        assert index.refresh() is True
+        assert index.authenticate("admin@example.com", "admin123") is None
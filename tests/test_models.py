@@ -2,6 +2,8 @@
 Unit tests per i modelli Pydantic
 """
 
+import time
+
 import pytest
 from pydantic import ValidationError
 
@@ -190,3 +192,33 @@ class TestAuthorizationCode:
             nonce="test-nonce",
         )
         assert code.nonce == "test-nonce"
+
+    def test_authorization_code_dict_roundtrip(self):
+        """Test per serializzazione/deserializzazione verso lo storage"""
+        code = AuthorizationCode(
+            code="test-code",
+            client_id="test-client",
+            redirect_uri="http://localhost:3000/callback",
+            scope="openid",
+            user_claims={"sub": "test-user"},
+            code_challenge="test-challenge",
+            code_challenge_method="S256",
+            nonce="test-nonce",
+        )
+        restored = AuthorizationCode.from_dict(code.to_dict())
+
+        assert restored.to_dict() == code.to_dict()
+
+    def test_authorization_code_expiry(self):
+        """Test per la scadenza basata sul timestamp di creazione"""
+        code = AuthorizationCode(
+            code="test-code",
+            client_id="test-client",
+            redirect_uri="http://localhost:3000/callback",
+            scope="openid",
+            user_claims={"sub": "test-user"},
+            created_at=time.time() - 700,
+        )
+
+        assert code.is_expired(600)
+        assert not code.is_expired(800)
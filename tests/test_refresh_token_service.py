@@ -0,0 +1,188 @@
+"""
+Unit tests per il modulo refresh_token_service
+"""
+
+import time
+
+import pytest
+
+from config import settings
+from refresh_token_service import RefreshTokenService
+from storage import MemoryStore
+
+
+@pytest.fixture
+def service():
+    """Servizio refresh token con store in memoria dedicati"""
+    return RefreshTokenService(MemoryStore("refresh_tokens"), MemoryStore("claim_sets"), MemoryStore("index"))
+
+
+class TestRefreshTokenIssue:
+    """Test per emissione e riscatto senza rotazione"""
+
+    def test_issue_and_redeem(self, service, sample_user_claims):
+        """Verifica che un token emesso possa essere riscattato più volte"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+
+        for _ in range(2):
+            data = service.redeem(token)
+            assert data["user_claims"] == sample_user_claims
+            assert data["scope"] == "openid"
+            assert data["client_id"] == "test-client"
+            assert data["refresh_token"] is None
+
+    def test_claims_are_interned(self, service, sample_user_claims):
+        """Verifica che login ripetuti condividano un unico claim set"""
+        tokens = [service.issue(dict(sample_user_claims), "openid", "test-client") for _ in range(5)]
+
+        assert len(service.claim_sets) == 1
+        assert len(service.tokens) == 5
+        assert service.redeem(tokens[0])["user_claims"] is service.redeem(tokens[4])["user_claims"]
+
+    def test_token_expires(self, service, sample_user_claims, monkeypatch):
+        """Verifica che il token non sia più valido dopo refresh_token_expiry"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+        expired_at = time.time() + settings.refresh_token_expiry + 1
+        monkeypatch.setattr(time, "time", lambda: expired_at)
+
+        assert service.redeem(token) is None
+
+    def test_revoke(self, service, sample_user_claims):
+        """Verifica che un token revocato non sia più valido"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+        service.revoke(token)
+
+        assert service.redeem(token) is None
+        assert token not in service
+
+
+class TestRefreshTokenRotation:
+    """Test per rotazione e rilevamento del riutilizzo"""
+
+    @pytest.fixture(autouse=True)
+    def enable_rotation(self, monkeypatch):
+        monkeypatch.setattr(settings, "refresh_token_rotation", True)
+
+    def test_redeem_rotates_token(self, service, sample_user_claims):
+        """Verifica che ogni uso restituisca un nuovo token"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+        data = service.redeem(token)
+
+        assert data["refresh_token"] is not None
+        assert data["refresh_token"] != token
+        assert data["refresh_token"] in service
+        assert token not in service
+
+    def test_reuse_revokes_family(self, service, sample_user_claims):
+        """Verifica che il riutilizzo di un token ruotato revochi anche il token corrente"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+        new_token = service.redeem(token)["refresh_token"]
+
+        with pytest.raises(ValueError):
+            service.redeem(token)
+
+        assert service.redeem(new_token) is None
+        assert service.reuse_detected_count == 1
+
+
+class TestRefreshTokenIntrospection:
+    """Test per l'introspection dei refresh token"""
+
+    def test_introspect_does_not_consume_token(self, service, sample_user_claims, monkeypatch):
+        """Verifica che l'introspection restituisca i metadati senza ruotare il token"""
+        monkeypatch.setattr(settings, "refresh_token_rotation", True)
+        token = service.issue(sample_user_claims, "openid offline_access", "test-client")
+
+        metadata = service.introspect(token)
+
+        assert metadata["sub"] == sample_user_claims["sub"]
+        assert metadata["scope"] == "openid offline_access"
+        assert metadata["client_id"] == "test-client"
+        assert metadata["exp"] > time.time()
+        assert service.redeem(token) is not None
+
+    def test_rotated_and_revoked_tokens_are_inactive(self, service, sample_user_claims, monkeypatch):
+        """Verifica che token ruotati, revocati o sconosciuti non abbiano metadati"""
+        monkeypatch.setattr(settings, "refresh_token_rotation", True)
+        rotated = service.issue(sample_user_claims, "openid", "test-client")
+        current = service.redeem(rotated)["refresh_token"]
+        service.revoke(current)
+
+        assert service.introspect(rotated) is None
+        assert service.introspect(current) is None
+        assert service.introspect("refresh_unknown") is None
+
+    def test_stateless_introspection(self, service, sample_user_claims, monkeypatch):
+        """Verifica l'introspection dei token self-contained"""
+        monkeypatch.setattr(settings, "stateless_tokens", True)
+        token = service.issue(sample_user_claims, "openid", "test-client")
+
+        assert service.introspect(token)["client_id"] == "test-client"
+        service.revoke(token)
+        assert service.introspect(token) is None
+
+
+class TestRefreshTokenCap:
+    """Test per il limite di token per utente/client"""
+
+    def test_oldest_tokens_are_evicted(self, service, sample_user_claims, monkeypatch):
+        """Verifica che oltre il limite vengano eliminati i token più vecchi"""
+        monkeypatch.setattr(settings, "refresh_token_max_per_user", 2)
+        tokens = [service.issue(sample_user_claims, "openid", "test-client") for _ in range(3)]
+
+        assert tokens[0] not in service
+        assert tokens[1] in service
+        assert tokens[2] in service
+
+    def test_cap_is_per_client(self, service, sample_user_claims, monkeypatch):
+        """Verifica che il limite sia applicato separatamente per ogni client"""
+        monkeypatch.setattr(settings, "refresh_token_max_per_user", 1)
+        token_a = service.issue(sample_user_claims, "openid", "client-a")
+        token_b = service.issue(sample_user_claims, "openid", "client-b")
+
+        assert token_a in service
+        assert token_b in service
+
+
+class TestStatelessRefreshTokens:
+    """Test per i refresh token self-contained"""
+
+    @pytest.fixture(autouse=True)
+    def enable_stateless(self, monkeypatch):
+        monkeypatch.setattr(settings, "stateless_tokens", True)
+
+    def test_redeem_without_stored_token(self, service, sample_user_claims):
+        """Verifica che il token sia riscattabile senza salvarlo nello storage"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+
+        assert len(service.tokens) == 0
+        assert service.redeem(token)["user_claims"] == sample_user_claims
+
+    def test_any_replica_can_redeem(self, service, sample_user_claims):
+        """Verifica che un'altra istanza (replica) possa riscattare il token"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+        replica = RefreshTokenService(MemoryStore("t"), MemoryStore("c"), MemoryStore("i"))
+
+        assert replica.redeem(token)["client_id"] == "test-client"
+
+    def test_revoke(self, service, sample_user_claims):
+        """Verifica che un token self-contained possa essere revocato"""
+        token = service.issue(sample_user_claims, "openid", "test-client")
+        service.revoke(token)
+
+        assert service.redeem(token) is None
+
+    def test_rotation_replay_is_detected(self, service, sample_user_claims, monkeypatch):
+        """Verifica che con la rotazione ogni token sia riscattabile una sola volta"""
+        monkeypatch.setattr(settings, "refresh_token_rotation", True)
+        token = service.issue(sample_user_claims, "openid", "test-client")
+        new_token = service.redeem(token)["refresh_token"]
+
+        with pytest.raises(ValueError):
+            service.redeem(token)
+        assert service.redeem(new_token) is None
+
+    def test_invalid_token(self, service):
+        """Verifica che token non validi vengano rifiutati"""
+        assert service.redeem("refresh_invalid") is None
+        assert service.redeem("invalid") is None
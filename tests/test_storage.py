@@ -0,0 +1,253 @@
+"""
+Unit tests per il modulo storage
+"""
+
+import fnmatch
+import sqlite3
+import time
+
+import pytest
+
+from config import settings
+from storage import MemoryStore, RedisStore, SQLiteStore, StoreBusyError, create_store
+
+
+class FakeRedis:
+    """Stand-in locale di un client Redis (solo i comandi usati da RedisStore)"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        if px is not None:
+            self.ttls[key] = px
+        return True
+
+    def getdel(self, key):
+        return self.data.pop(key, None)
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def scan_iter(self, match="*"):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    """Store per ciascun backend supportato"""
+    if request.param == "memory":
+        return MemoryStore("test")
+    if request.param == "sqlite":
+        return SQLiteStore("test", str(tmp_path / "store.db"))
+    return RedisStore("test", client=FakeRedis())
+
+
+class TestStoreBackends:
+    """Test comuni a tutti i backend"""
+
+    def test_set_and_get(self, store):
+        """Verifica che un valore salvato venga restituito"""
+        store.set("key", {"a": 1, "b": ["x"]})
+
+        assert store.get("key") == {"a": 1, "b": ["x"]}
+        assert "key" in store
+        assert len(store) == 1
+
+    def test_get_missing_returns_none(self, store):
+        """Verifica che una chiave assente restituisca None"""
+        assert store.get("missing") is None
+        assert "missing" not in store
+
+    def test_pop_returns_value_once(self, store):
+        """Verifica che pop restituisca il valore una sola volta"""
+        store.set("code", {"client_id": "c"})
+
+        assert store.pop("code") == {"client_id": "c"}
+        assert store.pop("code") is None
+        assert len(store) == 0
+
+    def test_add_only_if_absent(self, store):
+        """Verifica che add salvi il valore solo la prima volta"""
+        assert store.add("jti", {"used": True}, ttl=60) is True
+        assert store.add("jti", {"used": False}, ttl=60) is False
+        assert store.get("jti") == {"used": True}
+
+    def test_delete(self, store):
+        """Verifica la cancellazione (anche di chiavi assenti)"""
+        store.set("key", {"a": 1})
+        store.delete("key")
+        store.delete("missing")
+
+        assert store.get("key") is None
+
+
+class TestExpiry:
+    """Test per le scadenze (TTL) e la pulizia delle chiavi scadute"""
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_expired_key_is_not_returned(self, backend, tmp_path, monkeypatch):
+        """Verifica che una chiave scaduta non venga più restituita"""
+        store = MemoryStore("test") if backend == "memory" else SQLiteStore("test", str(tmp_path / "s.db"))
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+        store.set("code", {"a": 1}, ttl=10)
+
+        assert store.get("code") == {"a": 1}
+
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+        assert store.get("code") is None
+        assert store.pop("code") is None
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_sweep_removes_only_expired_keys(self, backend, tmp_path, monkeypatch):
+        """Verifica che lo sweep rimuova solo le chiavi scadute e aggiorni le metriche"""
+        store = MemoryStore("test") if backend == "memory" else SQLiteStore("test", str(tmp_path / "s.db"))
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+        store.set("short", {"a": 1}, ttl=5)
+        store.set("long", {"a": 2}, ttl=60)
+        store.set("forever", {"a": 3})
+
+        monkeypatch.setattr(time, "time", lambda: now + 10)
+
+        assert store.sweep() == 1
+        assert store.sweep() == 0
+        assert store.stats() == {"live": 2, "expired": 1}
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_add_replaces_expired_key(self, backend, tmp_path, monkeypatch):
+        """Verifica che add possa riusare una chiave scaduta non ancora rimossa"""
+        store = MemoryStore("test") if backend == "memory" else SQLiteStore("test", str(tmp_path / "s.db"))
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+        store.add("jti", {"v": 1}, ttl=5)
+
+        monkeypatch.setattr(time, "time", lambda: now + 10)
+
+        assert store.add("jti", {"v": 2}, ttl=5) is True
+        assert store.get("jti") == {"v": 2}
+
+    def test_memory_sweep_ignores_overwritten_keys(self, monkeypatch):
+        """Verifica che una chiave riscritta con nuova scadenza non venga rimossa in anticipo"""
+        store = MemoryStore("test")
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+        store.set("key", {"v": 1}, ttl=5)
+        store.set("key", {"v": 2}, ttl=60)
+
+        monkeypatch.setattr(time, "time", lambda: now + 10)
+
+        assert store.sweep() == 0
+        assert store.get("key") == {"v": 2}
+
+    def test_redis_uses_server_side_expiry(self):
+        """Verifica che il TTL venga passato a Redis in millisecondi"""
+        client = FakeRedis()
+        store = RedisStore("test", client=client)
+        store.set("code", {"a": 1}, ttl=2.5)
+
+        assert client.ttls["mockoidc:test:code"] == 2500
+        assert store.sweep() == 0
+
+
+class TestSharedBackends:
+    """Test per la condivisione dei dati tra istanze"""
+
+    def test_sqlite_stores_share_file(self, tmp_path):
+        """Verifica che due connessioni (es. due worker) vedano gli stessi dati"""
+        path = str(tmp_path / "shared.db")
+        worker1 = SQLiteStore("codes", path)
+        worker2 = SQLiteStore("codes", path)
+
+        worker1.set("code", {"scope": "openid"})
+
+        assert worker2.pop("code") == {"scope": "openid"}
+        assert worker1.get("code") is None
+
+    def test_sqlite_namespaces_are_isolated(self, tmp_path):
+        """Verifica che namespace diversi non collidano"""
+        path = str(tmp_path / "shared.db")
+        codes = SQLiteStore("codes", path)
+        tokens = SQLiteStore("tokens", path)
+
+        codes.set("key", {"kind": "code"})
+
+        assert tokens.get("key") is None
+        assert len(tokens) == 0
+
+    def test_redis_namespaces_are_isolated(self):
+        """Verifica che i namespace Redis usino prefissi distinti"""
+        client = FakeRedis()
+        codes = RedisStore("codes", client=client)
+        tokens = RedisStore("tokens", client=client)
+
+        codes.set("key", {"kind": "code"})
+
+        assert tokens.get("key") is None
+        assert len(codes) == 1
+        assert "mockoidc:codes:key" in client.data
+
+
+class TestBusyStorage:
+    """Test per lo storage conteso o irraggiungibile"""
+
+    def test_sqlite_lock_held_by_another_process_fails_fast(self, tmp_path):
+        """Verifica che un lock tenuto da un altro worker oltre il timeout sollevi StoreBusyError"""
+        path = str(tmp_path / "shared.db")
+        store = SQLiteStore("codes", path, timeout=0.05)
+        store.set("code", {"scope": "openid"})
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+
+        try:
+            start = time.monotonic()
+            with pytest.raises(StoreBusyError):
+                store.pop("code")
+            assert time.monotonic() - start < 1
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+
+        assert store.pop("code") == {"scope": "openid"}
+
+    def test_redis_connection_errors_become_busy(self):
+        """Verifica che gli errori di connessione del client Redis diventino StoreBusyError"""
+
+        class DownRedis(FakeRedis):
+            def get(self, key):
+                raise ConnectionError("connection refused")
+
+        store = RedisStore("test", client=DownRedis())
+        store._errors = (ConnectionError,)
+
+        with pytest.raises(StoreBusyError):
+            store.get("key")
+
+
+class TestCreateStore:
+    """Test per la factory degli store"""
+
+    def test_create_memory_store(self):
+        """Verifica la creazione dello store in memoria"""
+        assert isinstance(create_store("test", backend="memory"), MemoryStore)
+
+    def test_create_sqlite_store(self, tmp_path, monkeypatch):
+        """Verifica la creazione dello store SQLite dal path configurato"""
+        monkeypatch.setattr(settings, "storage_sqlite_path", str(tmp_path / "mockoidc.db"))
+        store = create_store("test", backend="sqlite")
+
+        assert isinstance(store, SQLiteStore)
+        assert store.path == settings.storage_sqlite_path
+
+    def test_unsupported_backend_raises(self):
+        """Verifica che un backend sconosciuto sollevi un errore"""
+        with pytest.raises(ValueError):
+            create_store("test", backend="unknown")
@@ -0,0 +1,265 @@
+"""
+Unit tests per il modulo token_service
+"""
+
+import asyncio
+import base64
+import time
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from jose import jwt
+
+from config import settings
+from jwks_service import JWKSService
+from token_service import TokenService
+
+
+class TestSigningKeyCache:
+    """Test per la chiave di firma pre-caricata"""
+
+    def test_signing_key_is_reused(self):
+        """Verifica che la chiave di firma venga costruita una sola volta"""
+        service = TokenService()
+        key1 = service._get_signing_key()
+        key2 = service._get_signing_key()
+
+        assert key1 is key2
+
+    def test_signing_key_is_rebuilt_on_key_change(self, sample_user_claims):
+        """Verifica che la chiave venga ricostruita quando cambia la chiave RSA"""
+        service = TokenService()
+        old_key = service._get_signing_key()
+
+        service.jwks_service = JWKSService()
+        new_key = service._get_signing_key()
+
+        assert new_key is not old_key
+        token = service.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+        claims = jwt.decode(
+            token, service.jwks_service.get_public_key_pem(), algorithms=["RS256"], options={"verify_aud": False}
+        )
+        assert claims["sub"] == sample_user_claims["sub"]
+
+    def test_signed_token_has_kid_header(self, sample_user_claims):
+        """Verifica che il token firmato contenga il kid nell'header"""
+        service = TokenService()
+        token = service.generate_id_token(sample_user_claims, "test-client", issuer="http://localhost")
+
+        header = jwt.get_unverified_header(token)
+        assert header["kid"] == service.jwks_service.get_kid()
+        assert header["alg"] == "RS256"
+
+    def test_generated_tokens_are_verifiable(self, sample_user_claims):
+        """Verifica che i token firmati siano validati da decode_token"""
+        service = TokenService()
+        token = service.generate_access_token(sample_user_claims, "openid profile", issuer="http://localhost")
+
+        claims = service.decode_token(token)
+        assert claims["scope"] == "openid profile"
+        assert claims["email"] == sample_user_claims["email"]
+
+
+class TestTokenIdentifiers:
+    """Test per hash e scadenza dei token"""
+
+    def test_hash_token_is_compact_and_stable(self):
+        """Verifica che l'hash sia deterministico e di lunghezza fissa"""
+        service = TokenService()
+        token_hash = service.hash_token("a" * 4096)
+
+        assert len(token_hash) == 64
+        assert token_hash == service.hash_token("a" * 4096)
+        assert token_hash != service.hash_token("b" * 4096)
+
+    def test_get_unverified_expiry(self, sample_user_claims):
+        """Verifica la lettura di exp da un JWT e None per token opachi"""
+        service = TokenService()
+        token = service.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+
+        assert service.get_unverified_expiry(token) == jwt.get_unverified_claims(token)["exp"]
+        assert service.get_unverified_expiry("refresh_opaque") is None
+
+
+class TestSelfContainedTokens:
+    """Test per i token self-contained (modalità stateless)"""
+
+    def test_seal_and_open_roundtrip(self):
+        """Verifica che i dati incapsulati vengano restituiti integri"""
+        service = TokenService()
+        token = service.seal_token("code", {"client_id": "test-client", "nonce": "n"}, ttl=60)
+
+        payload = service.open_token("code", token)
+        assert payload["client_id"] == "test-client"
+        assert payload["nonce"] == "n"
+        assert "jti" in payload and "exp" in payload
+
+    def test_token_of_other_kind_is_rejected(self):
+        """Verifica che un code non possa essere usato come refresh token"""
+        service = TokenService()
+        token = service.seal_token("code", {"client_id": "test-client"}, ttl=60)
+
+        with pytest.raises(ValueError):
+            service.open_token("refresh", token)
+
+    def test_tampered_token_is_rejected(self):
+        """Verifica che un token modificato venga rifiutato"""
+        service = TokenService()
+        token = service.seal_token("code", {"client_id": "test-client"}, ttl=60)
+        tampered = token[:-2] + ("A" if token[-2] != "A" else "B") + token[-1]
+
+        with pytest.raises(ValueError):
+            service.open_token("code", tampered)
+        with pytest.raises(ValueError):
+            service.open_token("code", "not-a-token")
+
+    def test_expired_token_is_rejected(self, monkeypatch):
+        """Verifica che un token scaduto venga rifiutato"""
+        service = TokenService()
+        token = service.seal_token("code", {}, ttl=60)
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 61)
+
+        with pytest.raises(ValueError):
+            service.open_token("code", token)
+
+    def test_instances_sharing_key_can_open_tokens(self, monkeypatch):
+        """Verifica che repliche con la stessa chiave possano riscattare i token delle altre"""
+        monkeypatch.setattr(settings, "stateless_token_key", "shared-secret")
+        issuer, other_replica = TokenService(), TokenService()
+        token = issuer.seal_token("refresh", {"scope": "openid"}, ttl=60)
+
+        assert other_replica.open_token("refresh", token)["scope"] == "openid"
+
+    def test_generate_codes_are_opaque_unless_stateless(self, monkeypatch):
+        """Verifica che i dati vengano incapsulati solo in modalità stateless"""
+        service = TokenService()
+        opaque = service.generate_authorization_code(data={"client_id": "c"})
+        monkeypatch.setattr(settings, "stateless_tokens", True)
+        sealed = service.generate_authorization_code(data={"client_id": "c"})
+
+        assert service.open_token("code", sealed)["client_id"] == "c"
+        assert len(sealed) > len(opaque)
+
+
+class TestSigningAlgorithms:
+    """Test per firma e verifica con gli algoritmi supportati"""
+
+    @pytest.mark.parametrize("algorithm", ["RS256", "PS256", "ES256", "EdDSA"])
+    def test_sign_and_decode(self, algorithm, sample_user_claims):
+        """Verifica che i token firmati con ogni algoritmo vengano validati da decode_token"""
+        service = TokenService()
+        service.jwks_service = JWKSService(algorithm=algorithm)
+        token = service.generate_id_token(sample_user_claims, "test-client", issuer="http://localhost")
+
+        assert jwt.get_unverified_header(token)["alg"] == algorithm
+        assert service.decode_token(token)["aud"] == "test-client"
+
+    def test_token_from_other_algorithm_is_rejected(self, sample_user_claims):
+        """Verifica che un token firmato con un altro algoritmo venga rifiutato"""
+        rs256 = TokenService()
+        es256 = TokenService()
+        es256.jwks_service = JWKSService(algorithm="ES256")
+        token = rs256.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+
+        with pytest.raises(ValueError):
+            es256.decode_token(token)
+
+    def test_eddsa_signature_matches_published_jwk(self, sample_user_claims):
+        """Verifica la firma EdDSA con la sola chiave pubblicata nel JWKS"""
+        service = TokenService()
+        service.jwks_service = JWKSService(algorithm="EdDSA")
+        token = service.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+
+        x = service.jwks_service.get_jwks()["keys"][0]["x"]
+        public_key = ed25519.Ed25519PublicKey.from_public_bytes(base64.urlsafe_b64decode(x + "=="))
+        signing_input, signature = token.rsplit(".", 1)
+        public_key.verify(base64.urlsafe_b64decode(signature + "=="), signing_input.encode())
+
+
+class TestKeyRotation:
+    """Test per la verifica dei token durante la rotazione delle chiavi"""
+
+    def test_token_signed_before_rotation_is_valid(self, sample_user_claims):
+        """Verifica che i token firmati con la chiave ritirata restino validi"""
+        service = TokenService()
+        service.jwks_service = JWKSService()
+        old_token = service.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+
+        service.jwks_service.rotate()
+        new_token = service.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+
+        assert jwt.get_unverified_header(new_token)["kid"] == service.jwks_service.get_kid()
+        assert jwt.get_unverified_header(old_token)["kid"] != service.jwks_service.get_kid()
+        assert service.decode_token(old_token)["sub"] == sample_user_claims["sub"]
+        assert service.decode_token(new_token)["sub"] == sample_user_claims["sub"]
+
+    def test_signer_uses_kid_of_active_key(self, sample_user_claims):
+        """Verifica che chiave e kid provengano dalla stessa chiave attiva anche a rotazione in corso"""
+        service = TokenService()
+        service.jwks_service = JWKSService()
+        old_kid = service.jwks_service.get_kid()
+        service.jwks_service.rotate()
+        # Simula un'attivazione non ancora completata: l'attributo kid è ancora quello precedente
+        service.jwks_service.kid = old_kid
+
+        token = service.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+
+        assert jwt.get_unverified_header(token)["kid"] == service.jwks_service.get_active_key().kid != old_kid
+        assert service.decode_token(token)["sub"] == sample_user_claims["sub"]
+
+    def test_unknown_kid_is_rejected(self, sample_user_claims):
+        """Verifica che un token con kid non pubblicato venga rifiutato"""
+        other = TokenService()
+        other.jwks_service = JWKSService()
+        other.jwks_service.rotate()
+        token = other.generate_access_token(sample_user_claims, "openid", issuer="http://localhost")
+
+        with pytest.raises(ValueError):
+            TokenService().decode_token(token)
+
+    def test_sealed_tokens_survive_rotation(self):
+        """Verifica che i token self-contained restino leggibili dopo la rotazione"""
+        service = TokenService()
+        service.jwks_service = JWKSService()
+        sealed = service.seal_token("code", {"value": 1}, ttl=60)
+
+        service.jwks_service.rotate()
+
+        assert service.open_token("code", sealed)["value"] == 1
+
+
+class TestTokenBatch:
+    """Test per l'emissione massiva dei token"""
+
+    def _users(self, count):
+        return [{"sub": f"sub-{i}", "email": f"user{i}@example.com"} for i in range(count)]
+
+    def test_sync_batch(self):
+        """Verifica che il batch sincrono restituisca token validi per ogni utente"""
+        service = TokenService()
+
+        entries = list(service.generate_token_batch(self._users(3), "client", issuer="http://localhost"))
+
+        assert [entry["sub"] for entry in entries] == ["sub-0", "sub-1", "sub-2"]
+        assert service.decode_token(entries[1]["access_token"])["sub"] == "sub-1"
+        assert service.decode_token(entries[2]["id_token"])["aud"] == "client"
+
+    def test_async_batch_preserves_order_across_chunks(self):
+        """Verifica che il batch parallelo mantenga l'ordine di input tra i blocchi"""
+        service = TokenService()
+
+        async def collect():
+            return [
+                entry
+                async for entry in service.generate_token_batch_async(
+                    iter(self._users(25)), "client", issuer="http://localhost", chunk_size=4
+                )
+            ]
+
+        entries = asyncio.run(collect())
+
+        assert [entry["sub"] for entry in entries] == [f"sub-{i}" for i in range(25)]
+        for i in (0, 13, 24):
+            assert service.decode_token(entries[i]["access_token"])["sub"] == f"sub-{i}"
+            assert service.decode_token(entries[i]["id_token"])["sub"] == f"sub-{i}"
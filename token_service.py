@@ -2,16 +2,30 @@
 Token Service - Gestione generazione e validazione JWT
 """
 
+import asyncio
 import base64
 import hashlib
+import json
+import os
 import secrets
 import time
-from typing import Dict, Optional
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from jose import JWTError, jwt
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
 
 from config import settings
-from jwks_service import jwks_service
+from crypto_executor import crypto_executor, sign_claims, sign_claims_batch, verify_token
+from jwks_service import SigningKey, jwks_service
+
+# Opzioni di validazione dei JWT (audience non verificata: mock server)
+DECODE_OPTIONS = {"verify_signature": True, "verify_aud": False, "verify_exp": True}
 
 
 class TokenService:
@@ -19,32 +33,150 @@ class TokenService:
 
     def __init__(self):
         self.jwks_service = jwks_service
+        # Chiave di firma già caricata e relativo kid (evita serializzazione/parsing PEM per ogni token)
+        # (chiave attiva di origine, (chiave, kid, PEM)) in un'unica tupla, sostituita atomicamente
+        self._signing_key: Optional[Tuple[SigningKey, Tuple[Key, str, str]]] = None
+        # Chiave AES-GCM per i token self-contained (codes e refresh token in modalità stateless)
+        self._sealing_key: Optional[AESGCM] = None
+        self._sealing_key_source = None
+
+    def _get_signing_key(self) -> Tuple[Key, str, str]:
+        """
+        Restituisce la chiave di firma pre-caricata, il suo kid e il PEM da cui è costruita
 
-    def generate_authorization_code(self, length: int = 32) -> str:
-        """Genera un authorization code casuale"""
-        return secrets.token_urlsafe(length)
+        La chiave viene costruita una sola volta a partire dalla SigningKey attiva del servizio JWKS
+        e ricostruita solo quando questa cambia (es. rotazione). Chiave e kid provengono dallo
+        stesso riferimento, così una rotazione concorrente non può abbinare il kid di una chiave
+        alla firma di un'altra.
+        """
+        active = self.jwks_service.get_active_key()
+        cached = self._signing_key
+        if cached is None or cached[0] is not active:
+            pem = active.private_key_pem()
+            cached = (active, (jwk.construct(pem, self.jwks_service.algorithm), active.kid, pem))
+            self._signing_key = cached
+        return cached[1]
+
+    def _sign(self, claims: Dict) -> str:
+        """Firma i claims con la chiave attiva pre-caricata"""
+        key, kid, _ = self._get_signing_key()
+        return jwt.encode(claims, key, algorithm=self.jwks_service.algorithm, headers={"kid": kid})
+
+    def _sign_many(self, claims_list: List[Dict]) -> List[str]:
+        """Firma una lista di claim set con la chiave attiva"""
+        return [self._sign(claims) for claims in claims_list]
+
+    async def _sign_many_async(self, claims_list: List[Dict]) -> List[str]:
+        """Firma una lista di claim set in un solo job del pool crittografico"""
+        if crypto_executor.mode == "process":
+            _, kid, pem = self._get_signing_key()
+            return await crypto_executor.run(
+                "sign_batch", sign_claims_batch, claims_list, pem, self.jwks_service.algorithm, kid
+            )
+        return await crypto_executor.run("sign_batch", self._sign_many, claims_list)
 
-    def generate_refresh_token(self, length: int = 32) -> str:
-        """Genera un refresh token casuale"""
-        return f"refresh_{secrets.token_urlsafe(length)}"
+    async def _sign_async(self, claims: Dict) -> str:
+        """Firma i claims nel pool crittografico, senza bloccare l'event loop"""
+        if crypto_executor.mode == "process":
+            # Nei processi worker la chiave va passata esplicitamente (viene costruita una volta per worker)
+            _, kid, pem = self._get_signing_key()
+            return await crypto_executor.run("sign", sign_claims, claims, pem, self.jwks_service.algorithm, kid)
+        return await crypto_executor.run("sign", self._sign, claims)
 
-    def generate_access_token(self, user_claims: Dict, scope: str, issuer: Optional[str] = None) -> str:
+    def _get_sealing_key(self) -> AESGCM:
         """
-        Genera un access token JWT
+        Restituisce la chiave AES-GCM per cifrare i token self-contained
+
+        Se STATELESS_TOKEN_KEY non è impostata, la chiave viene derivata (HKDF) dalla chiave
+        di firma iniziale: le repliche che condividono la chiave possono quindi riscattare i token
+        emessi dalle altre senza configurazione aggiuntiva, anche dopo una rotazione.
+        """
+        source = settings.stateless_token_key or self.jwks_service.get_secret_material()
+        if self._sealing_key is None or self._sealing_key_source is not source:
+            if settings.stateless_token_key:
+                key_material = settings.stateless_token_key.encode("utf-8")
+            else:
+                key_material = source
+            key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"mockoidc stateless tokens").derive(
+                key_material
+            )
+            self._sealing_key = AESGCM(key)
+            self._sealing_key_source = source
+        return self._sealing_key
+
+    def seal_token(self, kind: str, data: Dict, ttl: int) -> str:
+        """
+        Crea un token self-contained cifrato e autenticato (AES-256-GCM)
 
         Args:
-            user_claims: Claims dell'utente
-            scope: Scopes richiesti
-            issuer: Issuer del token (se None, usa settings.issuer)
+            kind: Tipo di token ("code" o "refresh"), legato al token come dato autenticato
+            data: Dati da incapsulare (serializzabili in JSON)
+            ttl: Validità in secondi
 
         Returns:
-            JWT firmato
+            Token base64url
+        """
+        payload = {**data, "jti": secrets.token_urlsafe(16), "exp": int(time.time()) + ttl}
+        nonce = os.urandom(12)
+        plaintext = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        sealed = nonce + self._get_sealing_key().encrypt(nonce, plaintext, kind.encode("utf-8"))
+        return base64.urlsafe_b64encode(sealed).rstrip(b"=").decode("ascii")
+
+    def open_token(self, kind: str, token: str) -> Dict:
+        """
+        Decifra e valida un token self-contained
+
+        Args:
+            kind: Tipo di token atteso
+            token: Token creato da seal_token
+
+        Returns:
+            Dati incapsulati (inclusi jti ed exp)
+
+        Raises:
+            ValueError: Se il token non è valido, è di un altro tipo o è scaduto
+        """
+        try:
+            sealed = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            plaintext = self._get_sealing_key().decrypt(sealed[:12], sealed[12:], kind.encode("utf-8"))
+        except (ValueError, InvalidTag) as e:
+            raise ValueError("Invalid token") from e
+
+        payload = json.loads(plaintext)
+        if payload["exp"] <= time.time():
+            raise ValueError("Token expired")
+        return payload
+
+    def generate_authorization_code(
+        self, length: int = 32, data: Optional[Dict] = None, ttl: Optional[int] = None
+    ) -> str:
+        """
+        Genera un authorization code
+
+        In modalità stateless, se vengono passati i dati associati, il code è un token
+        self-contained che li incapsula; altrimenti è una stringa casuale opaca.
         """
+        if settings.stateless_tokens and data is not None:
+            return self.seal_token("code", data, ttl or settings.authorization_code_expiry)
+        return secrets.token_urlsafe(length)
+
+    def generate_refresh_token(self, length: int = 32, data: Optional[Dict] = None, ttl: Optional[int] = None) -> str:
+        """
+        Genera un refresh token
+
+        In modalità stateless, se vengono passati i dati associati, il token è self-contained;
+        altrimenti è una stringa casuale opaca.
+        """
+        if settings.stateless_tokens and data is not None:
+            return f"refresh_{self.seal_token('refresh', data, ttl or settings.refresh_token_expiry)}"
+        return f"refresh_{secrets.token_urlsafe(length)}"
+
+    def _access_token_claims(self, user_claims: Dict, scope: str, issuer: Optional[str]) -> Dict:
+        """Costruisce i claims dell'access token"""
         now = int(time.time())
         exp = now + settings.access_token_expiry
 
-        # Costruisci i claims del token
-        claims = {
+        return {
             "iss": issuer or settings.issuer,
             "sub": user_claims.get("sub"),
             "aud": "api://default",
@@ -62,35 +194,68 @@ class TokenService:
             "groups": user_claims.get("groups", []),
         }
 
-        # Firma il token con la chiave privata
-        token = jwt.encode(
-            claims,
-            self.jwks_service.get_private_key_pem(),
-            algorithm="RS256",
-            headers={"kid": self.jwks_service.get_kid()},
-        )
+    def generate_access_token(self, user_claims: Dict, scope: str, issuer: Optional[str] = None) -> str:
+        """
+        Genera un access token JWT
 
-        return token
+        Args:
+            user_claims: Claims dell'utente
+            scope: Scopes richiesti
+            issuer: Issuer del token (se None, usa settings.issuer)
 
-    def generate_id_token(
-        self, user_claims: Dict, client_id: str, nonce: Optional[str] = None, issuer: Optional[str] = None
+        Returns:
+            JWT firmato
+        """
+        return self._sign(self._access_token_claims(user_claims, scope, issuer))
+
+    async def generate_access_token_async(self, user_claims: Dict, scope: str, issuer: Optional[str] = None) -> str:
+        """Come generate_access_token, ma firma nel pool crittografico (per gli endpoint async)"""
+        return await self._sign_async(self._access_token_claims(user_claims, scope, issuer))
+
+    def _client_token_claims(self, client_id: str, scope: str, audience: str, issuer: Optional[str]) -> Dict:
+        """Costruisce i claims dell'access token di un client (grant client_credentials, nessun utente)"""
+        # Letto ad ogni chiamata: la configurazione può essere ricaricata a caldo
+        from config import DYNAMIC_CLAIMS_CONFIG
+
+        now = int(time.time())
+
+        return {
+            "iss": issuer or settings.issuer,
+            "sub": client_id,
+            "aud": audience,
+            "iat": now,
+            "exp": now + settings.access_token_expiry,
+            "scope": scope,
+            "jti": secrets.token_urlsafe(16),
+            "azp": client_id,
+            # Azure AD compatible claims
+            "appid": client_id,
+            "tid": DYNAMIC_CLAIMS_CONFIG["default_tenant_id"],
+            "idtyp": "app",
+        }
+
+    async def generate_client_token_async(
+        self, client_id: str, scope: str, audience: str = "api://default", issuer: Optional[str] = None
     ) -> str:
         """
-        Genera un ID token JWT
+        Genera l'access token di un client (grant client_credentials), firmando nel pool crittografico
 
         Args:
-            user_claims: Claims dell'utente
-            client_id: Client ID dell'applicazione
-            nonce: Nonce opzionale
+            client_id: Client ID (diventa sub e azp del token)
+            scope: Scopes concessi
+            audience: Audience del token (API di destinazione)
             issuer: Issuer del token (se None, usa settings.issuer)
 
         Returns:
             JWT firmato
         """
+        return await self._sign_async(self._client_token_claims(client_id, scope, audience, issuer))
+
+    def _id_token_claims(self, user_claims: Dict, client_id: str, nonce: Optional[str], issuer: Optional[str]) -> Dict:
+        """Costruisce i claims dell'ID token"""
         now = int(time.time())
         exp = now + settings.id_token_expiry
 
-        # Costruisci i claims del token
         claims = {
             "iss": issuer or settings.issuer,
             "sub": user_claims.get("sub"),
@@ -114,15 +279,115 @@ class TokenService:
         if nonce:
             claims["nonce"] = nonce
 
-        # Firma il token con la chiave privata
-        token = jwt.encode(
-            claims,
-            self.jwks_service.get_private_key_pem(),
-            algorithm="RS256",
-            headers={"kid": self.jwks_service.get_kid()},
-        )
+        return claims
+
+    def generate_id_token(
+        self, user_claims: Dict, client_id: str, nonce: Optional[str] = None, issuer: Optional[str] = None
+    ) -> str:
+        """
+        Genera un ID token JWT
+
+        Args:
+            user_claims: Claims dell'utente
+            client_id: Client ID dell'applicazione
+            nonce: Nonce opzionale
+            issuer: Issuer del token (se None, usa settings.issuer)
+
+        Returns:
+            JWT firmato
+        """
+        return self._sign(self._id_token_claims(user_claims, client_id, nonce, issuer))
+
+    async def generate_id_token_async(
+        self, user_claims: Dict, client_id: str, nonce: Optional[str] = None, issuer: Optional[str] = None
+    ) -> str:
+        """Come generate_id_token, ma firma nel pool crittografico (per gli endpoint async)"""
+        return await self._sign_async(self._id_token_claims(user_claims, client_id, nonce, issuer))
+
+    def _batch_entry(self, user_claims: Dict, access_token: str, id_token: str) -> Dict:
+        """Costruisce il risultato dell'emissione batch per un utente"""
+        return {
+            "sub": user_claims.get("sub"),
+            "email": user_claims.get("email"),
+            "access_token": access_token,
+            "id_token": id_token,
+            "token_type": "Bearer",
+            "expires_in": settings.access_token_expiry,
+        }
+
+    def generate_token_batch(
+        self, users: Iterable[Dict], client_id: str, scope: str = "openid profile email", issuer: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """
+        Genera access e ID token per una sequenza di utenti (es. fixture per load test)
 
-        return token
+        Args:
+            users: Claims degli utenti (consumati in modo lazy)
+            client_id: Client ID (audience degli ID token)
+            scope: Scopes degli access token
+            issuer: Issuer dei token (se None, usa settings.issuer)
+
+        Returns:
+            Iteratore di dict con sub, email, access_token, id_token, token_type ed expires_in
+        """
+        for user_claims in users:
+            access_token = self._sign(self._access_token_claims(user_claims, scope, issuer))
+            id_token = self._sign(self._id_token_claims(user_claims, client_id, None, issuer))
+            yield self._batch_entry(user_claims, access_token, id_token)
+
+    async def generate_token_batch_async(
+        self,
+        users: Iterable[Dict],
+        client_id: str,
+        scope: str = "openid profile email",
+        issuer: Optional[str] = None,
+        chunk_size: int = 100,
+    ) -> AsyncIterator[Dict]:
+        """
+        Come generate_token_batch, ma firma a blocchi di chunk_size utenti in parallelo sul pool crittografico
+
+        I risultati vengono restituiti nell'ordine di input; al massimo un blocco per worker è in
+        lavorazione, così la memoria resta limitata anche per batch molto grandi.
+        """
+        max_in_flight = max(1, min(crypto_executor.max_workers, crypto_executor.max_pending))
+        in_flight: Deque[Tuple[List[Dict], asyncio.Future]] = deque()
+        users = iter(users)
+        try:
+            while True:
+                chunk = list(islice(users, chunk_size))
+                if chunk:
+                    claims_list = []
+                    for user_claims in chunk:
+                        claims_list.append(self._access_token_claims(user_claims, scope, issuer))
+                        claims_list.append(self._id_token_claims(user_claims, client_id, None, issuer))
+                    in_flight.append((chunk, asyncio.ensure_future(self._sign_many_async(claims_list))))
+                if not in_flight:
+                    break
+                if chunk and len(in_flight) < max_in_flight:
+                    continue
+
+                done_chunk, future = in_flight.popleft()
+                tokens = await future
+                for i, user_claims in enumerate(done_chunk):
+                    yield self._batch_entry(user_claims, tokens[2 * i], tokens[2 * i + 1])
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    def _token_kid(self, token: str) -> Optional[str]:
+        """
+        Restituisce il kid dall'header (non verificato) del token
+
+        Raises:
+            ValueError: Se l'header non è valido o il kid non è una stringa
+        """
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError as e:
+            raise ValueError(f"Invalid token: {str(e)}") from e
+        if kid is not None and not isinstance(kid, str):
+            raise ValueError("Invalid token: malformed key id")
+        return kid
 
     def decode_token(self, token: str) -> Dict:
         """
@@ -135,24 +400,62 @@ class TokenService:
             Claims del token
 
         Raises:
-            JWTError: Se il token non è valido
+            ValueError: Se il token non è valido o firmato con una chiave non pubblicata
         """
+        # La chiave di verifica viene selezionata per kid (più chiavi valide durante la rotazione)
+        kid = self._token_kid(token)
         try:
+            verification_key = self.jwks_service.get_verification_key(kid)
+            if verification_key is None:
+                raise ValueError(f"Invalid token: unknown key id {kid}")
+
             # Decodifica senza verifica audience (per mock server)
             claims = jwt.decode(
-                token,
-                self.jwks_service.get_public_key_pem(),
-                algorithms=["RS256"],
-                options={
-                    "verify_signature": True,
-                    "verify_aud": False,  # Non verifica audience in mock
-                    "verify_exp": True,
-                },
+                token, verification_key, algorithms=[self.jwks_service.algorithm], options=DECODE_OPTIONS
             )
             return claims
         except JWTError as e:
             raise ValueError(f"Invalid token: {str(e)}") from e
 
+    async def decode_token_async(self, token: str) -> Dict:
+        """
+        Come decode_token, ma verifica la firma nel pool crittografico (per gli endpoint async)
+
+        Raises:
+            ValueError: Se il token non è valido o firmato con una chiave non pubblicata
+        """
+        if crypto_executor.mode != "process":
+            return await crypto_executor.run("verify", self.decode_token, token)
+
+        kid = self._token_kid(token)
+        public_key_pem = self.jwks_service.get_public_key_pem(kid)
+        if public_key_pem is None:
+            raise ValueError(f"Invalid token: unknown key id {kid}")
+        return await crypto_executor.run(
+            "verify", verify_token, token, public_key_pem, self.jwks_service.algorithm, DECODE_OPTIONS
+        )
+
+    def hash_token(self, token: str) -> str:
+        """
+        Restituisce un identificativo compatto del token (SHA-256 esadecimale)
+
+        Usato come chiave negli store al posto del token completo (JWT da alcuni KB).
+        """
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get_unverified_expiry(self, token: str) -> Optional[int]:
+        """
+        Restituisce il claim exp di un JWT senza verificarne la firma
+
+        Returns:
+            Timestamp di scadenza, o None se il token non è un JWT o non ha exp
+        """
+        try:
+            exp = jwt.get_unverified_claims(token).get("exp")
+        except JWTError:
+            return None
+        return exp if isinstance(exp, int) else None
+
     def validate_pkce(self, code_verifier: str, code_challenge: str, code_challenge_method: str) -> bool:
         """
         Valida PKCE (Proof Key for Code Exchange)